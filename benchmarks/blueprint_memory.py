@@ -0,0 +1,71 @@
+"""
+Benchmark for the memory held by registered app blueprints.
+
+Registers chains of Software apps that look like a typical per-sample pipeline step (a shared
+executable, a few repeated flags, one input and one output file), then reports the bytes
+still allocated per registered app once registration is done. The same apps are registered twice: once with the slotted
+blueprints Software.register() keeps, and once keeping the plain dicts Software.prep() returns,
+which is how every blueprint used to be stored.
+
+Usage:
+    python benchmarks/blueprint_memory.py [--apps 100000]
+"""
+import gc
+import argparse
+import tracemalloc
+
+from operon.components import Software, Data, Parameter, Redirect, ParslPipeline, _CaptureDirectory
+from operon._util.apps import _ParslAppBlueprint
+from operon._util.data import _DataRegistry
+
+
+def app_data(num_apps):
+    return [Data('/data/sample_{}/reads_{}.fastq.gz'.format(app_i // 10, app_i)) for app_i in range(-1, num_apps)]
+
+
+def register_apps(data, as_dicts):
+    aligner = Software('aligner', '/opt/tools/bin/aligner', subprogram='mem')
+    for app_i in range(len(data) - 1):
+        app_args = (
+            Parameter('-t', '8'),
+            Parameter('-R', '@RG\\tID:group\\tSM:sample'),
+            Parameter('-i', data[app_i].as_input()),
+            Parameter('-o', data[app_i + 1].as_output()),
+            Redirect(stream=Redirect.STDERR, dest='/data/sample_{}/aligner_{}.log'.format(app_i // 10, app_i))
+        )
+        if as_dicts:
+            blueprint = aligner.prep(*app_args)
+            _ParslAppBlueprint._blueprints[blueprint['id']] = blueprint
+        else:
+            aligner.register(*app_args)
+
+
+def bytes_per_app(num_apps, as_dicts):
+    # Data objects are created up front so only what registration itself keeps is measured
+    _ParslAppBlueprint._blueprints = dict()
+    Data._data = _DataRegistry()
+    data = app_data(num_apps)
+    gc.collect()
+    tracemalloc.start()
+    register_apps(data, as_dicts)
+    gc.collect()
+    allocated, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return allocated / num_apps
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark memory held by app blueprints')
+    parser.add_argument('--apps', type=int, default=100000, help='Number of apps to register')
+    args = parser.parse_args()
+
+    ParslPipeline._pipeline_run_temp_dir = _CaptureDirectory('/tmp/run__operon')
+    dict_bytes = bytes_per_app(args.apps, as_dicts=True)
+    slotted_bytes = bytes_per_app(args.apps, as_dicts=False)
+
+    print('{:>10} {:>14} {:>14}'.format('apps', 'dict_B/app', 'slotted_B/app'))
+    print('{:>10} {:>14.0f} {:>14.0f}'.format(args.apps, dict_bytes, slotted_bytes))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""
+Benchmark for app registration in ParslPipeline._register_apps.
+
+Builds chains of apps of increasing length (the worst case for the old recursive
+registration) plus a fan-out of independent chains, then times graph assembly and
+registration separately. Apps are not handed to Parsl; submission is replaced with
+a function that returns a lightweight stand-in for an AppFuture, so only Operon's own
+overhead is measured. Time per app should stay flat as the number of apps grows.
+
+Usage:
+    python benchmarks/register_workflow.py [--sizes 1000 10000 100000 500000] [--width 1]
+"""
+import time
+import argparse
+from collections import namedtuple
+
+from operon.components import ParslPipeline
+
+SubmittedApp = namedtuple('SubmittedApp', 'tid outputs')
+SubmittedData = namedtuple('SubmittedData', 'filename')
+
+
+def chain_blueprints(num_apps, width):
+    """
+    Generates blueprints for ``width`` independent chains totalling ``num_apps`` apps, where
+    each app consumes the output of the one before it and also waits on it explicitly.
+    """
+    for app_i in range(num_apps):
+        chain, link = app_i % width, app_i // width
+        yield {
+            'id': 'step_{}'.format(app_i),
+            'type': 'bash',
+            'name': 'step',
+            'cmd': 'step',
+            'success_on': ['0'],
+            'meta': dict(),
+            'inputs': ['{}_{}.out'.format(chain, link - 1)] if link else list(),
+            'outputs': ['{}_{}.out'.format(chain, link)],
+            'wait_on': ['step_{}'.format(app_i - width)] if link else list(),
+            'stdout': None,
+            'stderr': None
+        }
+
+
+def submit_app(blueprint, inputs):
+    return SubmittedApp(blueprint['id'], [SubmittedData(o) for o in blueprint['outputs']])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark workflow registration')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000, 500000],
+                        help='Number of apps in each benchmarked graph')
+    parser.add_argument('--width', type=int, default=1, help='Number of independent chains per graph')
+    args = parser.parse_args()
+
+    print('{:>10} {:>12} {:>12} {:>14}'.format('apps', 'assemble_s', 'register_s', 'register_us/app'))
+    for num_apps in args.sizes:
+        assemble_start = time.perf_counter()
+        workflow_graph = ParslPipeline._assemble_graph(chain_blueprints(num_apps, args.width))
+        assemble_end = time.perf_counter()
+        app_futures, _ = ParslPipeline._register_apps(workflow_graph, submit_app)
+        register_end = time.perf_counter()
+        assert len(app_futures) == num_apps
+
+        print('{:>10} {:>12.3f} {:>12.3f} {:>14.2f}'.format(
+            num_apps,
+            assemble_end - assemble_start,
+            register_end - assemble_end,
+            (register_end - assemble_end) / num_apps * 1e6
+        ))
+
+
+if __name__ == '__main__':
+    main()
@@ -65,7 +65,9 @@ class BaseSubcommand(object):
                     'Try the form:\n\n'
                     '\tclass Pipeline(ParslPipeline):\n'
                 )
-            return pipeline_class()
+            pipeline_instance = pipeline_class()
+            pipeline_instance._pipeline_name = os.path.splitext(os.path.basename(pipeline_name))[0]
+            return pipeline_instance
         except AttributeError:
             # Ensure the pipeline file contains a class called Pipeline
             raise MalformedPipelineError(
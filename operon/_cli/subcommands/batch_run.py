@@ -11,6 +11,16 @@ EXIT_CMD_SUCCESS = 0
 EXIT_CMD_SYNTAX_ERROR = 2
 
 
+def positive_int(value):
+    try:
+        number = int(value)
+    except ValueError:
+        number = 0
+    if number < 1:
+        raise argparse.ArgumentTypeError('must be a whole number of at least 1, got {}'.format(value))
+    return number
+
+
 def usage():
     return 'operon batch-run <pipeline-name> [-h] --input-matrix <input_matrix> [--separate-pools]'
 
@@ -51,6 +61,68 @@ class Subcommand(BaseSubcommand):
             #                                         'pool of resources, essentially like calling a separate Operon '
             #                                         'instance for each sample or unit.'))
             run_args_parser.add_argument('--run-name', default='run', help='Name of this run for the log file')
+            run_args_parser.add_argument('--max-inflight-samples', type=positive_int, metavar='N',
+                                         help=('If provided, the input matrix is read one row at a time and a sample '
+                                               'is only built and submitted once fewer than N samples are running, '
+                                               'bounding memory use and contention however many rows there are.'))
+            run_args_parser.add_argument('--build-workers', type=int, default=1,
+                                         help=('Number of processes to build the workflow of each sample with; by '
+                                               'default samples are built one after another. pipeline() must not '
+                                               'rely on state from earlier samples when this is more than 1.'))
+            run_args_parser.add_argument('--incremental', action='store_true',
+                                         help=('If provided, apps whose outputs all exist and are newer than their '
+                                               'inputs are skipped instead of being run again.'))
+            run_args_parser.add_argument('--cache', action='store_true',
+                                         help=('If provided, outputs of apps are restored from a result cache shared '
+                                               'across runs when the same command has already run on identical inputs, '
+                                               'and newly produced outputs are added to it.'))
+            run_args_parser.add_argument('--cache-dir', help='Location of the result cache, defaults to the Operon home')
+            run_args_parser.add_argument('--cache-max-size', default='100G',
+                                         help='Least recently used cache entries are evicted beyond this size')
+            run_args_parser.add_argument('--checkpoint', action='store_true',
+                                         help=('If provided, Parsl checkpoints completed apps next to the logs, and a '
+                                               'run started again with the same --logs-dir and --run-name only '
+                                               'executes the apps that did not finish.'))
+            run_args_parser.add_argument('--checkpoint-mode', default='task_exit',
+                                         choices=['task_exit', 'periodic', 'dfk_exit'],
+                                         help='When Parsl writes checkpoints, if --checkpoint is given')
+            run_args_parser.add_argument('--captured-head', default='1M',
+                                         help='How much of the start of each app\'s captured stdout and stderr to log')
+            run_args_parser.add_argument('--captured-tail', default='1M',
+                                         help=('How much of the end of each app\'s captured stdout and stderr to log; '
+                                               'streams longer than head and tail combined are kept in full next to the logs'))
+            run_args_parser.add_argument('--auto-size', action='store_true',
+                                         help=('If provided, thread counts and provider blocks of the Parsl config are '
+                                               'set to how many apps of the workflow can ever run at once.'))
+            run_args_parser.add_argument('--fuse-chains', action='store_true',
+                                         help=('If provided, chains of bash apps that can only run one after another '
+                                               'are each run as a single Parsl task.'))
+            run_args_parser.add_argument('--pack-siblings', type=int, metavar='K',
+                                         help=('Run up to K bash apps that depend on exactly the same apps as a single '
+                                               'Parsl task, for workflows with many very short apps'))
+            run_args_parser.add_argument('--pack-slots', type=int, default=1,
+                                         help='How many apps of a task packed by --pack-siblings run at once')
+            run_args_parser.add_argument('--dry-run', action='store_true',
+                                         help=('If provided, the workflow is built and its size, shape, and build time are '
+                                               'printed, without running anything.'))
+            run_args_parser.add_argument('--graphml', action='store_true',
+                                         help=('If provided, the workflow graph written next to the logs is also written '
+                                               'as GraphML, alongside JSON.'))
+            run_args_parser.add_argument('--prometheus-port', type=int, metavar='PORT',
+                                         help='Serve run metrics for Prometheus at http://127.0.0.1:PORT/metrics during the run')
+            run_args_parser.add_argument('--prometheus-textfile', metavar='PATH',
+                                         help=('Write run metrics for the Prometheus node_exporter textfile collector to PATH, '
+                                               'which should end in .prom, every 15 seconds during the run'))
+            run_args_parser.add_argument('--status-interval', type=float, default=10, metavar='SECONDS',
+                                         help=('How often <run-name>.status.json in the logs directory is rewritten with the progress '
+                                               'of the run, see operon status'))
+            run_args_parser.add_argument('--app-metrics', action='store_true',
+                                         help=('Measure the timing and resource use of every app into '
+                                               '<run-name>.metrics.jsonl in the logs directory, and keep durations in '
+                                               'the run history'))
+            run_args_parser.add_argument('--trace', action='store_true',
+                                         help=('Write the timeline of the run to <run-name>.trace.json in the logs '
+                                               'directory, to load in chrome://tracing or Perfetto'))
             run_args_parser.add_argument('-h', '--help', action='store_true', default=argparse.SUPPRESS,
                                          help='Show help message for run args and pipeline args.')
 
@@ -60,7 +132,6 @@ class Subcommand(BaseSubcommand):
             # Create a parser for the pipeline args
             pipeline_args_parser = argparse.ArgumentParser(add_help=False)
             pipeline_instance.arguments(pipeline_args_parser)
-            batch_pipeline_args = list()
 
             # If -h given to run args, print help message from run and pipeline args and quit
             if run_args.get('help'):
@@ -76,53 +147,62 @@ class Subcommand(BaseSubcommand):
                 sys.stderr.write('\nerror: the following arguments are required: --input-matrix\n')
                 sys.exit()
 
-            # Parse the input matrix
-            with open(run_args['input_matrix']) as input_matrix:
-                if not run_args['literal_input']:
-                    headers = next(input_matrix).strip().split('\t')
-                    # For each run in this batch run
-                    for line in input_matrix:
-                        positionals, optionals = list(), list()
-                        record = line.strip().split('\t')
-
-                        # For each argument in this run add to either optional or positional
-                        for i, record_item in enumerate(record):
-                            record_header = headers[i]
-                            if record_header.startswith('positional_'):
-                                positionals.append((int(record_header.split('_')[-1]), record_item))
-                            else:
-                                # Determine whether this is a singleton argument
-                                if record_item.strip().lower() == 'true':
-                                    # Include singleton
-                                    optionals.append(record_header)
-                                elif record_item.strip().lower() in {'#true', '#false'}:
-                                    # Include optional with literal 'true' or 'false' value
-                                    optionals.extend([record_header, record_item.strip().strip('#')])
-                                elif record_item.strip().lower() != 'false':
-                                    # Include normal optional
-                                    optionals.extend([record_header] + record_item.split())
-                                # Note: If value is 'false' then none of these will match, so the optional
-                                #       won't be included
-
-                        # Put positional arguments into positional order
-                        positionals = [p[1] for p in sorted(positionals, key=lambda r: r[0])]
-
-                        # Parse arguments with pipeline parser
-                        pipeline_args = vars(pipeline_args_parser.parse_args(optionals + positionals))
-                        if 'logs_dir' not in pipeline_args:
-                            pipeline_args['logs_dir'] = run_args['logs_dir']
-
-                        # Add this run to the batch run
-                        batch_pipeline_args.append(pipeline_args)
-                else:
-                    for literal_line in input_matrix:
-                        # Parse arguments with pipeline parser
-                        pipeline_args = vars(pipeline_args_parser.parse_args(literal_line.strip().split()))
-                        if 'logs_dir' not in pipeline_args:
-                            pipeline_args['logs_dir'] = run_args['logs_dir']
-
-                        # Add this run to the batch run
-                        batch_pipeline_args.append(pipeline_args)
+            # Parse the input matrix; a streaming run reads it only as samples are admitted
+            def read_input_matrix():
+                """
+                Parses the input matrix one row at a time, yielding the pipeline args of each run
+                """
+                with open(run_args['input_matrix']) as input_matrix:
+                    if not run_args['literal_input']:
+                        headers = next(input_matrix).strip().split('\t')
+                        # For each run in this batch run
+                        for line in input_matrix:
+                            positionals, optionals = list(), list()
+                            record = line.strip().split('\t')
+
+                            # For each argument in this run add to either optional or positional
+                            for i, record_item in enumerate(record):
+                                record_header = headers[i]
+                                if record_header.startswith('positional_'):
+                                    positionals.append((int(record_header.split('_')[-1]), record_item))
+                                else:
+                                    # Determine whether this is a singleton argument
+                                    if record_item.strip().lower() == 'true':
+                                        # Include singleton
+                                        optionals.append(record_header)
+                                    elif record_item.strip().lower() in {'#true', '#false'}:
+                                        # Include optional with literal 'true' or 'false' value
+                                        optionals.extend([record_header, record_item.strip().strip('#')])
+                                    elif record_item.strip().lower() != 'false':
+                                        # Include normal optional
+                                        optionals.extend([record_header] + record_item.split())
+                                    # Note: If value is 'false' then none of these will match, so the optional
+                                    #       won't be included
+
+                            # Put positional arguments into positional order
+                            positionals = [p[1] for p in sorted(positionals, key=lambda r: r[0])]
+
+                            # Parse arguments with pipeline parser
+                            pipeline_args = vars(pipeline_args_parser.parse_args(optionals + positionals))
+                            if 'logs_dir' not in pipeline_args:
+                                pipeline_args['logs_dir'] = run_args['logs_dir']
+
+                            # Add this run to the batch run
+                            yield pipeline_args
+                    else:
+                        for literal_line in input_matrix:
+                            # Parse arguments with pipeline parser
+                            pipeline_args = vars(pipeline_args_parser.parse_args(literal_line.strip().split()))
+                            if 'logs_dir' not in pipeline_args:
+                                pipeline_args['logs_dir'] = run_args['logs_dir']
+
+                            # Add this run to the batch run
+                            yield pipeline_args
+
+            if run_args['max_inflight_samples']:
+                batch_pipeline_args = read_input_matrix()
+            else:
+                batch_pipeline_args = list(read_input_matrix())
 
             # Run the pipeline in batch
             pipeline_instance._run(
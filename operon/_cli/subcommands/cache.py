@@ -0,0 +1,62 @@
+import sys
+import argparse
+from datetime import datetime
+
+from operon._cli.subcommands import BaseSubcommand
+from operon._util.cache import ResultCache, parse_size, format_size
+
+EXIT_CMD_SYNTAX_ERROR = 2
+
+
+def usage():
+    return 'operon cache [info | list | prune --max-size SIZE | clear] [--cache-dir DIR] [-h]'
+
+
+class Subcommand(BaseSubcommand):
+    def help_text(self):
+        return 'Inspect and prune the result cache shared across runs.'
+
+    def run(self, subcommand_args):
+        parser = argparse.ArgumentParser(prog='operon cache', usage=usage(), description=self.help_text())
+        parser.add_argument('action', nargs='?', default='info', choices=['info', 'list', 'prune', 'clear'],
+                            help='What to do with the cache; defaults to info.')
+        parser.add_argument('--max-size', help='For prune, the size to shrink the cache down to, ex. 50G')
+        parser.add_argument('--cache-dir', help='Location of the result cache, defaults to the Operon home')
+        args = vars(parser.parse_args(subcommand_args))
+
+        result_cache = ResultCache(cache_dir=args['cache_dir'])
+        cache_entries = result_cache.entries()
+
+        if args['action'] == 'info':
+            sys.stdout.write('Result cache at {}\n'.format(result_cache.cache_dir))
+            sys.stdout.write('Entries: {}\n'.format(len(cache_entries)))
+            sys.stdout.write('Total size: {}\n'.format(
+                format_size(sum(manifest.get('size', 0) for _, manifest, _ in cache_entries))
+            ))
+        elif args['action'] == 'list':
+            # Most recently used entries first
+            for cache_key, manifest, last_used in reversed(cache_entries):
+                sys.stdout.write('{key}  {size:>8}  last used {last_used}\n'.format(
+                    key=cache_key[:16],
+                    size=format_size(manifest.get('size', 0)),
+                    last_used=datetime.fromtimestamp(last_used).strftime('%d%b%Y %H:%M:%S')
+                ))
+                for output_data in manifest.get('outputs', list()):
+                    sys.stdout.write('\t{}\n'.format(output_data))
+        elif args['action'] == 'prune':
+            if not args['max_size']:
+                parser.print_help()
+                sys.stderr.write('\nerror: prune requires --max-size\n')
+                sys.exit(EXIT_CMD_SYNTAX_ERROR)
+            try:
+                max_size = parse_size(args['max_size'])
+            except ValueError as e:
+                parser.print_usage()
+                sys.stderr.write('error: {}\n'.format(e))
+                sys.exit(EXIT_CMD_SYNTAX_ERROR)
+            num_removed, bytes_freed = result_cache.evict(max_size)
+            sys.stdout.write('Removed {} entries, freed {}\n'.format(num_removed, format_size(bytes_freed)))
+        elif args['action'] == 'clear':
+            for cache_key, _, _ in cache_entries:
+                result_cache.remove(cache_key)
+            sys.stdout.write('Removed {} entries\n'.format(len(cache_entries)))
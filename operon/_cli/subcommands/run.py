@@ -40,6 +40,60 @@ class Subcommand(BaseSubcommand):
                                               help='Path to a JSON file containing a Parsl config')
             pipeline_args_parser.add_argument('--logs-dir', default='.', help='Path to a directory to store log files')
             pipeline_args_parser.add_argument('--run-name', default='run', help='Name of this run for the log file')
+            pipeline_args_parser.add_argument('--incremental', action='store_true',
+                                              help=('If provided, apps whose outputs all exist and are newer than their '
+                                                    'inputs are skipped instead of being run again.'))
+            pipeline_args_parser.add_argument('--cache', action='store_true',
+                                              help=('If provided, outputs of apps are restored from a result cache shared '
+                                                    'across runs when the same command has already run on identical inputs, '
+                                                    'and newly produced outputs are added to it.'))
+            pipeline_args_parser.add_argument('--cache-dir', help='Location of the result cache, defaults to the Operon home')
+            pipeline_args_parser.add_argument('--cache-max-size', default='100G',
+                                              help='Least recently used cache entries are evicted beyond this size')
+            pipeline_args_parser.add_argument('--checkpoint', action='store_true',
+                                              help=('If provided, Parsl checkpoints completed apps next to the logs, and a '
+                                                    'run started again with the same --logs-dir and --run-name only '
+                                                    'executes the apps that did not finish.'))
+            pipeline_args_parser.add_argument('--checkpoint-mode', default='task_exit',
+                                              choices=['task_exit', 'periodic', 'dfk_exit'],
+                                              help='When Parsl writes checkpoints, if --checkpoint is given')
+            pipeline_args_parser.add_argument('--captured-head', default='1M',
+                                              help='How much of the start of each app\'s captured stdout and stderr to log')
+            pipeline_args_parser.add_argument('--captured-tail', default='1M',
+                                              help=('How much of the end of each app\'s captured stdout and stderr to log; '
+                                                    'streams longer than head and tail combined are kept in full next to the logs'))
+            pipeline_args_parser.add_argument('--auto-size', action='store_true',
+                                              help=('If provided, thread counts and provider blocks of the Parsl config are '
+                                                    'set to how many apps of the workflow can ever run at once.'))
+            pipeline_args_parser.add_argument('--fuse-chains', action='store_true',
+                                              help=('If provided, chains of bash apps that can only run one after another '
+                                                    'are each run as a single Parsl task.'))
+            pipeline_args_parser.add_argument('--pack-siblings', type=int, metavar='K',
+                                              help=('Run up to K bash apps that depend on exactly the same apps as a single '
+                                                    'Parsl task, for workflows with many very short apps'))
+            pipeline_args_parser.add_argument('--pack-slots', type=int, default=1,
+                                              help='How many apps of a task packed by --pack-siblings run at once')
+            pipeline_args_parser.add_argument('--dry-run', action='store_true',
+                                              help=('If provided, the workflow is built and its size, shape, and build time are '
+                                                    'printed, without running anything.'))
+            pipeline_args_parser.add_argument('--graphml', action='store_true',
+                                              help=('If provided, the workflow graph written next to the logs is also written '
+                                                    'as GraphML, alongside JSON.'))
+            pipeline_args_parser.add_argument('--prometheus-port', type=int, metavar='PORT',
+                                              help='Serve run metrics for Prometheus at http://127.0.0.1:PORT/metrics during the run')
+            pipeline_args_parser.add_argument('--prometheus-textfile', metavar='PATH',
+                                              help=('Write run metrics for the Prometheus node_exporter textfile collector to PATH, '
+                                                    'which should end in .prom, every 15 seconds during the run'))
+            pipeline_args_parser.add_argument('--status-interval', type=float, default=10, metavar='SECONDS',
+                                              help=('How often <run-name>.status.json in the logs directory is rewritten with the progress '
+                                                    'of the run, see operon status'))
+            pipeline_args_parser.add_argument('--app-metrics', action='store_true',
+                                              help=('Measure the timing and resource use of every app into '
+                                                    '<run-name>.metrics.jsonl in the logs directory, and keep durations in '
+                                                    'the run history'))
+            pipeline_args_parser.add_argument('--trace', action='store_true',
+                                              help=('Write the timeline of the run to <run-name>.trace.json in the logs '
+                                                    'directory, to load in chrome://tracing or Perfetto'))
 
             # Get custom arguments from the Pipeline
             pipeline_instance.arguments(pipeline_args_parser)
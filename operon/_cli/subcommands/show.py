@@ -6,6 +6,8 @@ import json
 from operon._cli.subcommands import BaseSubcommand
 from operon.meta import _MetaExecutorDynamic
 from operon._util.home import file_appears_installed
+from operon._util.history import RunHistory
+from operon._util.scheduling import format_duration
 
 ARGV_PIPELINE_NAME = 0
 EXIT_CMD_SUCCESS = 0
@@ -96,6 +98,17 @@ class Subcommand(BaseSubcommand):
         pipeline logic and will hold true at runtime.
         """
 
+        # Show how long each step is expected to take, from earlier runs of the pipeline
+        step_models = RunHistory(pipeline_instance._pipeline_name).models()
+        if step_models:
+            sys.stdout.write('\nExpected Runtimes:\n')
+            for step, model in sorted(step_models.items()):
+                per_gb = (', {:.1f}s more per GB of input'.format(model.slope * 1024 ** 3)
+                          if model.slope is not None else '')
+                sys.stdout.write('{}: {} typically{} ({} runs)\n'.format(
+                    step, format_duration(model.typical), per_gb, model.runs
+                ))
+
         # Show current platform configuration, if it exists
         config_json_filepath = os.path.join(self.home_configs, '{}.json'.format(pipeline_name))
         if os.path.isfile(config_json_filepath):
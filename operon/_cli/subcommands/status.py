@@ -0,0 +1,79 @@
+import os
+import sys
+import glob
+import time
+import argparse
+from datetime import datetime
+
+from operon._cli.subcommands import BaseSubcommand
+from operon._util.scheduling import format_duration
+from operon._util.status import STATUS_SUFFIX, read_status, status_path
+
+EXIT_CMD_ERROR = 1
+
+# A status not rewritten for this many of its intervals is from a run that may have stopped
+STALE_INTERVALS = 3
+
+
+def usage():
+    return 'operon status <logs-dir> [--run-name NAME] [-h]'
+
+
+def render_status(run_name, status, now=None):
+    """
+    :param run_name: str Name of the run
+    :param status: dict Status snapshot, see StatusWriter
+    :param now: float Seconds since the epoch to show the status as of
+    :return: str Status for a person to read
+    """
+    now = time.time() if now is None else now
+    apps = status['apps']
+    lines = ['Run {} on {}, pid {}'.format(run_name, status['host'], status['pid'])]
+    lines.append('Started {}, {} ago; status updated {} ago'.format(
+        datetime.fromtimestamp(status['started']).strftime('%d%b%Y %H:%M:%S'),
+        format_duration(now - status['started']),
+        format_duration(now - status['updated'])
+    ))
+    if status['finished']:
+        lines.append('Run is over')
+    elif now - status['updated'] > status['interval'] * STALE_INTERVALS:
+        lines.append('Status has not been updated in a while, the run may have stopped')
+    lines.append('Apps: {} pending, {} running, {} completed, {} failed'.format(
+        apps['pending'], apps['running'], apps['completed'], apps['failed']
+    ))
+    if status['apps_per_minute'] is not None:
+        lines.append('Throughput: {} apps per minute{}'.format(
+            status['apps_per_minute'],
+            ', about {} left'.format(format_duration(status['remaining']))
+            if status['remaining'] and not status['finished'] else ''
+        ))
+    if status['running']:
+        lines.append('Running longest:' if len(status['running']) < apps['running'] else 'Running:')
+        for running_app in status['running']:
+            lines.append('\t{}  {}'.format(running_app['app'], format_duration(running_app['elapsed'])))
+    return '\n'.join(lines) + '\n'
+
+
+class Subcommand(BaseSubcommand):
+    def help_text(self):
+        return 'Show the progress of runs writing their logs to a directory.'
+
+    def run(self, subcommand_args):
+        parser = argparse.ArgumentParser(prog='operon status', usage=usage(), description=self.help_text())
+        parser.add_argument('logs-dir', help='Logs directory of the run, as given to --logs-dir.')
+        parser.add_argument('--run-name', help='Only show the run of this name, as given to --run-name.')
+        args = vars(parser.parse_args(subcommand_args))
+        logs_dir = args['logs-dir']
+
+        if args['run_name']:
+            status_paths = [status_path(logs_dir, args['run_name'])]
+        else:
+            status_paths = sorted(glob.glob(status_path(logs_dir, '*')))
+        status_paths = [path for path in status_paths if os.path.isfile(path)]
+        if not status_paths:
+            sys.stderr.write('No run status found in {}\n'.format(logs_dir))
+            sys.exit(EXIT_CMD_ERROR)
+
+        for i, path in enumerate(status_paths):
+            run_name = os.path.basename(path)[:-len(STATUS_SUFFIX)]
+            sys.stdout.write('{}{}'.format('\n' if i else '', render_status(run_name, read_status(path))))
@@ -1,3 +1,7 @@
+import os
+from concurrent.futures import Future
+
+
 class _DeferredApp(object):
     def __init__(self, app_id):
         self.app_id = app_id
@@ -6,6 +10,20 @@ class _DeferredApp(object):
         return self.app_id
 
 
+class _CompletedFuture(Future):
+    """
+    Stands in for the future of an app, or of one of its outputs, when the app is not
+    submitted to Parsl because its outputs are already up to date. It is resolved as soon
+    as it's created, so anything depending on it can start right away.
+    """
+    def __init__(self, result=None, filename=None, outputs=None):
+        super().__init__()
+        self.tid = None
+        self.filename = filename
+        self.outputs = outputs or list()
+        self.set_result(result)
+
+
 class _ParslAppBlueprint(object):
     _id_counter = 0
     _blueprints = dict()
@@ -14,4 +32,95 @@ class _ParslAppBlueprint(object):
     @classmethod
     def get_id(cls):
         cls._id_counter += 1
-        return cls._id_counter
\ No newline at end of file
+        return cls._id_counter
+
+
+def _renumber_app_id(app_id, offset):
+    prefix, _, number = app_id.rpartition('_')
+    return '{}_{}'.format(prefix, int(number) + offset)
+
+
+class _AppBlueprint(object):
+    """
+    Everything needed to submit one registered app, kept for the whole run.
+
+    With millions of apps per batch, blueprints are the largest part of the memory Operon itself
+    uses, so fields are held in slots rather than a dict. The command is kept as a tuple of
+    fragments, so the executable and any flags repeated across apps (which Software interns) are
+    stored once rather than in every command string. Inputs, outputs, and wait_on stay lists, as
+    they are in the dicts .prep() returns.
+
+    Fields are read and written with the same item access as the dicts blueprints used to be,
+    ex. ``blueprint['cmd']``; reading a field a blueprint doesn't have raises KeyError.
+
+    A fused blueprint runs several bash apps as one task, and keeps their blueprints in members;
+    slots is how many of them run at once, or None if they're a chain run one after another.
+    """
+    __slots__ = ('id', 'type', 'name', 'step', 'cmd_fragments', 'success_on', 'meta', 'inputs', 'outputs', 'wait_on',
+                 'stdout', 'stderr', 'func', 'args', 'kwargs', 'members', 'slots')
+    _FIELDS = {
+        'bash': ('id', 'type', 'name', 'step', 'cmd', 'success_on', 'meta', 'inputs', 'outputs', 'wait_on',
+                 'stdout', 'stderr'),
+        'python': ('id', 'type', 'func', 'args', 'kwargs', 'inputs', 'outputs', 'wait_on',
+                   'stdout', 'stderr', 'meta'),
+        'fused': ('id', 'type', 'name', 'cmd', 'success_on', 'meta', 'inputs', 'outputs', 'wait_on',
+                  'stdout', 'stderr', 'members', 'slots')
+    }
+    _SEQUENCE_FIELDS = ('inputs', 'outputs', 'wait_on', 'members')
+
+    def __init__(self, **fields):
+        for field, value in fields.items():
+            self[field] = value
+
+    @property
+    def cmd(self):
+        return ' '.join(self.cmd_fragments)
+
+    def __getitem__(self, field):
+        try:
+            return getattr(self, field)
+        except AttributeError:
+            raise KeyError(field)
+
+    def __setitem__(self, field, value):
+        if field == 'cmd':
+            field, value = 'cmd_fragments', (value,) if isinstance(value, str) else value
+        if field in _AppBlueprint._SEQUENCE_FIELDS:
+            value = list(value)
+        elif field == 'cmd_fragments':
+            value = tuple(value)
+        setattr(self, field, value)
+
+    def __contains__(self, field):
+        return field in self.keys()
+
+    def get(self, field, default=None):
+        return self[field] if field in self else default
+
+    def keys(self):
+        return [field for field in _AppBlueprint._FIELDS.get(getattr(self, 'type', None), ())
+                if hasattr(self, field)]
+
+    def renumber(self, offset, capture_dir):
+        """
+        Shifts the number at the end of this app's ID, and of every app it waits on, by offset.
+        Captured stream paths named after the app are renamed to match.
+
+        Apps registered in another process are numbered from 1 there. Shifting them by the
+        number of IDs handed out before them gives each the ID it would have had if everything
+        had been registered in one process, in order.
+        """
+        self.id = _renumber_app_id(self.id, offset)
+        self.wait_on = [_renumber_app_id(app_id, offset) for app_id in self.wait_on]
+        for stream in ('stdout', 'stderr'):
+            stream_path = getattr(self, stream, None)
+            if stream_path and os.path.dirname(stream_path) == capture_dir:
+                app_id, extension = os.path.splitext(os.path.basename(stream_path))
+                setattr(self, stream, os.path.join(capture_dir, _renumber_app_id(app_id, offset) + extension))
+        return self
+
+    def as_dict(self):
+        return {field: self[field] for field in self.keys()}
+
+    def __repr__(self):
+        return '_AppBlueprint({!r})'.format(self.as_dict())
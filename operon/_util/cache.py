@@ -0,0 +1,293 @@
+import os
+import re
+import json
+import time
+import queue
+import shutil
+import hashlib
+import logging
+import threading
+
+from operon._util.home import get_operon_home
+from operon._util.tracking import watch_app_future, attempt_failed
+
+MANIFEST = 'manifest.json'
+HASH_CHUNK_SIZE = 1024 * 1024
+SIZE_UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+
+logger = logging.getLogger('operon.main')
+
+
+def get_cache_dir():
+    return os.path.join(get_operon_home(), 'cache')
+
+
+def parse_size(size):
+    """
+    Converts a human readable size such as 500M or 100G into bytes.
+    :param size: str|int Size, optionally suffixed with K, M, G, or T
+    :return: int Size in bytes
+    """
+    match = re.match(r'^\s*(\d+(?:\.\d+)?)\s*([KMGT]?)B?\s*$', str(size).upper())
+    if match is None:
+        raise ValueError('Could not interpret {} as a size'.format(size))
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2)])
+
+
+def format_size(num_bytes):
+    for unit in ('', 'K', 'M', 'G'):
+        if num_bytes < 1024:
+            return '{:.1f}{}'.format(num_bytes, unit) if unit else '{}B'.format(num_bytes)
+        num_bytes /= 1024
+    return '{:.1f}T'.format(num_bytes)
+
+
+def link_or_copy(src, dest):
+    """
+    Hard links src to dest, replacing dest if it exists. Falls back to a copy when a
+    hard link isn't possible, such as across filesystems.
+    """
+    if os.path.lexists(dest):
+        os.remove(dest)
+    try:
+        os.link(src, dest)
+    except OSError:
+        shutil.copy2(src, dest)
+
+
+class ResultCache(object):
+    """
+    Persistent, content-addressed store of bash app outputs shared across runs.
+
+    An entry is keyed by the app's command, its success codes, and the content hashes of its
+    input files, and holds a copy of every output the app produced. When an app with the same
+    key comes up in a later run its outputs are restored instead of running it again. Entries are
+    evicted least recently used first once the cache is over its size limit.
+
+    Outputs are copied into the cache, but restored as hard links where possible, so a restored
+    output rewritten in place later, by a run without the cache or by anything else, rewrites
+    the entry too. The size and modification time of each file of an entry are recorded when it's
+    stored, and an entry whose files no longer match is removed rather than restored.
+
+    Layout on disk:
+        <cache_dir>/<key>/manifest.json  {'outputs': [paths], 'files': [[bytes, mtime_ns]],
+                                          'size': bytes, 'created': timestamp}
+        <cache_dir>/<key>/<i>            ith output of the app
+    The modification time of the manifest records when the entry was last used.
+    """
+    def __init__(self, cache_dir=None, max_size=None):
+        self.cache_dir = cache_dir or get_cache_dir()
+        self.max_size = parse_size(max_size) if max_size is not None else None
+
+        # Input hashes, keyed by (path, size, mtime), so shared inputs are only read once per run
+        self._file_hashes = dict()
+        self._hash_lock = threading.Lock()
+
+        # Outputs are stored from a separate thread so a completing app never waits on hashing
+        self._store_queue = queue.Queue()
+        self._store_thread = None
+
+    @staticmethod
+    def is_cacheable(app_blueprint):
+        # Python apps can't be keyed reliably, and an app without outputs has nothing to restore
+        return app_blueprint['type'] == 'bash' and bool(app_blueprint['outputs'])
+
+    def file_hash(self, path):
+        stat = os.stat(path)
+        memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime)
+        with self._hash_lock:
+            if memo_key in self._file_hashes:
+                return self._file_hashes[memo_key]
+
+        digest = hashlib.sha256()
+        with open(path, 'rb') as input_file:
+            for chunk in iter(lambda: input_file.read(HASH_CHUNK_SIZE), b''):
+                digest.update(chunk)
+
+        with self._hash_lock:
+            self._file_hashes[memo_key] = digest.hexdigest()
+        return self._file_hashes[memo_key]
+
+    def key(self, app_blueprint):
+        """
+        :return: str Cache key for this app, or None if any input can't be read
+        """
+        try:
+            input_hashes = [self.file_hash(input_data) for input_data in app_blueprint['inputs']]
+        except OSError:
+            return None
+        return hashlib.sha256(json.dumps({
+            'cmd': app_blueprint['cmd'],
+            'success_on': sorted(map(str, app_blueprint['success_on'])),
+            'inputs': input_hashes
+        }, sort_keys=True).encode()).hexdigest()
+
+    def restore(self, app_blueprint):
+        """
+        Restores the outputs of this app from the cache, if an entry for it exists.
+        :return: bool Whether the outputs were restored
+        """
+        if not ResultCache.is_cacheable(app_blueprint):
+            return False
+        cache_key = self.key(app_blueprint)
+        if cache_key is None:
+            return False
+        entry_dir = os.path.join(self.cache_dir, cache_key)
+        try:
+            with open(os.path.join(entry_dir, MANIFEST)) as manifest_file:
+                manifest = json.load(manifest_file)
+            if manifest['outputs'] != list(app_blueprint['outputs']):
+                return False
+            if not self._entry_intact(entry_dir, manifest):
+                logger.warning('Result cache entry {} was changed since it was stored, removing it'.format(cache_key))
+                self.remove(cache_key)
+                return False
+            for i, output_data in enumerate(manifest['outputs']):
+                link_or_copy(os.path.join(entry_dir, str(i)), output_data)
+            os.utime(os.path.join(entry_dir, MANIFEST))
+        except (OSError, ValueError, KeyError):
+            return False
+        logger.info('Restored outputs of {} from result cache entry {}'.format(app_blueprint['id'], cache_key))
+        return True
+
+    @staticmethod
+    def _entry_intact(entry_dir, manifest):
+        """
+        :return: bool Whether every file of an entry has the size and modification time it was stored with;
+                 entries stored without them can't be checked, so they never are intact
+        """
+        entry_files = manifest.get('files')
+        if entry_files is None or len(entry_files) != len(manifest['outputs']):
+            return False
+        for i, (size, mtime_ns) in enumerate(entry_files):
+            stat = os.stat(os.path.join(entry_dir, str(i)))
+            if (stat.st_size, stat.st_mtime_ns) != (size, mtime_ns):
+                return False
+        return True
+
+    def store(self, app_blueprint):
+        """
+        Adds the outputs of a successfully completed app to the cache.
+        """
+        cache_key = self.key(app_blueprint)
+        if cache_key is None:
+            return
+        entry_dir = os.path.join(self.cache_dir, cache_key)
+        staging_dir = '{}.{}.tmp'.format(entry_dir, os.getpid())
+        try:
+            os.makedirs(staging_dir, exist_ok=True)
+            entry_size, entry_files = 0, list()
+            for i, output_data in enumerate(app_blueprint['outputs']):
+                # Copied rather than linked, so rewriting the output in place later can't change the entry
+                shutil.copy2(output_data, os.path.join(staging_dir, str(i)))
+                stat = os.stat(os.path.join(staging_dir, str(i)))
+                entry_size += stat.st_size
+                entry_files.append([stat.st_size, stat.st_mtime_ns])
+            with open(os.path.join(staging_dir, MANIFEST), 'w') as manifest_file:
+                json.dump({
+                    'outputs': list(app_blueprint['outputs']),
+                    'files': entry_files,
+                    'size': entry_size,
+                    'created': time.time()
+                }, manifest_file)
+
+            # Publish the finished entry all at once, replacing any stale one
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            os.rename(staging_dir, entry_dir)
+        except OSError as e:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            logger.debug('Outputs of {} could not be added to the result cache: {}'.format(app_blueprint['id'], e))
+
+    def release_outputs(self, app_blueprint):
+        """
+        Breaks hard links left by an earlier restore or store, so that running this app again
+        can't rewrite a cache entry in place. Must be called before the app is submitted.
+        """
+        if not ResultCache.is_cacheable(app_blueprint):
+            return
+        for output_data in app_blueprint['outputs']:
+            try:
+                if os.stat(output_data).st_nlink > 1:
+                    os.remove(output_data)
+            except OSError:
+                pass
+
+    def store_when_done(self, app_blueprint, app_future):
+        """
+        Schedules the outputs of this app to be stored once it completes successfully.
+        """
+        if not ResultCache.is_cacheable(app_blueprint):
+            return
+        if self._store_thread is None:
+            self._store_thread = threading.Thread(target=self._store_worker, daemon=True)
+            self._store_thread.start()
+
+        def on_done(_, exec_future):
+            if not attempt_failed(exec_future):
+                self._store_queue.put(app_blueprint)
+        watch_app_future(app_future, on_done=on_done)
+
+    def _store_worker(self):
+        while True:
+            app_blueprint = self._store_queue.get()
+            if app_blueprint is None:
+                break
+            self.store(app_blueprint)
+            self._store_queue.task_done()
+
+    def flush(self):
+        """
+        Waits for the outputs of every app that has completed so far to be stored.
+        """
+        if self._store_thread is not None:
+            self._store_queue.join()
+
+    def close(self):
+        """
+        Waits for pending stores to finish, then evicts entries over the size limit.
+        """
+        if self._store_thread is not None:
+            self._store_queue.put(None)
+            self._store_thread.join()
+            self._store_thread = None
+        if self.max_size is not None:
+            self.evict(self.max_size)
+
+    def entries(self):
+        """
+        :return: list<(str, dict, float)> Key, manifest, and last used time of every entry,
+                 least recently used first
+        """
+        cache_entries = list()
+        if not os.path.isdir(self.cache_dir):
+            return cache_entries  # Nothing has been stored yet, the directory is made by the first store
+        for cache_key in os.listdir(self.cache_dir):
+            if cache_key.endswith('.tmp'):
+                continue  # Entry still being written, or left behind by an interrupted store
+            manifest_path = os.path.join(self.cache_dir, cache_key, MANIFEST)
+            try:
+                with open(manifest_path) as manifest_file:
+                    cache_entries.append((cache_key, json.load(manifest_file), os.path.getmtime(manifest_path)))
+            except (OSError, ValueError):
+                continue
+        return sorted(cache_entries, key=lambda entry: entry[2])
+
+    def remove(self, cache_key):
+        shutil.rmtree(os.path.join(self.cache_dir, cache_key), ignore_errors=True)
+
+    def evict(self, max_size):
+        """
+        Removes least recently used entries until the cache is no larger than max_size.
+        :return: (int, int) Number of entries removed and bytes freed
+        """
+        cache_entries = self.entries()
+        total_size = sum(manifest.get('size', 0) for _, manifest, _ in cache_entries)
+        num_removed, bytes_freed = 0, 0
+        for cache_key, manifest, _ in cache_entries:
+            if total_size <= max_size:
+                break
+            self.remove(cache_key)
+            total_size -= manifest.get('size', 0)
+            bytes_freed += manifest.get('size', 0)
+            num_removed += 1
+        return num_removed, bytes_freed
@@ -9,6 +9,7 @@ from parsl import ThreadPoolExecutor, DataFlowKernel
 
 from parsl.config import Config
 from parsl.executors.threads import ThreadPoolExecutor
+from parsl.utils import get_all_checkpoints
 
 from operon._util.home import load_parsl_config_file
 
@@ -59,6 +60,26 @@ def cycle_config_input_options(user_input):
     return None
 
 
+def apply_checkpointing(parsl_config, run_dir, checkpoint_mode='task_exit'):
+    """
+    Turns on Parsl checkpointing for this config, writing checkpoints under run_dir and
+    loading every checkpoint previously written there, so a run started again with the
+    same run_dir only executes the tasks that didn't finish before.
+    :param parsl_config: parsl.config.Config The config chosen for this run
+    :param run_dir: str Directory Parsl keeps this run's runinfo in
+    :param checkpoint_mode: str One of task_exit, periodic, or dfk_exit
+    :return: parsl.config.Config The same config, modified in place
+    """
+    previous_checkpoints = get_all_checkpoints(run_dir)
+    parsl_config.app_cache = True
+    parsl_config.checkpoint_mode = checkpoint_mode
+    parsl_config.checkpoint_files = list(parsl_config.checkpoint_files or list()) + previous_checkpoints
+    parsl_config.run_dir = run_dir
+    if previous_checkpoints:
+        logger.info('Resuming from {} previous checkpoints in {}'.format(len(previous_checkpoints), run_dir))
+    return parsl_config
+
+
 def basic_threads(workers=8):
     return Config(
         executors=[ThreadPoolExecutor(max_threads=workers)],
@@ -0,0 +1,63 @@
+import weakref
+
+# Values of _DataRegistry._modes, indexed by data ID
+MODE_UNSET, MODE_INPUT, MODE_OUTPUT = 0, 1, 2
+
+
+class _DataRegistry(object):
+    """
+    Every path a run refers to, each given a small integer ID in the order it was first seen.
+
+    A registry belongs to a single run and is replaced when the next one starts, so a long-lived
+    process doesn't accumulate the paths of every run it has built. ``Data`` objects are only
+    weakly referenced: once nothing holds one anymore it's freed, and asking for the same path
+    again gives a new object with the same ID. Whether a path was last marked as input or output,
+    and whether it's temporary, is kept here by ID rather than on the objects, so it survives that.
+
+    Graph assembly keys data nodes by ID, so it works on ints rather than long path strings.
+    """
+    def __init__(self):
+        self.paths = list()  # Path of each ID
+        self._ids = dict()
+        self._objects = weakref.WeakValueDictionary()
+        self._modes = bytearray()
+        self._tmp = set()
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __contains__(self, path):
+        return path in self._ids
+
+    def id(self, path):
+        """
+        :return: int ID of this path, registering it if it's new
+        """
+        try:
+            return self._ids[path]
+        except KeyError:
+            data_id = self._ids[path] = len(self.paths)
+            self.paths.append(path)
+            self._modes.append(MODE_UNSET)
+            return data_id
+
+    def get_object(self, path):
+        return self._objects.get(path)
+
+    def set_object(self, path, data):
+        self._objects[path] = data
+
+    def mode(self, data_id):
+        return self._modes[data_id]
+
+    def set_mode(self, data_id, mode):
+        self._modes[data_id] = mode
+
+    def is_tmp(self, path):
+        return path in self._ids and self._ids[path] in self._tmp
+
+    def set_tmp(self, data_id, tmp):
+        if tmp:
+            self._tmp.add(data_id)
+        else:
+            self._tmp.discard(data_id)
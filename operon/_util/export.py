@@ -0,0 +1,135 @@
+import os
+import json
+from json.encoder import encode_basestring
+
+from operon._util.scheduling import app_executor, app_name
+
+# Attributes a node of the exported graph can have, and their GraphML types
+NODE_ATTRIBUTES = (
+    ('type', 'string'), ('name', 'string'), ('executor', 'string'),
+    ('status', 'string'), ('start', 'double'), ('end', 'double'), ('duration', 'double')
+)
+
+
+def node_id(node, node_type):
+    """
+    :return: str ID of a node in the exported graph; data nodes are keyed by the integer ID of
+             their path, and exported as data:<ID>
+    """
+    return 'data:{}'.format(node) if node_type == 'data' else node
+
+
+def graph_nodes(workflow_graph, app_runs=None):
+    """
+    :param workflow_graph: nx.DiGraph Directed graph representation of the workflow
+    :param app_runs: dict<str, dict> Attributes of each app known once the run is over, see app_runs()
+    :return: generator<dict> Attributes of each node, including its id
+    """
+    app_runs = app_runs or dict()
+    for node, node_data in workflow_graph.nodes(data=True):
+        node_type = node_data.get('type')
+        attributes = {'id': node_id(node, node_type), 'type': node_type}
+        if node_type == 'app':
+            blueprint = node_data['blueprint']
+            attributes['name'] = app_name(blueprint)
+            executor = app_executor(blueprint['meta'] or dict())
+            if executor is not None:
+                attributes['executor'] = executor
+            attributes.update(app_runs.get(node, ()))
+        else:
+            attributes['name'] = node_data.get('name')
+        yield attributes
+
+
+def app_runs(state, times, run_start):
+    """
+    :param state: dict<str, str> Final state of each app
+    :param times: dict<str, (float, float)> When each app was launched and finished, in seconds
+                  since the epoch, see AppStateTracker
+    :param run_start: float When the run started, in seconds since the epoch
+    :return: dict<str, dict> Status of each app, and its start and end in seconds since the run
+             started and duration, for those that ran
+    """
+    runs = dict()
+    for app_id, app_state in state.items():
+        runs[app_id] = {'status': app_state}
+        start, end = times.get(app_id, (None, None))
+        if start is not None:
+            runs[app_id]['start'] = round(start - run_start, 3)
+        if end is not None:
+            runs[app_id]['end'] = round(end - run_start, 3)
+        if start is not None and end is not None:
+            runs[app_id]['duration'] = round(end - start, 3)
+    return runs
+
+
+def graph_edges(workflow_graph):
+    """
+    :return: generator<(str, str)> Source and target id of each edge
+    """
+    node_types = workflow_graph.nodes(data='type')
+    for source, target in workflow_graph.edges:
+        yield node_id(source, node_types[source]), node_id(target, node_types[target])
+
+
+def _xml_escape(value):
+    if not isinstance(value, str):
+        return value
+    return value.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;').replace('"', '&quot;')
+
+
+def _write_json(workflow_graph, graph_file, app_runs=None, started=None):
+    # One node or edge per line, each serialized on its own, so only one is ever held in memory
+    dump = json.JSONEncoder(separators=(',', ':'), check_circular=False).encode
+
+    graph_file.write('{')
+    if started is not None:
+        graph_file.write('"started":{},\n'.format(dump(started)))
+    graph_file.write('"nodes":[')
+    for i, attributes in enumerate(graph_nodes(workflow_graph, app_runs)):
+        graph_file.write('{}\n{}'.format(',' if i else '', dump(attributes)))
+    graph_file.write('\n],"edges":[')
+    for i, (source, target) in enumerate(graph_edges(workflow_graph)):
+        graph_file.write('{}\n[{},{}]'.format(',' if i else '', encode_basestring(source), encode_basestring(target)))
+    graph_file.write('\n]}\n')
+
+
+def _write_graphml(workflow_graph, graph_file, app_runs=None):
+    graph_file.write('<?xml version="1.0" encoding="utf-8"?>\n'
+                     '<graphml xmlns="http://graphml.graphdrawing.org/xmlns">\n')
+    for attribute, attribute_type in NODE_ATTRIBUTES:
+        graph_file.write('<key id="{0}" for="node" attr.name="{0}" attr.type="{1}"/>\n'.format(
+            attribute, attribute_type
+        ))
+    graph_file.write('<graph edgedefault="directed">\n')
+    for attributes in graph_nodes(workflow_graph, app_runs):
+        graph_file.write('<node id="{}">{}</node>\n'.format(_xml_escape(attributes.pop('id')), ''.join(
+            '<data key="{}">{}</data>'.format(attribute, _xml_escape(value))
+            for attribute, value in attributes.items() if value is not None
+        )))
+    for source, target in graph_edges(workflow_graph):
+        graph_file.write('<edge source="{}" target="{}"/>\n'.format(_xml_escape(source), _xml_escape(target)))
+    graph_file.write('</graph>\n</graphml>\n')
+
+
+def export_graph(workflow_graph, path_prefix, graphml=False, app_runs=None, started=None):
+    """
+    Writes the workflow graph to path_prefix.json, and optionally path_prefix.graphml, a node or
+    edge at a time, so even graphs of millions of nodes are never built up as a whole document.
+    Each file is written next to where it goes and moved into place once complete, so a reader
+    never sees a partial graph, and writing it again after the run replaces the earlier one.
+
+    :param workflow_graph: nx.DiGraph Directed graph representation of the workflow
+    :param path_prefix: str Path of the files to write, without extension
+    :param graphml: bool Also write GraphML
+    :param app_runs: dict<str, dict> Attributes of each app known once the run is over, see app_runs()
+    :param started: str When the run started
+    """
+    writers = [('.json', lambda graph_file: _write_json(workflow_graph, graph_file, app_runs, started))]
+    if graphml:
+        writers.append(('.graphml', lambda graph_file: _write_graphml(workflow_graph, graph_file, app_runs)))
+    for extension, write in writers:
+        graph_path = path_prefix + extension
+        with open(graph_path + '.partial', 'w') as graph_file:
+            write(graph_file)
+        os.replace(graph_path + '.partial', graph_path)
@@ -0,0 +1,328 @@
+import os
+import shlex
+import threading
+from collections import defaultdict
+from concurrent.futures import Future
+
+import networkx as nx
+from parsl.app.errors import AppFailure, MissingOutputs
+from parsl.app.futures import DataFuture
+from parsl.dataflow.error import DependencyError
+
+from operon._util.apps import _AppBlueprint
+from operon._util.errors import MalformedPipelineError
+from operon._util.scheduling import app_graph, app_resources
+from operon._util.tracking import attempt_failed, watch_app_future
+
+# At most this many apps are fused into one task, since a retry runs the whole chain again
+MAX_CHAIN_APPS = 50
+
+# Each app of a fused task reports one of these on its own line of the task's stdout
+STATUS_OK, STATUS_FAILED, STATUS_MISSING = 'ok', 'failed', 'missing'
+
+
+def _executor(blueprint):
+    meta = blueprint['meta'] or dict()
+    return meta.get('executor', meta.get('site'))
+
+
+def linear_chains(workflow_graph, max_length=MAX_CHAIN_APPS):
+    """
+    Finds maximal chains of bash apps where each app is the only one depending on the app before
+    it, and the only thing the app after it depends on, all assigned to the same executor. Apps in
+    such a chain can never run side by side, so running them one after another in a single task
+    loses nothing.
+
+    :param workflow_graph: nx.DiGraph Directed graph representation of the workflow
+    :param max_length: int Chains longer than this are split
+    :return: dict<str, tuple<str>> Chain of at least two apps each fusable app belongs to, in order
+    """
+    apps = app_graph(workflow_graph)
+
+    def fusable(app_id):
+        return workflow_graph.nodes[app_id]['blueprint']['type'] == 'bash'
+
+    try:
+        app_order = list(nx.topological_sort(apps))
+    except nx.NetworkXUnfeasible:
+        raise MalformedPipelineError('Workflow graph contains a cycle')
+
+    chains = dict()
+    for app_id in app_order:
+        if app_id in chains or not fusable(app_id):
+            continue
+        # Apps are visited in dependency order, so this app can't extend a chain before it
+        chain = [app_id]
+        while len(chain) < max_length and apps.out_degree(chain[-1]) == 1:
+            next_app_id = next(iter(apps.successors(chain[-1])))
+            if (apps.in_degree(next_app_id) != 1 or not fusable(next_app_id)
+                    or _executor(workflow_graph.nodes[next_app_id]['blueprint'])
+                    != _executor(workflow_graph.nodes[app_id]['blueprint'])):
+                break
+            chain.append(next_app_id)
+        if len(chain) > 1:
+            chains.update((chain_app_id, tuple(chain)) for chain_app_id in chain)
+    return chains
+
+
+def shell_quote(path):
+    # Parsl formats the command of a bash app once more before running it
+    return shlex.quote(path).replace('{', '{{').replace('}', '}}')
+
+
+def member_command(blueprint, position, stop_on_failure=True):
+    """
+    Runs the command of one app inside a fused task, with its streams going to where they would
+    if it ran on its own, and reports on the task's stdout whether it succeeded by its own
+    success_on codes and left all of its outputs.
+    :param position: int Index of the app within the fused task
+    :param stop_on_failure: bool End the task as soon as this app fails
+    """
+    if blueprint['stdout'] == blueprint['stderr']:
+        redirects = '> {} 2>&1'.format(shell_quote(blueprint['stdout']))
+    else:
+        redirects = '> {} 2> {}'.format(shell_quote(blueprint['stdout']), shell_quote(blueprint['stderr']))
+
+    def report(status):
+        return 'echo {} {}{}'.format(position, status, '; exit 1' if stop_on_failure and status != STATUS_OK else '')
+
+    on_success = report(STATUS_OK)
+    if blueprint['outputs']:
+        on_success = 'if {}; then {}; else {}; fi'.format(
+            ' && '.join('test -e {}'.format(shell_quote(output_data)) for output_data in blueprint['outputs']),
+            on_success, report(STATUS_MISSING)
+        )
+    return '({}) {}; case $? in {}) {};; *) {};; esac'.format(
+        blueprint['cmd'], redirects, '|'.join(map(str, blueprint['success_on'] or ['0'])),
+        on_success, report(STATUS_FAILED)
+    )
+
+
+def sibling_batches(workflow_graph, batch_size, exclude=(), estimates=None):
+    """
+    Groups bash apps that depend on exactly the same apps, and are assigned to the same executor,
+    into batches of up to batch_size. Such siblings never depend on each other, and all become
+    ready to run at the same moment.
+
+    Given how long each app is expected to take, siblings are batched longest first, so apps of
+    about the same length share a task, rather than a task's slots sitting idle while one long app
+    finishes.
+
+    :param workflow_graph: nx.DiGraph Directed graph representation of the workflow
+    :param batch_size: int Most apps in a batch
+    :param exclude: container<str> Apps to leave out, such as those already fused into chains
+    :param estimates: dict<str, float> Seconds each app is expected to take, if known
+    :return: dict<str, tuple<str>> Batch of at least two apps each batched app belongs to
+    """
+    apps = app_graph(workflow_graph)
+    siblings = defaultdict(list)
+    for app_id in apps:
+        blueprint = workflow_graph.nodes[app_id]['blueprint']
+        if blueprint['type'] == 'bash' and app_id not in exclude:
+            siblings[(frozenset(apps.predecessors(app_id)), _executor(blueprint))].append(app_id)
+
+    batches = dict()
+    for sibling_ids in siblings.values():
+        if estimates:
+            sibling_ids.sort(key=lambda app_id: -estimates.get(app_id, 0))
+        for batch_start in range(0, len(sibling_ids), batch_size):
+            batch = tuple(sibling_ids[batch_start:batch_start + batch_size])
+            if len(batch) > 1:
+                batches.update((batch_app_id, batch) for batch_app_id in batch)
+    return batches
+
+
+def _fused_blueprint(blueprints, capture_dir, cmd, slots):
+    fused_outputs = set(output_data for blueprint in blueprints for output_data in blueprint['outputs'])
+    # The task needs what its most demanding app declared, once per app it runs at once; CPUs are
+    # only declared for it if one of its apps declared them, so it isn't held back by the host's CPUs otherwise
+    resources = [app_resources(blueprint['meta'], default_cpu=0) for blueprint in blueprints]
+    fused_resources = {'mem': max(mem for _, mem in resources) * (slots or 1)}
+    if any(cpu for cpu, _ in resources):
+        fused_resources['cpu'] = max(cpu for cpu, _ in resources) * (slots or 1)
+    return _AppBlueprint(
+        id=blueprints[0]['id'],
+        type='fused',
+        name=blueprints[0]['name'],
+        cmd=cmd,
+        success_on=['0'],
+        meta=dict(blueprints[0]['meta'], resources=fused_resources),
+        inputs=[input_data for blueprint in blueprints for input_data in blueprint['inputs']
+                if input_data not in fused_outputs],
+        outputs=[output_data for blueprint in blueprints for output_data in blueprint['outputs']],
+        wait_on=[app_id for blueprint in blueprints for app_id in blueprint['wait_on']],
+        stdout=os.path.join(capture_dir, '{}.status'.format(blueprints[0]['id'])),
+        stderr=os.devnull,
+        members=blueprints,
+        slots=slots
+    )
+
+
+def fuse_chain(blueprints, capture_dir):
+    """
+    :param blueprints: list<_AppBlueprint> Apps of a linear chain, in order
+    :param capture_dir: str Directory the status of each app is written to
+    :return: _AppBlueprint Single bash app running every app of the chain in turn, stopping at the
+             first that fails
+    """
+    return _fused_blueprint(
+        blueprints, capture_dir,
+        cmd='; '.join(member_command(blueprint, i) for i, blueprint in enumerate(blueprints)),
+        slots=None
+    )
+
+
+def fuse_batch(blueprints, capture_dir, slots=1):
+    """
+    :param blueprints: list<_AppBlueprint> Apps that don't depend on each other
+    :param capture_dir: str Directory the status of each app is written to
+    :param slots: int Most apps run at once
+    :return: _AppBlueprint Single bash app running every app, each in the background once one of
+             its slots is free, that fails if any of them does
+    """
+    cmd = ['failed=0']
+    for i, blueprint in enumerate(blueprints):
+        cmd.append('({}) & pid{}=$!'.format(member_command(blueprint, i), i))
+        if i + 1 < len(blueprints) and slots < len(blueprints):
+            cmd.append('[ $(jobs -rp | wc -l) -lt {} ] || wait -n'.format(slots))
+    cmd.extend('wait $pid{} || failed=1'.format(i) for i in range(len(blueprints)))
+    cmd.append('exit $failed')
+    return _fused_blueprint(blueprints, capture_dir, cmd='; '.join(cmd), slots=slots)
+
+
+def read_statuses(status_path):
+    """
+    :return: dict<int, str> Status each app of a fused task reported, by position
+    """
+    statuses = dict()
+    try:
+        with open(status_path) as status_file:
+            for line in status_file:
+                position, _, status = line.strip().partition(' ')
+                if position.isdigit():
+                    statuses[int(position)] = status
+    except OSError:
+        pass
+    return statuses
+
+
+class FusedAppFuture(Future):
+    """
+    Future of a single app run as part of a fused task.
+
+    Each app of the task gets its own, so it's followed, logged, and counted as failed the same as
+    if it had run on its own. It counts as launched when the task is, and is resolved from the
+    status the app reported once the task's last attempt is done.
+    """
+    def __init__(self, fused_task, position):
+        super().__init__()
+        self.fused_task = fused_task
+        self.position = position
+        self.parent = None
+        self.retries_left = 0
+        self._outputs = [
+            DataFuture(self, output_data, tid=fused_task.task_future.tid)
+            for output_data in fused_task.blueprint['members'][position]['outputs']
+        ]
+
+    @property
+    def tid(self):
+        return self.fused_task.task_future.tid
+
+    @property
+    def outputs(self):
+        return self._outputs
+
+    def update_parent(self, parent):
+        self.parent = parent
+
+    def launch(self):
+        # The app has no executor future of its own, so it stands as its own parent
+        self.update_parent(self)
+
+    def done(self):
+        # Parsl decides whether apps waiting on this one can start from inside the task's own
+        # completion callback, before any callback of ours could run, so check the task directly
+        if not super().done():
+            self.fused_task.resolve()
+        return super().done()
+
+    def result(self, timeout=None):
+        self.done()
+        return super().result(timeout=timeout)
+
+    def exception(self, timeout=None):
+        self.done()
+        return super().exception(timeout=timeout)
+
+
+class FusedTask(object):
+    """
+    Follows a fused task submitted to Parsl and resolves the future of each app in it.
+
+    If the task succeeded, every app did. Otherwise each app is judged by the status it reported:
+    apps of a chain after one that stopped the task never ran, and fail as dependents of it. Any
+    other app that didn't report, such as when the task was killed, gets the task's own error.
+    """
+    def __init__(self, task_future, fused_blueprint):
+        """
+        :param task_future: AppFuture Future of the fused task
+        :param fused_blueprint: _AppBlueprint Blueprint the task was submitted from, see fuse_chain()
+        """
+        self.task_future = task_future
+        self.blueprint = fused_blueprint
+        self.app_futures = [FusedAppFuture(self, i) for i in range(len(fused_blueprint['members']))]
+        self._resolved = False
+        self._lock = threading.RLock()
+        watch_app_future(task_future, on_launch=self._launched, on_done=lambda *_: self.resolve())
+
+    def _launched(self, _):
+        for app_future in self.app_futures:
+            app_future.launch()
+
+    def _last_attempt(self):
+        """
+        :return: Future Executor future of the task's last attempt, or None if it isn't done yet
+        """
+        exec_future = self.task_future.parent
+        if exec_future is None or not exec_future.done():
+            return None
+        if attempt_failed(exec_future) and getattr(exec_future, 'retries_left', 0) > 0:
+            return None  # Parsl is about to run the task again
+        return exec_future
+
+    def resolve(self):
+        with self._lock:
+            if self._resolved:
+                return
+            exec_future = self._last_attempt()
+            if exec_future is None:
+                return
+            self._resolved = True
+
+            task_exception, statuses = None, dict()
+            if attempt_failed(exec_future):
+                try:
+                    task_exception = exec_future.exception() or exec_future.result()
+                except Exception as e:
+                    task_exception = e
+                statuses = read_statuses(self.blueprint['stdout'])
+
+            failure = None
+            for app_future, blueprint in zip(self.app_futures, self.blueprint['members']):
+                status = statuses.get(app_future.position) if task_exception is not None else STATUS_OK
+                if status == STATUS_OK:
+                    app_future.set_result(0)
+                    continue
+                if status == STATUS_FAILED:
+                    exception = AppFailure('[{}] App failed with exit code: 1'.format(blueprint['id']), 1)
+                elif status == STATUS_MISSING:
+                    exception = MissingOutputs('[{}] Missing outputs'.format(blueprint['id']), [
+                        output_data for output_data in blueprint['outputs'] if not os.path.exists(output_data)
+                    ])
+                elif failure is not None and self.blueprint['slots'] is None:
+                    exception = DependencyError([failure], app_future.tid, None)
+                else:
+                    exception = task_exception
+                failure = failure or (exception if status is not None else None)
+                app_future.set_exception(exception)
@@ -0,0 +1,208 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+from urllib.request import pathname2url
+from collections import defaultdict, deque
+from statistics import median
+
+from operon._util.home import get_operon_home
+from operon._util.scheduling import step_name
+
+# Durations kept for each step of a pipeline; once there are more, the oldest are dropped
+MAX_STEP_SAMPLES = 200
+
+# A step's runtime is only fit against the size of its inputs once it has run on this many different sizes
+MIN_FIT_SIZES = 3
+
+# Seconds to wait for another run to finish writing to the history before giving up
+HISTORY_TIMEOUT = 30
+
+logger = logging.getLogger('operon.main')
+
+
+def get_history_path():
+    return os.path.join(get_operon_home(), 'history.db')
+
+
+def input_bytes(paths, sizes=None):
+    """
+    :param paths: iterable<str> Input files of an app
+    :param sizes: dict<str, int> Sizes already looked up, updated with any looked up now
+    :return: int Total size of the files, or None if any of them doesn't exist (yet)
+    """
+    sizes = dict() if sizes is None else sizes
+    total = 0
+    for path in paths:
+        if path not in sizes:
+            try:
+                sizes[path] = os.path.getsize(path)
+            except OSError:
+                return None
+        total += sizes[path]
+    return total
+
+
+class StepModel(object):
+    """
+    How long a step of a pipeline takes for a given size of input, fit to its earlier runs.
+
+    Once the step has run on at least MIN_FIT_SIZES different sizes of input, and took longer on
+    larger inputs, its runtime is a least squares line through seconds against input bytes.
+    Otherwise, or when the size of the input isn't known, it's the median of earlier runs.
+    """
+    def __init__(self, samples):
+        """
+        :param samples: list<(int, float)> Input bytes, or None if unknown, and seconds of each earlier run
+        """
+        self.runs = len(samples)
+        self.typical = median(seconds for _, seconds in samples)
+        self.intercept, self.slope = None, None
+
+        sized = [(size, seconds) for size, seconds in samples if size is not None]
+        if len({size for size, _ in sized}) >= MIN_FIT_SIZES:
+            mean_size = sum(size for size, _ in sized) / len(sized)
+            mean_seconds = sum(seconds for _, seconds in sized) / len(sized)
+            slope = (sum((size - mean_size) * (seconds - mean_seconds) for size, seconds in sized) /
+                     sum((size - mean_size) ** 2 for size, _ in sized))
+            if slope > 0:
+                self.intercept, self.slope = mean_seconds - slope * mean_size, slope
+
+    def predict(self, size=None):
+        """
+        :param size: int Bytes of input, if known
+        :return: float Seconds the step is expected to take
+        """
+        if self.slope is None or size is None:
+            return self.typical
+        return max(0.0, self.intercept + self.slope * size)
+
+
+class RunHistory(object):
+    """
+    How long the steps of a pipeline took in its earlier runs, kept in a SQLite database under the
+    Operon home so every run of the pipeline, by any user of that home, adds to it.
+
+    Apps are recorded under their step_name() with the total size of their inputs and how long they
+    ran, and only the latest MAX_STEP_SAMPLES durations of each step are kept. Durations are held in
+    memory as apps complete and written all at once by save(), since a run can have millions of apps.
+    Only runs that measure their apps, with --app-metrics, add to the history, but every run reads it.
+    """
+    def __init__(self, pipeline, history_path=None):
+        """
+        :param pipeline: str Name of the pipeline
+        :param history_path: str SQLite database to use, if not the one under the Operon home
+        """
+        self.pipeline = pipeline
+        self.history_path = history_path or get_history_path()
+        self._models = None
+        self._added = defaultdict(lambda: deque(maxlen=MAX_STEP_SAMPLES))
+        self._lock = threading.Lock()
+
+    def _connect(self, read_only=False):
+        """
+        :param read_only: bool Open the database only to read it, without creating it or its table
+        """
+        if read_only:
+            return sqlite3.connect('file:{}?mode=ro'.format(pathname2url(os.path.abspath(self.history_path))),
+                                   timeout=HISTORY_TIMEOUT, uri=True)
+        os.makedirs(os.path.dirname(os.path.abspath(self.history_path)), exist_ok=True)
+        connection = sqlite3.connect(self.history_path, timeout=HISTORY_TIMEOUT)
+        connection.execute('CREATE TABLE IF NOT EXISTS durations '
+                           '(pipeline TEXT, step TEXT, input_bytes INTEGER, seconds REAL, recorded REAL)')
+        connection.execute('CREATE INDEX IF NOT EXISTS durations_by_step ON durations (pipeline, step)')
+        return connection
+
+    def models(self):
+        """
+        :return: dict<str, StepModel> Model of each step of the pipeline with any history, read
+                 from the database the first time it's asked for; a database no run has saved to
+                 yet is left uncreated
+        """
+        if self._models is None:
+            samples = defaultdict(list)
+            try:
+                if os.path.exists(self.history_path):
+                    connection = self._connect(read_only=True)
+                    try:
+                        for step, size, seconds in connection.execute(
+                                'SELECT step, input_bytes, seconds FROM durations WHERE pipeline = ?',
+                                (self.pipeline,)):
+                            samples[step].append((size, seconds))
+                    finally:
+                        connection.close()
+            except sqlite3.OperationalError as e:
+                if 'no such table' not in str(e):
+                    logger.warning('Could not read run history from {}: {}'.format(self.history_path, e))
+            except sqlite3.Error as e:
+                logger.warning('Could not read run history from {}: {}'.format(self.history_path, e))
+            self._models = {step: StepModel(step_samples) for step, step_samples in samples.items()}
+        return self._models
+
+    def predict(self, blueprint, sizes=None):
+        """
+        :param blueprint: _AppBlueprint App to predict
+        :param sizes: dict<str, int> Sizes of input files already looked up, see input_bytes()
+        :return: float Seconds the app is expected to take, or None if its step has no history
+        """
+        model = self.models().get(step_name(blueprint))
+        if model is None:
+            return None
+        return model.predict(input_bytes(blueprint['inputs'], sizes) if model.slope is not None else None)
+
+    def predictions(self, workflow_graph):
+        """
+        Inputs made by other apps of the workflow don't exist yet, so apps reading them are
+        predicted from the median of their step.
+
+        :param workflow_graph: nx.DiGraph Directed graph representation of the workflow
+        :return: dict<str, float> Seconds each app whose step has history is expected to take, by app ID
+        """
+        sizes, predictions = dict(), dict()
+        for node, node_data in workflow_graph.nodes(data=True):
+            if node_data.get('type') == 'app':
+                seconds = self.predict(node_data['blueprint'], sizes)
+                if seconds is not None:
+                    predictions[node] = seconds
+        return predictions
+
+    def add(self, blueprint, seconds, size=None):
+        """
+        :param blueprint: _AppBlueprint App that completed
+        :param seconds: float How long it ran
+        :param size: int Total bytes of its inputs, if known
+        """
+        with self._lock:
+            self._added[step_name(blueprint)].append((size, seconds))
+
+    def save(self):
+        """
+        Writes the durations added since the last save to the database in a single transaction,
+        then drops all but the latest MAX_STEP_SAMPLES of each of those steps.
+        """
+        with self._lock:
+            added, self._added = self._added, defaultdict(lambda: deque(maxlen=MAX_STEP_SAMPLES))
+        if not added:
+            return
+        recorded = time.time()
+        try:
+            connection = self._connect()
+            try:
+                with connection:
+                    for step, samples in added.items():
+                        connection.executemany('INSERT INTO durations VALUES (?, ?, ?, ?, ?)', [
+                            (self.pipeline, step, size, seconds, recorded) for size, seconds in samples
+                        ])
+                        connection.execute(
+                            'DELETE FROM durations WHERE pipeline = ? AND step = ? AND rowid NOT IN '
+                            '(SELECT rowid FROM durations WHERE pipeline = ? AND step = ? '
+                            'ORDER BY recorded DESC, rowid DESC LIMIT ?)',
+                            (self.pipeline, step, self.pipeline, step, MAX_STEP_SAMPLES)
+                        )
+            finally:
+                connection.close()
+        except sqlite3.Error as e:
+            logger.warning('Could not add to run history at {}: {}'.format(self.history_path, e))
+            return
+        logger.info('Added durations of {} apps to run history'.format(sum(map(len, added.values()))))
@@ -0,0 +1,133 @@
+import time
+import queue
+import logging
+import threading
+
+from operon.hooks import AppEvent
+from operon._util.tracking import attempt_failed, watch_app_future
+
+# Entry point group site plugins name their AppHook subclass under
+HOOK_ENTRY_POINT_GROUP = 'operon.hooks'
+
+REGISTERED, SUBMITTED, LAUNCHED, FINISHED, FAILED = 'registered', 'submitted', 'launched', 'finished', 'failed'
+
+# At most this long is spent on closing, waiting for hooks to be handed events that already happened
+CLOSE_TIMEOUT = 60
+
+logger = logging.getLogger('operon.main')
+
+
+def site_hooks():
+    """
+    :return: list<AppHook> An instance of the AppHook subclass named by each installed
+             operon.hooks entry point
+    """
+    try:
+        from pkg_resources import iter_entry_points
+    except ImportError:
+        return list()
+    hooks = list()
+    for entry_point in iter_entry_points(HOOK_ENTRY_POINT_GROUP):
+        try:
+            hooks.append(entry_point.load()())
+        except Exception as e:
+            logger.warning('Could not load app hook {}: {}'.format(entry_point.name, e))
+    return hooks
+
+
+class HookDispatcher(object):
+    """
+    Hands what happens to each app of a run to every AppHook, from a thread of its own.
+
+    Events are put on a queue as they happen, which is all the threads submitting and monitoring
+    apps ever do, so however slow a hook is the run carries on; the dispatch thread takes events
+    off the queue in order and calls each hook in turn. When each app got as far as it did is kept
+    only until it's finished or failed.
+    """
+    def __init__(self, hooks):
+        """
+        :param hooks: list<AppHook> Hooks to call
+        """
+        self._hooks = list(hooks)
+        self._queue = queue.Queue()
+        self._times = dict()  # When each app got to each event, by app ID, only used by the dispatch thread
+        self._pending = dict()  # Futures of submitted apps not yet finished or failed, by app ID
+        self._done = threading.Condition()
+        self._thread = threading.Thread(target=self._dispatch, name='operon-hooks', daemon=True)
+        self._thread.start()
+
+    def registered(self, blueprint):
+        """
+        :param blueprint: _AppBlueprint App of the workflow
+        """
+        self._queue.put((REGISTERED, blueprint, None, time.time()))
+
+    def submitted(self, blueprint, app_future, executor):
+        """
+        Tells hooks an app was submitted, then when it's launched, and when it's finished or failed.
+
+        :param blueprint: _AppBlueprint App submitted to Parsl
+        :param app_future: AppFuture Future of the app
+        :param executor: str Label of the executor the app was assigned to
+        """
+        with self._done:
+            self._pending[blueprint['id']] = app_future
+        self._queue.put((SUBMITTED, blueprint, executor, time.time()))
+
+        def on_done(_, exec_future):
+            self._queue.put((FAILED if attempt_failed(exec_future) else FINISHED, blueprint, executor, time.time()))
+            with self._done:
+                self._pending.pop(blueprint['id'], None)
+                self._done.notify_all()
+        watch_app_future(
+            app_future,
+            on_launch=lambda _: self._queue.put((LAUNCHED, blueprint, executor, time.time())),
+            on_done=on_done
+        )
+
+    def _dispatch(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            event, blueprint, executor, event_time = item
+            app_times = self._times.setdefault(blueprint['id'], dict())
+            app_times.setdefault(event, event_time)
+            if event in (FINISHED, FAILED):
+                del self._times[blueprint['id']]
+            self._call(event, AppEvent(
+                event=event,
+                app_id=blueprint['id'],
+                blueprint=blueprint,
+                executor=executor,
+                time=event_time,
+                registered=app_times.get(REGISTERED),
+                submitted=app_times.get(SUBMITTED),
+                launched=app_times.get(LAUNCHED),
+                ended=event_time if event in (FINISHED, FAILED) else None
+            ))
+        self._call('run_finished')
+
+    def _call(self, event, app_event=None):
+        method = event if app_event is None else 'app_{}'.format(event)
+        for hook in list(self._hooks):
+            try:
+                getattr(hook, method)(*([app_event] if app_event is not None else []))
+            except Exception as e:
+                logger.warning('App hook {} failed on {}, it will not be called again: {}'.format(
+                    type(hook).__name__, method, e
+                ))
+                self._hooks.remove(hook)
+
+    def close(self):
+        """
+        Waits for apps that are done to be put on the queue, since the last of them can be seen as
+        done before they are, then for hooks to be handed every event and told the run is over.
+        """
+        with self._done:
+            self._done.wait_for(lambda: not any(fut.done() for fut in list(self._pending.values())),
+                                timeout=CLOSE_TIMEOUT)
+        self._queue.put(None)
+        self._thread.join(CLOSE_TIMEOUT)
+        if self._thread.is_alive():
+            logger.warning('App hooks are still being called, giving up on waiting for them')
@@ -4,6 +4,10 @@ from datetime import datetime
 
 
 def setup_logger(logs_dir=None, run_name='run'):
+    """
+    :return: str Path of the log file, or None if logs_dir wasn't given
+    """
+    operon_log_path = None
     logger = logging.getLogger('operon.main')
     logger.setLevel(logging.DEBUG)
     logger.propagate = False
@@ -11,10 +15,12 @@ def setup_logger(logs_dir=None, run_name='run'):
 
     if logs_dir is not None:
         operon_log_filename = '{}_{}.operon.log'.format(run_name, datetime.now().strftime('%d%b%Y_%H%M%S'))
-        logfilehandler = logging.FileHandler(os.path.join(logs_dir, operon_log_filename))
+        operon_log_path = os.path.join(logs_dir, operon_log_filename)
+        logfilehandler = logging.FileHandler(operon_log_path)
         logfilehandler.setFormatter(logformat)
         logger.addHandler(logfilehandler)
 
     ch = logging.StreamHandler()
     ch.setFormatter(logformat)
     logger.addHandler(ch)
+    return operon_log_path
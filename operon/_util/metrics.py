@@ -0,0 +1,418 @@
+import os
+import sys
+import json
+import time
+import shlex
+import logging
+import threading
+from collections import Counter, defaultdict
+
+from operon._util.cache import format_size
+from operon._util.fusion import shell_quote
+from operon._util.history import input_bytes
+from operon._util.scheduling import format_duration, step_name
+from operon._util.tracking import attempt_failed, watch_app_future
+
+# Run in place of the shell of a bash app once its command is done. Processes keep their
+# accounting of children across exec, so this sees the CPU time and peak memory of every process
+# the command started
+_RUSAGE_REPORT = ('import resource,sys;u=resource.getrusage(resource.RUSAGE_CHILDREN);'
+                  'print(u.ru_utime,u.ru_stime,u.ru_maxrss);sys.exit(int(sys.argv[1]))')
+
+# Current time in the shell, without starting a process where bash can tell it
+_SHELL_NOW = '${{EPOCHREALTIME:-$(date +%s.%N)}}'
+
+# Bytes read and written by the shell and every process it has waited on, read without starting a process
+_SHELL_IO = ('mr=;mw=;if [ -r /proc/$$/io ];then while read -r mk mv;do case $mk in rchar:) mr=$mv;; '
+             'wchar:) mw=$mv;; esac;done < /proc/$$/io;fi;')
+
+# At most this long is spent on closing, waiting for records of apps that are done to be written
+CLOSE_TIMEOUT = 10
+
+# ru_maxrss is in kilobytes, except on macOS
+_MAXRSS_UNIT = 1 if sys.platform == 'darwin' else 1024
+
+# How often the processes of running bash apps are looked at, in seconds
+SAMPLE_INTERVAL = 1.0
+
+# Apps looked at fewer times than this are judged by their CPU time alone
+MIN_SAMPLES = 3
+
+# What held an app back: running on a CPU, waiting on I/O, or waiting on anything else
+CPU_BOUND, IO_BOUND, WAIT_BOUND = 'cpu', 'io', 'wait'
+
+logger = logging.getLogger('operon.main')
+
+
+def measured_bash_command(cmd, success_on, metrics_path):
+    """
+    Wraps the command of a bash app so it writes its process ID and when it started to
+    metrics_path, then when it ended and how many bytes its processes read and wrote, and then
+    how much user and system CPU time they used and the peak resident memory of the largest of
+    them. Exits 0 if the command exited with one of success_on, otherwise 1.
+
+    Called where the app runs, so the Python doing the reporting is the one on that host; if there
+    isn't one, CPU time and memory are left out.
+    :param cmd: str Command, already formatted for Parsl
+    :param success_on: list<str> Exit codes that count as success
+    :param metrics_path: str File to write measurements to
+    """
+    python = shell_quote(sys.executable or '')
+    return ('scodes=({exit_codes});echo $$ {now} > {metrics};{cmd};ecode=$?;mend={now};scode=1;'
+            'for i in "${{{{scodes[@]}}}}";do if [ "$i" = $ecode ];then scode=0;fi;done;'
+            '{io}echo $mend $mr $mw >> {metrics};'
+            'if [ -x {python} ];then exec {python} -S -c {report} $scode >> {metrics};fi;exit $scode').format(
+        exit_codes=' '.join(map(str, success_on or ['0'])),
+        now=_SHELL_NOW,
+        cmd=cmd,
+        io=_SHELL_IO,
+        metrics=shell_quote(metrics_path),
+        python=python,
+        report=shlex.quote(_RUSAGE_REPORT)
+    )
+
+
+def _thread_io():
+    try:
+        with open('/proc/thread-self/io') as io_file:
+            io = dict(line.split(':', 1) for line in io_file)
+        return int(io['rchar']), int(io['wchar'])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def measured_call(metrics_path, func, args, kwargs):
+    """
+    Calls the function of a python app, and writes the same measurements a bash app does to
+    metrics_path, for the thread it ran on. Python apps share their worker process, so no
+    process ID or peak memory of their own can be told.
+    """
+    import resource
+    rusage_thread = getattr(resource, 'RUSAGE_THREAD', None)
+    start = time.time()
+    usage_before = resource.getrusage(rusage_thread) if rusage_thread is not None else None
+    io_before = _thread_io()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        end, io_after = time.time(), _thread_io()
+        with open(metrics_path, 'w') as metrics_file:
+            metrics_file.write('- {}\n'.format(start))
+            if io_before is not None and io_after is not None:
+                metrics_file.write('{} {} {}\n'.format(end, io_after[0] - io_before[0], io_after[1] - io_before[1]))
+            else:
+                metrics_file.write('{}\n'.format(end))
+            if usage_before is not None:
+                usage_after = resource.getrusage(rusage_thread)
+                metrics_file.write('{} {}\n'.format(usage_after.ru_utime - usage_before.ru_utime,
+                                                    usage_after.ru_stime - usage_before.ru_stime))
+
+
+def read_measurements(metrics_path):
+    """
+    :return: dict pid, start, end, bytes_read, bytes_written, cpu_user, cpu_system, and peak_rss an
+             app wrote to metrics_path, as far as it got
+    """
+    measurements = dict()
+    try:
+        with open(metrics_path) as metrics_file:
+            lines = [line.split() for line in metrics_file]
+    except OSError:
+        return measurements
+
+    def seconds(shell_time):
+        return float(shell_time.replace(',', '.'))  # The shell writes times with the decimal point of its locale
+
+    try:
+        if lines and len(lines[0]) == 2:
+            if lines[0][0].isdigit():
+                measurements['pid'] = int(lines[0][0])
+            measurements['start'] = seconds(lines[0][1])
+        if len(lines) > 1 and lines[1]:
+            measurements['end'] = seconds(lines[1][0])
+            if len(lines[1]) == 3:
+                measurements['bytes_read'], measurements['bytes_written'] = int(lines[1][1]), int(lines[1][2])
+        if len(lines) > 2 and len(lines[2]) >= 2:
+            measurements['cpu_user'], measurements['cpu_system'] = float(lines[2][0]), float(lines[2][1])
+            if len(lines[2]) > 2:
+                measurements['peak_rss'] = int(lines[2][2]) * _MAXRSS_UNIT
+    except ValueError:
+        pass
+    return measurements
+
+
+def bound_by(samples, cpu_time, wall):
+    """
+    :param samples: Counter How many times the app's processes were seen running on a CPU, waiting
+                    on I/O, or all waiting on something else
+    :param cpu_time: float Seconds of user and system CPU time the app used
+    :param wall: float Seconds the app ran
+    :return: str What held the app back most, or None if there's too little to tell
+    """
+    if sum(samples.values()) >= MIN_SAMPLES:
+        return max((CPU_BOUND, IO_BOUND, WAIT_BOUND), key=lambda bound: samples[bound])
+    # Without looking at it while it ran, time the app wasn't on a CPU can't be told apart
+    if cpu_time is not None and wall and cpu_time >= wall / 2:
+        return CPU_BOUND
+    return None
+
+
+def _process_states():
+    """
+    :return: (dict<int, str>, dict<int, list<int>>) State of every process on this host, and the
+             children of each
+    """
+    states, children = dict(), defaultdict(list)
+    for entry in os.scandir('/proc'):
+        if not entry.name.isdigit():
+            continue
+        try:
+            with open(os.path.join(entry.path, 'stat')) as stat_file:
+                stat = stat_file.read()
+        except OSError:
+            continue  # The process is already gone
+        # The command name can hold spaces and parentheses, so fields are counted from the last ')'
+        fields = stat[stat.rfind(')') + 2:].split()
+        pid = int(entry.name)
+        states[pid] = fields[0]
+        children[int(fields[1])].append(pid)
+    return states, children
+
+
+class ProcessSampler(object):
+    """
+    Every SAMPLE_INTERVAL seconds, looks at the processes of each bash app running on this host and
+    counts what the app is doing: running on a CPU if any of its processes is runnable, otherwise
+    waiting on I/O if any is in uninterruptible sleep, which is where reads and writes to local and
+    network file systems such as Lustre wait, or otherwise waiting on something else.
+
+    An app is found by the process ID its shell writes to its measurements file when it starts.
+    """
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self._interval = interval
+        self._watched = dict()  # Process ID, or None until it's known, and samples by measurements file
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='operon-process-sampler', daemon=True)
+        self._thread.start()
+
+    def watch(self, metrics_path):
+        with self._lock:
+            self._watched.setdefault(metrics_path, [None, Counter()])
+
+    def samples(self, metrics_path):
+        """
+        :return: Counter Samples taken so far of the app writing to metrics_path
+        """
+        with self._lock:
+            return Counter(self._watched.get(metrics_path, (None, Counter()))[1])
+
+    def forget(self, metrics_path):
+        """
+        :return: Counter Samples taken of the app writing to metrics_path
+        """
+        with self._lock:
+            return self._watched.pop(metrics_path, (None, Counter()))[1]
+
+    def stop(self):
+        self._stopped.set()
+
+    def _run(self):
+        while not self._stopped.wait(self._interval):
+            try:
+                self._sample()
+            except Exception as e:
+                logger.debug('Could not sample app processes: {}'.format(e))
+
+    def _sample(self):
+        with self._lock:
+            watched = list(self._watched.items())
+        for metrics_path, app in watched:
+            if app[0] is None:
+                app[0] = read_measurements(metrics_path).get('pid')
+        watched = [app for _, app in watched if app[0] is not None]
+        if not watched:
+            return
+
+        states, children = _process_states()
+        for app in watched:
+            app_states, app_pids = set(), [app[0]]
+            while app_pids:
+                pid = app_pids.pop()
+                if pid in states:
+                    app_states.add(states[pid])
+                    app_pids.extend(children[pid])
+            if not app_states:
+                continue  # Not started yet, or already done
+            with self._lock:
+                if 'R' in app_states:
+                    app[1][CPU_BOUND] += 1
+                elif 'D' in app_states:
+                    app[1][IO_BOUND] += 1
+                else:
+                    app[1][WAIT_BOUND] += 1
+
+
+def _rounded(seconds):
+    return round(seconds, 3) if seconds is not None else None
+
+
+class RunMetrics(object):
+    """
+    Writes a JSON record of each app to a file as soon as the app is done, one per line, and logs
+    a summary of what held the apps of each name back at the end of the run.
+
+    Each record has the app's ID, name, executor, and whether it completed or failed, and when it
+    was submitted to Parsl, launched once its dependencies were done, started running, and ended,
+    as seconds since the epoch. Queue wait is how long it took to start once launched, and wall is
+    how long it ran. Bytes read and written, CPU times, and peak_rss, in bytes, cover every process
+    the app started. For apps sampled while they ran, io_wait is about how long they spent waiting
+    on I/O, and bound is what held them back most: cpu, io, or wait. Apps that ran as part of a
+    fused task share the measurements of that task, and fused_with is the first app of it. Anything
+    an app didn't get as far as measuring is null. input_bytes is the total size of the app's input
+    files when it was done, and is null if any of them didn't exist.
+
+    The durations of completed apps are also added to the run history, if one is given, which is
+    saved when the run is over, and each record is handed to on_record, if given, once it's written.
+    """
+    def __init__(self, metrics_path, capture_dir, sample_interval=SAMPLE_INTERVAL, history=None, on_record=None):
+        """
+        :param metrics_path: str JSONL file to write records to
+        :param capture_dir: str Directory apps write their own measurements to while they run
+        :param sample_interval: float Seconds between looks at the processes of apps running on this host
+        :param history: RunHistory History of the pipeline to add durations to
+        :param on_record: callable(dict) Called with the record of each app, from the thread that saw it done
+        """
+        self.metrics_path = metrics_path
+        self._history = history
+        self._on_record = on_record
+        self._capture_dir = capture_dir
+        self._sample_interval = sample_interval
+        self._sampler = None
+        self._metrics_file = open(metrics_path, 'a', buffering=1)
+        self._pending = dict()  # Futures of apps not yet recorded, by app ID
+        self._apps_left = Counter()  # Apps of each task not yet recorded, by measurements file
+        self._summary = defaultdict(Counter)  # Totals by step_name()
+        self._recorded = threading.Condition()
+
+    def app_metrics_path(self, blueprint):
+        """
+        :return: str Where the app, or fused task, of blueprint writes its measurements while it runs
+        """
+        return os.path.join(self._capture_dir, '{}.metrics'.format(blueprint['id']))
+
+    def record_when_done(self, blueprint, app_future, executor, task_blueprint=None, sample=False):
+        """
+        :param blueprint: _AppBlueprint App submitted to Parsl
+        :param app_future: AppFuture Future of the app
+        :param executor: str Label of the executor the app was assigned to
+        :param task_blueprint: _AppBlueprint Fused task the app is part of, if any
+        :param sample: bool Look at the app's processes while it runs, which is only possible for
+                       bash apps run on this host
+        """
+        submitted = time.time()
+        launched = [None]
+        task_metrics_path = self.app_metrics_path(task_blueprint or blueprint)
+        with self._recorded:
+            self._pending[blueprint['id']] = app_future
+            self._apps_left[task_metrics_path] += 1
+            if sample and self._sampler is None:
+                self._sampler = ProcessSampler(self._sample_interval)
+
+        def on_launch(_):
+            launched[0] = time.time()
+            if sample:
+                self._sampler.watch(task_metrics_path)
+
+        def on_done(_, exec_future):
+            self._record(blueprint, task_blueprint, executor, attempt_failed(exec_future),
+                         submitted, launched[0], time.time())
+        watch_app_future(app_future, on_launch=on_launch, on_done=on_done)
+
+    def _record(self, blueprint, task_blueprint, executor, failed, submitted, launched, finished):
+        task_metrics_path = self.app_metrics_path(task_blueprint or blueprint)
+        measurements = read_measurements(task_metrics_path)
+        with self._recorded:
+            self._apps_left[task_metrics_path] -= 1
+            last_of_task = self._apps_left[task_metrics_path] <= 0
+            if last_of_task:
+                del self._apps_left[task_metrics_path]
+        samples = Counter()
+        if self._sampler is not None:
+            samples = self._sampler.forget(task_metrics_path) if last_of_task else self._sampler.samples(task_metrics_path)
+        if last_of_task and measurements:
+            os.remove(task_metrics_path)
+
+        start, end = measurements.get('start'), measurements.get('end', finished)
+        wall = end - start if start is not None else None
+        cpu_time = (measurements['cpu_user'] + measurements['cpu_system']) if 'cpu_user' in measurements else None
+        bound = bound_by(samples, cpu_time, wall)
+        record = {
+            'app': blueprint['id'],
+            'name': step_name(blueprint),
+            'executor': executor,
+            'status': 'failed' if failed else 'completed',
+            'submit': _rounded(submitted),
+            'launch': _rounded(launched),
+            'start': _rounded(start),
+            'end': _rounded(end),
+            'queue_wait': _rounded(start - launched) if start is not None and launched is not None else None,
+            'wall': _rounded(wall),
+            'cpu_user': _rounded(measurements.get('cpu_user')),
+            'cpu_system': _rounded(measurements.get('cpu_system')),
+            'peak_rss': measurements.get('peak_rss'),
+            'bytes_read': measurements.get('bytes_read'),
+            'bytes_written': measurements.get('bytes_written'),
+            'input_bytes': input_bytes(blueprint['inputs']),
+            'io_wait': _rounded(samples[IO_BOUND] * self._sample_interval) if samples else None,
+            'bound': bound,
+            'fused_with': task_blueprint['id'] if task_blueprint is not None else None
+        }
+        if self._history is not None and not failed and wall is not None:
+            self._history.add(blueprint, wall, record['input_bytes'])
+        if self._on_record is not None:
+            self._on_record(record)
+        with self._recorded:
+            if not self._metrics_file.closed:  # Apps can still finish after an aborted run is wrapped up
+                self._metrics_file.write(json.dumps(record, separators=(',', ':')) + '\n')
+            summary = self._summary[record['name']]
+            summary['apps'] += 1
+            summary[bound] += 1
+            summary['wall'] += wall or 0
+            if task_blueprint is None or task_blueprint['id'] == blueprint['id']:
+                summary['bytes_read'] += record['bytes_read'] or 0  # A fused task's bytes are counted once
+                summary['bytes_written'] += record['bytes_written'] or 0
+            self._pending.pop(blueprint['id'], None)
+            self._recorded.notify_all()
+
+    def log_summary(self):
+        """
+        Logs how many apps of each step were held back by CPU, by I/O, and by waiting on anything
+        else, and how much they read and wrote, steps whose apps ran longest in total first.
+        """
+        if not self._summary:
+            return
+        logger.info('What held apps back, by program:')
+        for name, summary in sorted(self._summary.items(), key=lambda item: -item[1]['wall']):
+            logger.info('{}: {} apps, {} CPU-bound, {} I/O-bound, {} wait-bound, {} unknown; '
+                        'read {}, wrote {}, ran {} in total'.format(
+                            name, summary['apps'], summary[CPU_BOUND], summary[IO_BOUND], summary[WAIT_BOUND],
+                            summary[None], format_size(summary['bytes_read']),
+                            format_size(summary['bytes_written']), format_duration(summary['wall'])
+                        ))
+
+    def close(self):
+        """
+        Waits for the records of apps that are done to be written, since the last of them can be
+        seen as done before their record is, then logs the summary, closes the file, and saves the
+        durations of this run to the run history.
+        """
+        with self._recorded:
+            self._recorded.wait_for(lambda: not any(fut.done() for fut in list(self._pending.values())),
+                                    timeout=CLOSE_TIMEOUT)
+            if self._sampler is not None:
+                self._sampler.stop()
+            self.log_summary()
+            self._metrics_file.close()
+        if self._history is not None:
+            self._history.save()
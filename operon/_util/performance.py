@@ -0,0 +1,195 @@
+import json
+import logging
+
+import networkx as nx
+
+from operon._util.scheduling import app_graph, format_duration
+
+# How many apps are listed for each of the longest running, longest waiting, and most slack
+TOP_APPS = 5
+
+# Parallelism over time is given as the average of this many equal stretches of the run
+PARALLELISM_STRETCHES = 10
+
+# At most this many steps of the realized critical path are listed, those that took longest
+MAX_PATH_STEPS_LOGGED = 20
+
+# The run is said to have kept its slots busy below this much idle time
+BUSY_IDLE_FRACTION = 0.2
+
+# The run is said to have been held up by its critical path above this share of the run time
+PATH_BOUND_FRACTION = 0.8
+
+logger = logging.getLogger('operon.main')
+
+
+def read_records(metrics_path):
+    """
+    :param metrics_path: str JSONL file of app records, see RunMetrics
+    :return: dict<str, dict> Record of each app by app ID, the last one where an app has several
+    """
+    records = dict()
+    try:
+        with open(metrics_path) as metrics_file:
+            for line in metrics_file:
+                record = json.loads(line)
+                records[record['app']] = record
+    except (OSError, ValueError) as e:
+        logger.warning('Could not read app metrics from {}: {}'.format(metrics_path, e))
+    return records
+
+
+class RunPerformance(object):
+    """
+    How well a finished run used its slots, and what held it up.
+
+    Each app that ran is taken from when it was ready to run, its dependencies done, through
+    when it started and ended. Start and end are the app's own measurements where its record has
+    them, otherwise the start is when Parsl launched it, so its wait for a slot can't be told apart
+    from its run. Apps that ran as one fused task count once towards how many were running.
+
+    The realized critical path is found by walking back from the app that ended last, each time to
+    the dependency that ended last, since that's the one it was waiting on. Each step contributed
+    its wait, from when that dependency ended, or the run started, until it started, and its run.
+    The slack of an app is how much later it could have ended without the run ending any later,
+    had every app after it taken as long to run and started as soon as its dependencies were done.
+    """
+    def __init__(self, workflow_graph, app_times, run_start, run_end, slots=None, records=None):
+        """
+        :param workflow_graph: nx.DiGraph Directed graph representation of the workflow
+        :param app_times: dict<str, (float, float)> When each app was launched and finished, in
+                          seconds since the epoch, see AppStateTracker
+        :param run_start: float When the run started, in seconds since the epoch
+        :param run_end: float When the run ended, in seconds since the epoch
+        :param slots: int Number of apps that could run at once, if known
+        :param records: dict<str, dict> Record of each app by app ID, see read_records()
+        """
+        records = records or dict()
+        self.run_start, self.run_end = run_start, run_end
+        self.elapsed = max(run_end - run_start, 0)
+        self.slots = slots or None
+
+        # When each app was ready, started, and ended
+        self.apps, tasks = dict(), dict()
+        for app_id in sorted(set(app_times) | set(records)):
+            launched, finished = app_times.get(app_id, (None, None))
+            record = records.get(app_id) or dict()
+            if record.get('start') is not None and record.get('end') is not None:
+                ready = record['launch'] if record.get('launch') is not None else launched
+                start, end = record['start'], record['end']
+            elif launched is not None and finished is not None:
+                ready, start, end = None, launched, finished
+            else:
+                continue
+            self.apps[app_id] = {'ready': ready, 'start': start, 'end': end, 'wall': end - start,
+                                 'queue_wait': max(start - ready, 0) if ready is not None else None}
+            tasks[record.get('fused_with') or app_id] = (start, end)
+
+        self._parallelism(list(tasks.values()))
+        self._critical_path(app_graph(workflow_graph))
+
+    def _parallelism(self, intervals):
+        """
+        Sets the time apps were running for, on average and at most at once, and over each stretch of the run.
+        """
+        intervals = [(max(start, self.run_start), min(end, self.run_end)) for start, end in intervals]
+        intervals = [(start, end) for start, end in intervals if end > start]
+        self.busy = sum(end - start for start, end in intervals)
+        self.average_parallelism = self.busy / self.elapsed if self.elapsed else 0
+        self.idle_fraction = (max(1 - self.average_parallelism / self.slots, 0)
+                              if self.slots and self.elapsed else None)
+
+        self.peak_parallelism, running = 0, 0
+        for _, change in sorted([(start, 1) for start, _ in intervals] + [(end, -1) for _, end in intervals]):
+            running += change
+            self.peak_parallelism = max(self.peak_parallelism, running)
+
+        self.parallelism_over_time = list()
+        if not self.elapsed:
+            return
+        stretch = self.elapsed / PARALLELISM_STRETCHES
+        for i in range(PARALLELISM_STRETCHES):
+            stretch_start = self.run_start + i * stretch
+            stretch_end = stretch_start + stretch
+            busy = sum(max(min(end, stretch_end) - max(start, stretch_start), 0) for start, end in intervals)
+            self.parallelism_over_time.append((i * stretch, busy / stretch))
+
+    def _critical_path(self, apps):
+        """
+        Sets the realized critical path, as (app ID, wait, run) of each step in order, and the slack of each app.
+        """
+        ran = apps.subgraph(self.apps)
+        self.critical_path = list()
+        app_id = max(self.apps, key=lambda app: self.apps[app]['end'], default=None)
+        while app_id is not None:
+            gate = max(ran.predecessors(app_id), key=lambda app: self.apps[app]['end'], default=None)
+            waited_from = self.apps[gate]['end'] if gate is not None else self.run_start
+            self.critical_path.append((app_id, max(self.apps[app_id]['start'] - waited_from, 0),
+                                       self.apps[app_id]['wall']))
+            app_id = gate
+        self.critical_path.reverse()
+
+        latest_end = dict()
+        for app_id in reversed(list(nx.topological_sort(ran))):
+            latest_end[app_id] = min((latest_end[successor] - self.apps[successor]['wall']
+                                      for successor in ran.successors(app_id)), default=self.run_end)
+        self.slack = {app_id: max(latest_end[app_id] - self.apps[app_id]['end'], 0) for app_id in self.apps}
+
+    def summary_lines(self, top=TOP_APPS):
+        """
+        :param top: int How many apps to list for each of the longest running, longest waiting, and most slack
+        :return: list<str> Summary for a person to read
+        """
+        if not self.apps:
+            return ['Performance summary: no apps ran']
+        lines = ['Performance summary:']
+        lines.append('Parallelism: {:.1f} apps running on average, {} at most{}'.format(
+            self.average_parallelism, self.peak_parallelism,
+            ', of {} slots; slots idle {:.0f}% of the time'.format(self.slots, self.idle_fraction * 100)
+            if self.idle_fraction is not None else ''
+        ))
+        if self.parallelism_over_time:
+            lines.append('Parallelism over time: {}'.format('  '.join(
+                '{} {:.1f}'.format(format_duration(offset), parallelism)
+                for offset, parallelism in self.parallelism_over_time
+            )))
+
+        path_wait = sum(wait for _, wait, _ in self.critical_path)
+        path_run = sum(run for _, _, run in self.critical_path)
+        path_length = path_wait + path_run
+        lines.append('Realized critical path is {} apps long and took {}, {} running and {} waiting:'.format(
+            len(self.critical_path), format_duration(path_length), format_duration(path_run),
+            format_duration(path_wait)
+        ))
+        steps = sorted(self.critical_path, key=lambda step: -(step[1] + step[2]))[:MAX_PATH_STEPS_LOGGED]
+        listed = {app_id for app_id, _, _ in steps}
+        for app_id, wait, run in self.critical_path:
+            if app_id in listed:
+                lines.append('\t{}: waited {}, ran {} ({:.0f}% of the run)'.format(
+                    app_id, format_duration(wait), format_duration(run),
+                    (wait + run) / self.elapsed * 100 if self.elapsed else 0
+                ))
+        if len(self.critical_path) > len(steps):
+            lines.append('\t... and {} shorter steps'.format(len(self.critical_path) - len(steps)))
+
+        def top_apps(key):
+            ranked = sorted((app_id for app_id in self.apps if key(app_id) is not None), key=lambda app: -key(app))
+            return '  '.join('{} {}'.format(app_id, format_duration(key(app_id))) for app_id in ranked[:top])
+
+        lines.append('Longest running apps: {}'.format(top_apps(lambda app: self.apps[app]['wall'])))
+        if any(app['queue_wait'] for app in self.apps.values()):
+            lines.append('Longest waiting apps: {}'.format(top_apps(lambda app: self.apps[app]['queue_wait'])))
+        lines.append('Apps with the most slack: {}'.format(top_apps(self.slack.get)))
+
+        if self.idle_fraction is not None and self.idle_fraction < BUSY_IDLE_FRACTION:
+            lines.append('Slots were kept busy, so more of them would likely shorten the run')
+        elif self.elapsed and path_length >= PATH_BOUND_FRACTION * self.elapsed and path_run >= path_wait:
+            lines.append('The run was held up by its critical path, so more slots would shorten it little')
+        elif self.elapsed and path_wait > path_run:
+            lines.append('Apps on the critical path waited longer than they ran, so they may need to be '
+                         'started sooner or given slots of their own')
+        return lines
+
+    def log(self, top=TOP_APPS):
+        for line in self.summary_lines(top):
+            logger.info(line)
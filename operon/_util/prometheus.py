@@ -0,0 +1,240 @@
+import os
+import time
+import logging
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+from operon.hooks import AppHook
+
+# Upper bounds of the buckets of each histogram, in seconds
+QUEUE_WAIT_BUCKETS = (0.1, 1, 5, 30, 60, 300, 900, 1800, 3600, 4 * 3600)
+DURATION_BUCKETS = (1, 10, 30, 60, 300, 900, 1800, 3600, 4 * 3600, 12 * 3600, 24 * 3600)
+
+# Seconds between writes of the textfile
+TEXTFILE_INTERVAL = 15
+
+PENDING, RUNNING = 'pending', 'running'
+
+logger = logging.getLogger('operon.main')
+
+
+def _label_value(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(labels):
+    return '{{{}}}'.format(','.join('{}="{}"'.format(name, _label_value(value)) for name, value in labels))
+
+
+class _Histogram(object):
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, upper_bound in enumerate(self.buckets):
+            if value <= upper_bound:
+                self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+
+    def lines(self, name, labels):
+        for upper_bound, count in zip(self.buckets, self.counts):
+            yield '{}_bucket{} {}'.format(name, _labels(labels + (('le', upper_bound),)), count)
+        yield '{}_bucket{} {}'.format(name, _labels(labels + (('le', '+Inf'),)), self.count)
+        yield '{}_sum{} {}'.format(name, _labels(labels), self.sum)
+        yield '{}_count{} {}'.format(name, _labels(labels), self.count)
+
+
+class PrometheusExporter(AppHook):
+    """
+    Keeps run-level metrics in the Prometheus text format, served over HTTP on localhost and
+    written to a file a node_exporter textfile collector picks up, or both.
+
+    Apps pending and running are gauges and apps completed and failed are counters, each by
+    executor. How long apps waited for a slot once launched and how long they ran are histograms,
+    fed from the records of RunMetrics. Temporary files are looked at each time the metrics are
+    rendered, and when the last app finished is there to alert on a run that has stalled. Every
+    metric is labelled with the pipeline and run name, so several runs on one host can share a
+    textfile directory.
+
+    App states are followed as an AppHook, so they're updated from the hook thread rather than
+    the run's own.
+    """
+    def __init__(self, pipeline, run_name, port=None, textfile=None, textfile_interval=TEXTFILE_INTERVAL):
+        """
+        :param pipeline: str Name of the pipeline
+        :param run_name: str Name of the run
+        :param port: int Port to serve metrics on at 127.0.0.1, if any
+        :param textfile: str File to write metrics to, if any; it should end in .prom for node_exporter
+        :param textfile_interval: float Seconds between writes of the textfile
+        """
+        self._labels = (('pipeline', pipeline), ('run', run_name))
+        self._textfile = textfile
+        self._textfile_interval = textfile_interval
+        self._lock = threading.Lock()
+        self._states = dict()  # State and executor of each app submitted and not yet done, by app ID
+        self._in_state = Counter()  # Apps by (state, executor)
+        self._completed, self._failed = Counter(), Counter()  # Apps by executor
+        self._queue_wait = _Histogram(QUEUE_WAIT_BUCKETS)
+        self._duration = _Histogram(DURATION_BUCKETS)
+        self._tmp_files = dict()  # Whether each temporary file has been seen to exist, by path
+        self._started = time.time()
+        self._last_finished = None
+
+        self._stop = threading.Event()
+        self._server = None
+        if port is not None:
+            try:
+                self._server = _ThreadingHTTPServer(('127.0.0.1', port), _metrics_handler(self))
+            except OSError as e:
+                logger.warning('Could not serve Prometheus metrics on port {}: {}'.format(port, e))
+            else:
+                threading.Thread(target=self._server.serve_forever, name='operon-prometheus', daemon=True).start()
+                logger.info('Serving Prometheus metrics at http://127.0.0.1:{}/metrics'.format(
+                    self._server.server_port
+                ))
+        if textfile is not None:
+            threading.Thread(target=self._write_periodically, name='operon-prometheus-textfile', daemon=True).start()
+
+    def add_tmp_files(self, paths):
+        """
+        :param paths: iterable<str> Temporary files of the run, whether they exist yet or not
+        """
+        with self._lock:
+            self._tmp_files.update((path, False) for path in paths if path not in self._tmp_files)
+
+    def observe(self, record):
+        """
+        Adds an app's queue wait and wall time to the histograms, as a listener of RunMetrics.
+        :param record: dict Record of an app, see RunMetrics
+        """
+        with self._lock:
+            if record['queue_wait'] is not None:
+                self._queue_wait.observe(max(0.0, record['queue_wait']))
+            if record['wall'] is not None:
+                self._duration.observe(record['wall'])
+
+    def _move(self, app_id, new_state, executor=None):
+        old_state, old_executor = self._states.pop(app_id, (None, executor))
+        if old_state is not None:
+            self._in_state[(old_state, old_executor)] -= 1
+        if new_state is not None:
+            self._states[app_id] = (new_state, old_executor)
+            self._in_state[(new_state, old_executor)] += 1
+        return old_executor
+
+    def app_submitted(self, event):
+        with self._lock:
+            self._move(event.app_id, PENDING, event.executor)
+
+    def app_launched(self, event):
+        with self._lock:
+            self._move(event.app_id, RUNNING, event.executor)
+
+    def app_finished(self, event):
+        with self._lock:
+            self._completed[self._move(event.app_id, None, event.executor)] += 1
+            self._last_finished = event.time
+
+    def app_failed(self, event):
+        with self._lock:
+            self._failed[self._move(event.app_id, None, event.executor)] += 1
+            self._last_finished = event.time
+
+    def _tmp_bytes(self):
+        tmp_bytes = 0
+        for path, seen in list(self._tmp_files.items()):
+            try:
+                tmp_bytes += os.path.getsize(path)
+                self._tmp_files[path] = True
+            except OSError:
+                if seen:
+                    del self._tmp_files[path]  # Removed, and won't be back
+        return tmp_bytes
+
+    def render(self):
+        """
+        :return: str Every metric in the Prometheus text exposition format
+        """
+        with self._lock:
+            lines = list()
+
+            def metric(name, metric_type, help_text, samples):
+                lines.append('# HELP {} {}'.format(name, help_text))
+                lines.append('# TYPE {} {}'.format(name, metric_type))
+                for labels, value in samples:
+                    lines.append('{}{} {}'.format(name, _labels(self._labels + labels), value))
+
+            executors = sorted({executor for _, executor in self._in_state} | set(self._completed) |
+                               set(self._failed), key=str)
+            metric('operon_apps', 'gauge', 'Apps submitted to Parsl and not yet done, by state.', [
+                ((('state', state), ('executor', executor)), self._in_state[(state, executor)])
+                for state in (PENDING, RUNNING) for executor in executors
+            ])
+            metric('operon_apps_completed_total', 'counter', 'Apps that completed.', [
+                ((('executor', executor),), self._completed[executor]) for executor in executors
+            ])
+            metric('operon_apps_failed_total', 'counter', 'Apps that failed, or had a dependency fail.', [
+                ((('executor', executor),), self._failed[executor]) for executor in executors
+            ])
+            for name, histogram, help_text in (
+                    ('operon_app_queue_wait_seconds', self._queue_wait,
+                     'Time apps waited to start once their dependencies were done.'),
+                    ('operon_app_duration_seconds', self._duration, 'Time apps ran.')):
+                lines.append('# HELP {} {}'.format(name, help_text))
+                lines.append('# TYPE {} histogram'.format(name))
+                lines.extend(histogram.lines(name, self._labels))
+            metric('operon_tmp_bytes', 'gauge', 'Bytes of temporary files on disk.', [((), self._tmp_bytes())])
+            metric('operon_run_start_timestamp_seconds', 'gauge', 'When the run started.', [((), self._started)])
+            if self._last_finished is not None:
+                metric('operon_last_app_done_timestamp_seconds', 'gauge', 'When the last app finished or failed.',
+                       [((), self._last_finished)])
+            return '\n'.join(lines) + '\n'
+
+    def write_textfile(self):
+        """
+        Writes the metrics next to the textfile and moves them into place, so the collector never
+        reads a partial file.
+        """
+        try:
+            with open(self._textfile + '.partial', 'w') as textfile:
+                textfile.write(self.render())
+            os.replace(self._textfile + '.partial', self._textfile)
+        except OSError as e:
+            logger.warning('Could not write Prometheus metrics to {}: {}'.format(self._textfile, e))
+
+    def _write_periodically(self):
+        while not self._stop.wait(self._textfile_interval):
+            self.write_textfile()
+
+    def run_finished(self):
+        self._stop.set()
+        if self._textfile is not None:
+            self.write_textfile()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def _metrics_handler(exporter):
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = exporter.render().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass  # Scrapes are not worth a line each on stderr
+    return MetricsHandler
@@ -0,0 +1,598 @@
+import os
+import re
+import heapq
+import logging
+import itertools
+import threading
+from collections import Counter
+from concurrent.futures import Future
+from datetime import timedelta
+from functools import partial
+from statistics import median
+
+import networkx as nx
+from networkx.algorithms import bipartite
+from parsl.executors.threads import ThreadPoolExecutor
+from parsl.executors.ipp import IPyParallelExecutor
+
+from operon._util.cache import parse_size, format_size
+from operon._util.errors import MalformedPipelineError
+from operon._util.tracking import attempt_failed
+from operon.meta import Meta, _MetaExecutorDynamic
+
+DURATION_UNITS = {'': 1, 'S': 1, 'M': 60, 'H': 60 * 60, 'D': 24 * 60 * 60}
+
+# At most this many apps are named when the critical path is logged
+MAX_PATH_NAMES_LOGGED = 20
+
+# At most this many waiting apps that don't fit are looked past each time an app finishes
+MAX_WAITING_SCANNED = 1000
+
+# The exact maximum antichain is only found for workflows of up to this many apps, since it needs
+# every pair of apps that depend on each other
+MAX_ANTICHAIN_APPS = 500
+
+# A config with this many times more, or fewer, slots than the workflow can use is warned about
+WIDTH_MISMATCH_FACTOR = 2
+
+logger = logging.getLogger('operon.main')
+
+
+def parse_duration(duration):
+    """
+    Converts a human readable duration such as 90s, 15m, or 2.5h into seconds.
+    :param duration: str|int|float Duration, optionally suffixed with s, m, h, or d
+    :return: float Duration in seconds
+    """
+    match = re.match(r'^\s*(\d+(?:\.\d+)?)\s*([SMHD]?)\s*$', str(duration).upper())
+    if match is None:
+        raise ValueError('Could not interpret {} as a duration'.format(duration))
+    return float(match.group(1)) * DURATION_UNITS[match.group(2)]
+
+
+def format_duration(seconds):
+    return str(timedelta(seconds=round(seconds)))
+
+
+def app_name(blueprint):
+    """
+    :return: str What apps doing the same work have in common: the program of a bash app, or the
+             function of a python app
+    """
+    if blueprint['type'] == 'bash':
+        return blueprint['name']
+    return blueprint['func'].__name__
+
+
+def step_name(blueprint):
+    """
+    :return: str What apps of the same step have in common, in the run history and metrics: the
+             basename of the executable of a bash app, with its subprogram if it has one, or the
+             function of a python app. The action= a bash app was registered with is only for
+             display, since it often names the sample, so it doesn't count.
+    """
+    if blueprint['type'] == 'bash':
+        return blueprint.get('step') or blueprint['id'].rsplit('_', 1)[0]
+    return app_name(blueprint)
+
+
+def executor_slots(parsl_config):
+    """
+    :return: dict<str, int> Number of apps each executor can run at once, for executors where
+             that's known up front
+    """
+    return {
+        executor.label: executor.max_threads
+        for executor in parsl_config.executors
+        if isinstance(executor, ThreadPoolExecutor)
+    }
+
+
+def host_resources():
+    """
+    :return: (int, int) CPUs this process may run on, and bytes of memory available when the run
+             starts, or None if that can't be told
+    """
+    try:
+        cpu = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpu = os.cpu_count() or 1
+    mem = None
+    try:
+        with open('/proc/meminfo') as meminfo:
+            for line in meminfo:
+                if line.startswith('MemAvailable:'):
+                    mem = int(line.split()[1]) * 1024
+                    break
+    except OSError:
+        pass
+    return cpu, mem
+
+
+def app_executor(meta):
+    """
+    :param meta: dict Meta of an app
+    :return: str Label of the executor the app is assigned to, or None if it can run on any
+    """
+    return meta.get('executor', meta.get('site', Meta._default_executor))
+
+
+def app_resources(meta, default_cpu=1):
+    """
+    Reads the resources an app needs from its meta, or if it doesn't declare any, from the Meta
+    definition of the executor it's assigned to. Resources given as Meta.dynamic() are ignored.
+    :param meta: dict Meta of the app
+    :param default_cpu: int CPUs of an app that doesn't declare any
+    :return: (int, int) CPUs and bytes of memory
+    """
+    resources = meta.get('resources')
+    if resources is None:
+        resources = Meta._executors.get(app_executor(meta)) or dict()
+    cpu, mem = resources.get('cpu'), resources.get('mem')
+    try:
+        cpu = default_cpu if cpu is None or isinstance(cpu, _MetaExecutorDynamic) else max(1, int(float(cpu)))
+        mem = 0 if mem is None or isinstance(mem, _MetaExecutorDynamic) else parse_size(mem)
+    except ValueError:
+        raise MalformedPipelineError('Could not interpret resources {}'.format(resources))
+    return cpu, mem
+
+
+def app_graph(workflow_graph):
+    """
+    :param workflow_graph: nx.DiGraph Directed graph representation of the workflow
+    :return: nx.DiGraph Graph of only the apps, with an edge wherever one app has to finish before another
+    """
+    apps = nx.DiGraph()
+    apps.add_nodes_from(node for node, node_type in workflow_graph.nodes(data='type') if node_type == 'app')
+    for app_id in list(apps):
+        for successor in workflow_graph.successors(app_id):
+            if successor in apps:
+                apps.add_edge(app_id, successor)
+            else:
+                apps.add_edges_from((app_id, consumer) for consumer in workflow_graph.successors(successor))
+    return apps
+
+
+def executor_tasks(workflow_graph, groups=()):
+    """
+    :param workflow_graph: nx.DiGraph Directed graph representation of the workflow
+    :param groups: iterable<dict<str, tuple<str>>> Apps submitted together as a single task, as
+                   planned by linear_chains() or sibling_batches()
+    :return: Counter<str> Number of Parsl tasks each executor is given, with None for apps that
+             can run on any executor
+    """
+    grouped = dict()
+    for group in groups:
+        grouped.update(group)
+    tasks = Counter()
+    for node, node_data in workflow_graph.nodes(data=True):
+        if node_data.get('type') != 'app':
+            continue
+        if node not in grouped or grouped[node][0] == node:
+            tasks[app_executor(node_data['blueprint']['meta'] or dict())] += 1
+    return tasks
+
+
+class WorkflowWidth(object):
+    """
+    How many apps of a workflow could ever be running at the same time.
+
+    Apps are given a depth, the number of apps on the longest chain leading up to them, and the
+    profile is how many apps there are at each depth. Apps at the same depth never depend on each
+    other, so the widest depth is a lower bound on the maximum antichain: the largest set of apps
+    none of which depends on another. If asked for, and for workflows of up to MAX_ANTICHAIN_APPS
+    apps, the maximum antichain is found exactly, as the number of apps left over by a maximum
+    matching between apps and the apps that depend on them (Dilworth's theorem). That needs the
+    transitive closure of the workflow, so it's only worth it when executors are sized to fit.
+    """
+    def __init__(self, workflow_graph, exact=False):
+        """
+        :param workflow_graph: nx.DiGraph Directed graph representation of the workflow
+        :param exact: bool Find the maximum antichain exactly, if the workflow is small enough
+        """
+        apps = app_graph(workflow_graph)
+        depths = dict()
+        for app_id in nx.topological_sort(apps):
+            depths[app_id] = max((depths[p] + 1 for p in apps.predecessors(app_id)), default=0)
+        self.profile = [0] * (max(depths.values(), default=-1) + 1)
+        for depth in depths.values():
+            self.profile[depth] += 1
+
+        self.max_antichain = None
+        if exact and len(apps) <= MAX_ANTICHAIN_APPS:
+            reachable = nx.transitive_closure(apps)
+            chain_links = nx.Graph()
+            chain_links.add_nodes_from((app_id, 0) for app_id in apps)
+            chain_links.add_nodes_from((app_id, 1) for app_id in apps)
+            chain_links.add_edges_from(((source, 0), (target, 1)) for source, target in reachable.edges)
+            matching = bipartite.hopcroft_karp_matching(chain_links, top_nodes=[(app_id, 0) for app_id in apps])
+            self.max_antichain = len(apps) - len(matching) // 2
+        self.width = self.max_antichain if self.max_antichain is not None else max(self.profile, default=0)
+
+    def log(self):
+        profile = ' '.join(map(str, self.profile[:MAX_PATH_NAMES_LOGGED]))
+        if len(self.profile) > MAX_PATH_NAMES_LOGGED:
+            profile += ' and {} more'.format(len(self.profile) - MAX_PATH_NAMES_LOGGED)
+        logger.info('At most {}{} apps can run at once; apps at each depth: {}'.format(
+            '' if self.max_antichain is not None else 'about ', self.width, profile
+        ))
+
+
+def _workers_per_block(provider):
+    return (getattr(provider, 'nodes_per_block', 1) or 1) * (getattr(provider, 'tasks_per_node', 1) or 1)
+
+
+def config_slots(parsl_config):
+    """
+    :return: int Number of apps every executor of the config can run at once when fully scaled out
+    """
+    slots = 0
+    for executor in parsl_config.executors:
+        if isinstance(executor, ThreadPoolExecutor):
+            slots += executor.max_threads
+        elif isinstance(executor, IPyParallelExecutor) and executor.provider is not None:
+            slots += (getattr(executor.provider, 'max_blocks', 1) or 1) * _workers_per_block(executor.provider)
+    return slots
+
+
+def size_executors(parsl_config, width, first_depth_width=None):
+    """
+    Sizes every executor of a config to the parallelism the workflow can use: thread pools get one
+    thread per app that can run at once, and providers get as many blocks as those apps need, with
+    enough to start the first apps right away. Each executor is sized as if it were the only one,
+    since apps can be assigned to any of them.
+    :param parsl_config: parsl.config.Config Config to size, before it's loaded
+    :param width: int Most apps that can run at once
+    :param first_depth_width: int Apps that can start right away, if not width
+    """
+    width = max(1, width)
+    first_depth_width = min(width, first_depth_width or width)
+    for executor in parsl_config.executors:
+        if isinstance(executor, ThreadPoolExecutor):
+            executor.max_threads = width
+            logger.info('Sized executor {} to {} threads'.format(executor.label, width))
+        elif isinstance(executor, IPyParallelExecutor) and hasattr(executor.provider, 'max_blocks'):
+            workers_per_block = _workers_per_block(executor.provider)
+            executor.provider.max_blocks = -(-width // workers_per_block)
+            executor.provider.init_blocks = min(
+                executor.provider.max_blocks,
+                max(getattr(executor.provider, 'min_blocks', 0) or 0, -(-first_depth_width // workers_per_block))
+            )
+            logger.info('Sized executor {} to {} blocks, starting with {}'.format(
+                executor.label, executor.provider.max_blocks, executor.provider.init_blocks
+            ))
+
+
+def warn_on_width_mismatch(parsl_config, width):
+    slots = config_slots(parsl_config)
+    if not slots or not width:
+        return
+    if slots >= width * WIDTH_MISMATCH_FACTOR:
+        logger.warning('Parsl config can run {} apps at once, but this workflow can never run more than {}; '
+                       'resources beyond that will sit idle'.format(slots, width))
+    elif slots * WIDTH_MISMATCH_FACTOR <= width:
+        logger.warning('Parsl config can only run {} apps at once, but this workflow could run up to {}'.format(
+            slots, width
+        ))
+
+
+class CriticalPath(object):
+    """
+    Scores every node of a workflow graph with the length of the longest path from it to the end
+    of the workflow, counting the expected runtime of each app along the way. Apps on the critical
+    path score highest, and starting them first is what keeps a run from being stretched by apps
+    that had to wait for a slot.
+
+    The expected runtime of an app is its meta['runtime'] hint if it has one, otherwise what the
+    run history predicts for it, see RunHistory. Apps with neither count as the median
+    of the apps that do; if no app has an estimate, every app counts as 1 and the critical path is
+    simply the longest chain of apps.
+    """
+    def __init__(self, workflow_graph, history=None):
+        """
+        :param workflow_graph: nx.DiGraph Directed graph representation of the workflow
+        :param history: dict<str, float> Seconds each app is expected to take based on earlier runs, by app ID
+        """
+        history = history or dict()
+        estimates = dict()
+        for node, node_data in workflow_graph.nodes(data=True):
+            if node_data.get('type') != 'app':
+                continue
+            blueprint = node_data['blueprint']
+            runtime = blueprint['meta'].get('runtime')
+            if runtime is not None:
+                estimates[node] = parse_duration(runtime)
+            elif node in history:
+                estimates[node] = history[node]
+            else:
+                estimates[node] = None
+
+        known_estimates = [e for e in estimates.values() if e is not None]
+        self.estimated = bool(known_estimates)
+        default_estimate = median(known_estimates) if known_estimates else 1.0
+        self.estimates = {
+            node: default_estimate if estimate is None else estimate
+            for node, estimate in estimates.items()
+        }
+        self.total_work = sum(self.estimates.values())
+
+        # Walk the graph from its sinks back to its sources, remembering the longest way out of each node
+        try:
+            topological_order = list(nx.topological_sort(workflow_graph))
+        except nx.NetworkXUnfeasible:
+            raise MalformedPipelineError('Workflow graph contains a cycle')
+        self.priorities, next_on_path = dict(), dict()
+        for node in reversed(topological_order):
+            best_successor = max(workflow_graph.successors(node), key=self.priorities.get, default=None)
+            self.priorities[node] = self.estimates.get(node, 0) + (
+                self.priorities[best_successor] if best_successor is not None else 0
+            )
+            next_on_path[node] = best_successor
+
+        self.path = list()
+        node = max(self.priorities, key=self.priorities.get, default=None)
+        while node is not None:
+            if node in self.estimates:
+                self.path.append(node)
+            node = next_on_path[node]
+        self.length = sum(self.estimates[app_id] for app_id in self.path)
+
+    def predicted_runtime(self, slots=None):
+        """
+        A run can't be shorter than its critical path, nor than its total work spread over every slot.
+        :param slots: int Number of apps that can run at once, if known
+        :return: float Predicted seconds the run will take
+        """
+        if not slots:
+            return self.length
+        return max(self.length, self.total_work / slots)
+
+    def log_plan(self, slots=None):
+        path_names = '  '.join(self.path[:MAX_PATH_NAMES_LOGGED])
+        if len(self.path) > MAX_PATH_NAMES_LOGGED:
+            path_names += '  and {} more'.format(len(self.path) - MAX_PATH_NAMES_LOGGED)
+        if not self.estimated:
+            logger.info('Critical path is {} apps long: {}'.format(len(self.path), path_names))
+            return
+        logger.info('Critical path is {} apps long and expected to take {}: {}'.format(
+            len(self.path), format_duration(self.length), path_names
+        ))
+        logger.info('Predicted run time {}'.format(format_duration(self.predicted_runtime(slots))))
+
+    def log_outcome(self, elapsed_seconds, slots=None):
+        if self.estimated:
+            logger.info('Predicted run time {}, actual run time {}'.format(
+                format_duration(self.predicted_runtime(slots)),
+                format_duration(elapsed_seconds)
+            ))
+
+
+def needs_release_gate(workflow_graph, workflow_width, slots, samples=1):
+    """
+    Whether holding apps back in a ReleaseGate changes anything: apps only wait for a slot when
+    more can run at once than a local executor has, and only wait for CPUs or memory when they
+    declare some.
+    :param workflow_width: WorkflowWidth How many apps of the workflow can run at once
+    :param slots: dict<str, int> Number of apps each local executor can run at once
+    :param samples: int How many copies of the workflow run at once
+    :return: bool
+    """
+    if not slots:
+        return False
+    if workflow_width.width * samples > min(slots.values()):
+        return True
+    return any(app_resources(node_data['blueprint']['meta'] or dict(), default_cpu=0) != (0, 0)
+               for _, node_data in workflow_graph.nodes(data=True) if node_data.get('type') == 'app')
+
+
+class _GatedFuture(Future):
+    """
+    Stand-in future the DataFlowKernel is given for an app in a ReleaseGate. Watchers of the app
+    are told it launched once the gate releases it to its executor, not when Parsl launched it
+    into the gate.
+    """
+    def __init__(self):
+        super().__init__()
+        self._released = False
+        self._release_callbacks = list()
+        self._release_lock = threading.Lock()
+
+    def add_release_callback(self, fn):
+        """
+        Calls fn() once the app is released to its executor, right away if it already was.
+        """
+        with self._release_lock:
+            if not self._released:
+                self._release_callbacks.append(fn)
+                return
+        fn()
+
+    def set_released(self):
+        with self._release_lock:
+            self._released = True
+            release_callbacks, self._release_callbacks = self._release_callbacks, list()
+        for fn in release_callbacks:
+            fn()
+
+
+class ReleaseGate(object):
+    """
+    Holds back launched apps until their executor has a free slot and this host has the CPUs and
+    memory they declared, then releases waiting apps highest priority first. Apps that declare no
+    CPUs or memory only need a slot, so without declared resources an executor runs as many apps
+    at once as it has workers, however many CPUs the host has.
+
+    Left to itself, Parsl hands every app to its executor the moment its dependencies are done, and
+    the executor runs them first come, first served; a short side branch that happened to become
+    ready first keeps a slot the critical path needed, and eight 16 thread aligners can be started
+    on a 16 CPU host at once. The gate wraps the submit() of each gated executor, so the
+    DataFlowKernel gets a stand-in future for every app it launches there. The app is only handed
+    to the executor once it fits, and the stand-in is resolved from the executor's future; only
+    then does Parsl see the app as done and launch what depends on it. Parsl counts an app as
+    running from the moment it enters the gate, so Operon only reports it launched once the
+    stand-in is released.
+
+    When the waiting app with the highest priority doesn't fit yet, smaller apps behind it that do
+    are released around it rather than leaving CPUs idle.
+
+    Only executors whose number of slots is known are gated, which are those running apps on this
+    host; apps on any other executor are launched as usual. needs_release_gate() tells whether a
+    run needs the gate at all.
+    """
+    def __init__(self, dfk, slots, host_resources=None):
+        """
+        :param dfk: DataFlowKernel Loaded Parsl DataFlowKernel to gate
+        :param slots: dict<str, int> Number of apps each executor can run at once
+        :param host_resources: (int, int) CPUs and bytes of memory gated apps share, or None to
+                               only limit the number of apps; memory can be None if it's unknown
+        """
+        self._slots = slots
+        self._host_resources = host_resources or (None, None)
+        self._free_cpu, self._free_mem = self._host_resources
+        self._running = Counter()
+        self._waiting = list()  # Heap of waiting apps
+        self._priorities = dict()
+        self._requirements = dict()
+        self._order = itertools.count()
+        self._lock = threading.Lock()
+        self._held_for_resources = set()  # Executors concurrency was lowered on, so it's only logged once
+
+        # The DataFlowKernel calls an executor's submit() from launch_task(), on the same thread,
+        # which is how the gate knows which task is being submitted
+        self._launching = threading.local()
+        self._launch_task = dfk.launch_task
+        dfk.launch_task = self._launch
+        self._submit = dict()
+        for executor_label in slots:
+            executor = dfk.executors[executor_label]
+            self._submit[executor_label] = executor.submit
+            executor.submit = partial(self._gated_submit, executor_label)
+
+    def prioritize(self, task_id, priority):
+        """
+        Sets the priority of a Parsl task, before it's submitted. Higher priorities are released first.
+        """
+        self._priorities[task_id] = priority
+
+    def require(self, task_id, cpu=0, mem=0):
+        """
+        Sets the resources a Parsl task declared, before it's submitted. A task asking for more than
+        the host has is given the whole host instead, so it can still run once nothing else is.
+        :param cpu: int Number of CPUs, 0 if the task didn't declare any
+        :param mem: int Bytes of memory, 0 if the task didn't declare any
+        """
+        host_cpu, host_mem = self._host_resources
+        if host_cpu is not None:
+            cpu = min(cpu, host_cpu)
+        if host_mem is not None:
+            mem = min(mem, host_mem)
+        if (cpu, mem) != (0, 0):
+            self._requirements[task_id] = (cpu, mem)
+
+    def _launch(self, task_id, executable, *args, **kwargs):
+        self._launching.task_id = task_id
+        return self._launch_task(task_id, executable, *args, **kwargs)
+
+    def _gated_submit(self, executor_label, executable, *args, **kwargs):
+        task_id = self._launching.task_id
+        stand_in = _GatedFuture()
+        with self._lock:
+            if self._fits(executor_label, task_id):
+                self._take(executor_label, task_id)
+                fits = True
+            else:
+                heapq.heappush(self._waiting, (
+                    -self._priorities.get(task_id, 0), next(self._order),
+                    executor_label, task_id, executable, args, kwargs, stand_in
+                ))
+                fits = False
+                self._log_held_for_resources(executor_label)
+        if fits:
+            self._release(executor_label, task_id, executable, args, kwargs, stand_in)
+        return stand_in
+
+    def _release(self, executor_label, task_id, executable, args, kwargs, stand_in):
+        stand_in.set_released()
+        exec_future = self._submit[executor_label](executable, *args, **kwargs)
+        exec_future.add_done_callback(partial(self._resolve, stand_in))
+        exec_future.add_done_callback(partial(self._finished, executor_label, task_id, stand_in))
+
+    def _log_held_for_resources(self, executor_label):
+        """
+        Logs, once per executor, that an app is waiting even though the executor has a free worker,
+        because the CPUs or memory apps declared are all taken.
+        """
+        if (self._running[executor_label] < self._slots[executor_label]
+                and executor_label not in self._held_for_resources):
+            self._held_for_resources.add(executor_label)
+            logger.info('Executor {} is running fewer than its {} apps at once, to fit the CPUs and memory apps '
+                        'declared into the {} CPUs and {} of memory of this host'.format(
+                            executor_label, self._slots[executor_label], self._host_resources[0],
+                            'an unknown amount' if self._host_resources[1] is None
+                            else format_size(self._host_resources[1])
+                        ))
+
+    def _fits(self, executor_label, task_id):
+        if self._running[executor_label] >= self._slots[executor_label]:
+            return False
+        cpu, mem = self._requirements.get(task_id, (0, 0))
+        return ((self._free_cpu is None or cpu <= self._free_cpu)
+                and (self._free_mem is None or mem <= self._free_mem))
+
+    def _take(self, executor_label, task_id):
+        cpu, mem = self._requirements.get(task_id, (0, 0))
+        self._running[executor_label] += 1
+        if self._free_cpu is not None:
+            self._free_cpu -= cpu
+        if self._free_mem is not None:
+            self._free_mem -= mem
+
+    def _give_back(self, executor_label, task_id):
+        cpu, mem = self._requirements.get(task_id, (0, 0))
+        self._running[executor_label] -= 1
+        if self._free_cpu is not None:
+            self._free_cpu += cpu
+        if self._free_mem is not None:
+            self._free_mem += mem
+
+    def _finished(self, executor_label, task_id, stand_in, exec_future):
+        # By now the stand-in is resolved, so Parsl has already launched any apps this one was
+        # holding up and they compete for the freed slot by priority too
+        with self._lock:
+            self._give_back(executor_label, task_id)
+        # A task that won't be retried doesn't need its priority or requirements anymore
+        if not attempt_failed(exec_future) or getattr(stand_in, 'retries_left', 0) <= 0:
+            self._priorities.pop(task_id, None)
+            self._requirements.pop(task_id, None)
+
+        for waiting_app in self._next_fitting():
+            self._release(*waiting_app)
+
+    def _next_fitting(self):
+        """
+        Takes every waiting app that fits in what's free now, highest priority first. Apps that
+        don't fit are skipped over, but only so many of them are looked at each time.
+        :return: list<tuple> Apps to release
+        """
+        fitting, skipped = list(), list()
+        with self._lock:
+            while self._waiting and len(skipped) < MAX_WAITING_SCANNED:
+                waiting_app = heapq.heappop(self._waiting)
+                executor_label, task_id = waiting_app[2:4]
+                if self._fits(executor_label, task_id):
+                    self._take(executor_label, task_id)
+                    fitting.append(waiting_app[2:])
+                else:
+                    skipped.append(waiting_app)
+            for waiting_app in skipped:
+                heapq.heappush(self._waiting, waiting_app)
+        return fitting
+
+    @staticmethod
+    def _resolve(stand_in, exec_future):
+        if exec_future.cancelled():
+            stand_in.cancel()
+        elif exec_future.exception() is not None:
+            stand_in.set_exception(exec_future.exception())
+        else:
+            stand_in.set_result(exec_future.result())
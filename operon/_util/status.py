@@ -0,0 +1,113 @@
+import os
+import json
+import time
+import logging
+import threading
+from collections import deque
+from socket import gethostname
+
+from operon._util.tracking import PENDING, RUNNING, COMPLETED, FAILED
+
+# Seconds between rewrites of the status file
+STATUS_INTERVAL = 10
+
+# Status files are named after their run, with this suffix
+STATUS_SUFFIX = '.status.json'
+
+# At most this many running apps are listed, longest running first, so the file stays small
+MAX_RUNNING_LISTED = 50
+
+# Throughput is measured over about this many seconds leading up to each snapshot
+THROUGHPUT_WINDOW = 600
+
+# At most this long is spent on closing, waiting for apps that are done to be seen as done
+CLOSE_TIMEOUT = 10
+
+logger = logging.getLogger('operon.main')
+
+
+def status_path(logs_dir, run_name):
+    return os.path.join(logs_dir, run_name + STATUS_SUFFIX)
+
+
+def read_status(path):
+    """
+    :return: dict Status snapshot written by a StatusWriter
+    """
+    with open(path) as status_file:
+        return json.load(status_file)
+
+
+class StatusWriter(object):
+    """
+    Rewrites a small JSON snapshot of a run every so often while it goes, and once more when it's
+    over, so its progress can be seen without reading the log.
+
+    The snapshot has how many apps are in each state, the running apps that have been running
+    longest with how long they've been at it, how many apps were done per minute over the last
+    THROUGHPUT_WINDOW seconds, and how long the apps not yet done should take at that rate. It's
+    written next to where it goes and moved into place, so a reader never sees a partial one.
+    """
+    def __init__(self, path, app_state_tracker, interval=STATUS_INTERVAL):
+        """
+        :param path: str File to write the snapshot to
+        :param app_state_tracker: AppStateTracker Tracker following the apps of the run
+        :param interval: float Seconds between snapshots
+        """
+        self.path = path
+        self._tracker = app_state_tracker
+        self._interval = interval
+        self._started = time.time()
+        self._done_over_time = deque([(self._started, 0)])  # (time, apps done) of recent snapshots
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._write_periodically, name='operon-status', daemon=True)
+        self._thread.start()
+
+    def snapshot(self, finished=False):
+        """
+        :param finished: bool Whether the run is over
+        :return: dict Status of the run right now
+        """
+        now = time.time()
+        counts, running = self._tracker.snapshot(MAX_RUNNING_LISTED)
+        done = counts[COMPLETED] + counts[FAILED]
+        self._done_over_time.append((now, done))
+        while len(self._done_over_time) > 2 and self._done_over_time[1][0] <= now - THROUGHPUT_WINDOW:
+            self._done_over_time.popleft()
+        window_start, done_at_window_start = self._done_over_time[0]
+        per_minute = (done - done_at_window_start) / (now - window_start) * 60 if now > window_start else None
+        not_done = counts[PENDING] + counts[RUNNING]
+        return {
+            'host': gethostname(),
+            'pid': os.getpid(),
+            'started': round(self._started, 3),
+            'updated': round(now, 3),
+            'interval': self._interval,
+            'finished': finished,
+            'apps': counts,
+            'running': [{'app': name, 'elapsed': round(now - launched, 1)} for name, launched in running],
+            'apps_per_minute': round(per_minute, 2) if per_minute is not None else None,
+            'remaining': (round(not_done / per_minute * 60) if per_minute else None) if not_done else 0
+        }
+
+    def write(self, finished=False):
+        try:
+            with open(self.path + '.partial', 'w') as status_file:
+                json.dump(self.snapshot(finished), status_file, separators=(',', ':'))
+            os.replace(self.path + '.partial', self.path)
+        except OSError as e:
+            logger.warning('Could not write run status to {}: {}'.format(self.path, e))
+
+    def _write_periodically(self):
+        self.write()
+        while not self._stop.wait(self._interval):
+            self.write()
+
+    def close(self):
+        """
+        Stops the periodic snapshots and writes one last one, marked finished.
+        """
+        self._stop.set()
+        self._thread.join()
+        self._tracker.wait_settled(CLOSE_TIMEOUT)
+        self.write(finished=True)
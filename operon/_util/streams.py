@@ -0,0 +1,164 @@
+import io
+import os
+import queue
+import logging
+import threading
+
+from operon._util.cache import parse_size, format_size
+from operon._util.tracking import watch_app_future
+
+CHUNK_SIZE = 64 * 1024
+STREAMS = ('stdout', 'stderr')
+
+logger = logging.getLogger('operon.main')
+
+
+class CapturedStreamLogger(object):
+    """
+    Copies the captured stdout and stderr of each app into the log file as soon as the app is
+    done, rather than all at once at the end of the run.
+
+    Streams are read and logged in chunks of at most CHUNK_SIZE bytes, so memory use doesn't
+    depend on how much an app writes. When a stream is larger than head_size + tail_size only
+    its beginning and end are logged, and the raw file is kept in keep_dir so the rest of it can
+    still be found.
+
+    Captured output only goes to the log file, never to the console.
+    """
+    def __init__(self, capture_dir, keep_dir, head_size='1M', tail_size='1M'):
+        """
+        :param capture_dir: str Directory un-Redirected streams are written to, as <app id>.stdout|stderr
+        :param keep_dir: str Directory to move truncated streams to, created only if needed
+        :param head_size: str|int How much of the start of each stream to log
+        :param tail_size: str|int How much of the end of each stream to log
+        """
+        self.capture_dir = capture_dir
+        self.keep_dir = keep_dir
+        self.head_size = parse_size(head_size)
+        self.tail_size = parse_size(tail_size)
+        self._logged = set()
+
+        # Logging happens on a separate thread so a finishing app never waits on file I/O
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._worker, daemon=True)
+        self._thread.start()
+
+    def log_when_done(self, app_id, app_future):
+        watch_app_future(app_future, on_done=lambda *_: self._queue.put(app_id))
+
+    def _worker(self):
+        while True:
+            app_id = self._queue.get()
+            if app_id is None:
+                break
+            self.log_app_streams(app_id)
+
+    def close(self):
+        """
+        Waits for queued apps to be logged, then logs any captured streams left in the capture
+        directory, such as those of apps that were still running when the run was aborted.
+        """
+        self._queue.put(None)
+        self._thread.join()
+        for captured_output in sorted(os.listdir(self.capture_dir)):
+            app_id, stream = os.path.splitext(captured_output)
+            if stream[1:] in STREAMS:
+                self.log_app_streams(app_id)
+
+    def log_app_streams(self, app_id):
+        if app_id in self._logged:
+            return
+        self._logged.add(app_id)
+        for stream in STREAMS:
+            capture_output_path = os.path.join(self.capture_dir, '{}.{}'.format(app_id, stream))
+            try:
+                self._log_stream(app_id, stream, capture_output_path)
+            except OSError:
+                log_to_file(logging.DEBUG, 'Output from {stream} of {app_name} could not be retrieved'.format(
+                    stream=stream,
+                    app_name=app_id
+                ))
+
+    def _log_stream(self, app_id, stream, capture_output_path):
+        if not os.path.exists(capture_output_path):
+            return
+        stream_size = os.path.getsize(capture_output_path)
+        if stream_size == 0:
+            return
+
+        truncated = stream_size > self.head_size + self.tail_size
+        with open(capture_output_path, 'rb') as captured_bytes:
+            captured_output = io.TextIOWrapper(captured_bytes, errors='replace')
+            chunks = read_chunks(captured_output, limit=self.head_size if truncated else None)
+            self._log_chunks(app_id, stream, chunks)
+            # Hands the file back without closing it, so the tail can be read from a byte offset
+            captured_output.detach()
+            if not truncated:
+                return
+
+            kept_path = os.path.join(self.keep_dir, os.path.basename(capture_output_path))
+            os.makedirs(self.keep_dir, exist_ok=True)
+            os.rename(capture_output_path, kept_path)  # Open file stays readable after the move
+            log_to_file(logging.DEBUG, '[{omitted} of {stream} from {app_name} omitted, full output is in {path}]'.format(
+                omitted=format_size(stream_size - self.head_size - self.tail_size),
+                stream=stream,
+                app_name=app_id,
+                path=kept_path
+            ))
+            # Starting a byte early means the first readline() skips only a partial line, never a whole one,
+            # and a character cut in half there goes with it
+            captured_bytes.seek(stream_size - self.tail_size - 1)
+            captured_bytes.readline()
+            captured_output = io.TextIOWrapper(captured_bytes, errors='replace')
+            self._log_chunks(app_id, stream, read_chunks(captured_output), continued=True)
+            captured_output.detach()
+
+    @staticmethod
+    def _log_chunks(app_id, stream, chunks, continued=False):
+        for chunk in chunks:
+            log_to_file(logging.DEBUG, 'Output from {stream} stream of {app_name}{continued}:\n{msg}'.format(
+                stream=stream,
+                app_name=app_id,
+                continued=' (continued)' if continued else '',
+                msg=chunk
+            ))
+            continued = True
+
+
+def clear_captured_streams(capture_dir):
+    """
+    Removes streams captured by an earlier run from a capture directory that is kept between
+    runs, so they aren't logged again as this run's.
+    """
+    for captured_output in os.listdir(capture_dir):
+        if os.path.splitext(captured_output)[1][1:] in STREAMS:
+            os.remove(os.path.join(capture_dir, captured_output))
+
+
+def read_chunks(open_file, limit=None):
+    """
+    Reads whole lines from a file in chunks of about CHUNK_SIZE characters. A line longer than
+    that is split across chunks.
+    :param limit: int Stop after about this many characters
+    """
+    remaining = limit
+    while remaining is None or remaining > 0:
+        chunk_size = CHUNK_SIZE if remaining is None else min(CHUNK_SIZE, remaining)
+        chunk = open_file.read(chunk_size)
+        if not chunk:
+            return
+        if not chunk.endswith('\n'):
+            chunk += open_file.readline(CHUNK_SIZE)
+        if remaining is not None:
+            remaining -= len(chunk)
+        yield chunk.rstrip('\n')
+
+
+def log_to_file(level, msg):
+    """
+    Logs a message only to the log file handlers of the Operon logger, skipping the console.
+    """
+    record = logger.makeRecord(logger.name, level, '(captured)', 0, msg, None, None)
+    for handler in logger.handlers:
+        if isinstance(handler, logging.FileHandler) and record.levelno >= handler.level:
+            handler.handle(record)
@@ -0,0 +1,123 @@
+import os
+import json
+import heapq
+import logging
+
+logger = logging.getLogger('operon.main')
+
+
+def _read_spans(metrics_path):
+    """
+    :return: list<dict> One span for each Parsl task that started running, from the records of a
+             metrics file; apps of a fused task share one span
+    """
+    spans = dict()
+    with open(metrics_path) as metrics_file:
+        for line in metrics_file:
+            record = json.loads(line)
+            if record['start'] is None or record['end'] is None:
+                continue  # Never ran, such as when a dependency failed
+            task_id = record['fused_with'] or record['app']
+            span = spans.get(task_id)
+            if span is None:
+                spans[task_id] = {
+                    'apps': [record['app']], 'name': record['name'], 'executor': record['executor'],
+                    'failed': record['status'] == 'failed', 'launch': record['launch'],
+                    'start': record['start'], 'end': record['end'], 'bound': record['bound']
+                }
+            else:
+                span['apps'].append(record['app'])
+                span['failed'] = span['failed'] or record['status'] == 'failed'
+                if record['launch'] is not None:
+                    span['launch'] = min(span['launch'] or record['launch'], record['launch'])
+    return list(spans.values())
+
+
+def _assign_lanes(intervals):
+    """
+    Gives each interval the lowest numbered lane that's free when it starts, so intervals on the
+    same lane never overlap, and as few lanes are used as possible.
+    :param intervals: list<(float, float, object)> Start, end, and key of each interval
+    :return: dict Lane of each interval by key, numbered from 0
+    """
+    lanes, free_lanes, busy_lanes = dict(), list(), list()  # Heaps of free lanes, and of (end, lane) of busy ones
+    num_lanes = 0
+    for start, end, key in sorted(intervals, key=lambda interval: interval[:2]):
+        while busy_lanes and busy_lanes[0][0] <= start:
+            heapq.heappush(free_lanes, heapq.heappop(busy_lanes)[1])
+        if free_lanes:
+            lane = heapq.heappop(free_lanes)
+        else:
+            lane, num_lanes = num_lanes, num_lanes + 1
+        lanes[key] = lane
+        heapq.heappush(busy_lanes, (end, lane))
+    return lanes
+
+
+def write_trace(metrics_path, trace_path):
+    """
+    Writes the timeline of a run in the Chrome trace event format, which chrome://tracing and
+    Perfetto load, from the records RunMetrics wrote.
+
+    Each executor is a process, and each Parsl task that ran on it is a complete event on a lane
+    of that process; an app is put on the lowest lane free when it started, so lanes stand in for
+    the executor's worker slots, and a lane with gaps is a slot that sat idle. How long each task
+    waited for a slot once its dependencies were done is shown in a second process for the
+    executor, laid out the same way. Times are from when the first app was ready to run.
+
+    :param metrics_path: str JSONL file of app records, see RunMetrics
+    :param trace_path: str File to write the trace to
+    """
+    spans = _read_spans(metrics_path)
+    # An app can note its own start before the launch callback notes when it was launched
+    origin = min((min(span['launch'] or span['start'], span['start']) for span in spans), default=0)
+
+    def microseconds(seconds):
+        return round((seconds - origin) * 1e6)
+
+    executors = sorted({span['executor'] for span in spans}, key=str)
+    pids = {executor: 2 * i + 1 for i, executor in enumerate(executors)}
+    run_lanes, wait_lanes = dict(), dict()
+    for executor in executors:
+        run_lanes.update(_assign_lanes([(span['start'], span['end'], i) for i, span in enumerate(spans)
+                                        if span['executor'] == executor]))
+        wait_lanes.update(_assign_lanes([(span['launch'], span['start'], i) for i, span in enumerate(spans)
+                                         if span['executor'] == executor and span['launch'] is not None
+                                         and span['launch'] < span['start']]))
+
+    dump = json.JSONEncoder(separators=(',', ':'), check_circular=False).encode
+    with open(trace_path + '.partial', 'w') as trace_file:
+        trace_file.write('{"displayTimeUnit":"ms","traceEvents":[')
+        events = list()
+        for executor in executors:
+            events.append({'ph': 'M', 'name': 'process_name', 'pid': pids[executor], 'tid': 0,
+                           'args': {'name': 'executor {}'.format(executor)}})
+            events.append({'ph': 'M', 'name': 'process_name', 'pid': pids[executor] + 1, 'tid': 0,
+                           'args': {'name': 'executor {} queue wait'.format(executor)}})
+        for i, event in enumerate(events):
+            trace_file.write('{}\n{}'.format(',' if i else '', dump(event)))
+        num_written = len(events)
+
+        for i, span in enumerate(spans):
+            name = span['apps'][0] if len(span['apps']) == 1 else '{} (+{} apps)'.format(
+                span['apps'][0], len(span['apps']) - 1
+            )
+            args = {'apps': span['apps'], 'status': 'failed' if span['failed'] else 'completed',
+                    'bound': span['bound']}
+            span_events = [{
+                'ph': 'X', 'name': name, 'cat': os.path.basename(span['name']), 'pid': pids[span['executor']],
+                'tid': run_lanes[i], 'ts': microseconds(span['start']),
+                'dur': microseconds(span['end']) - microseconds(span['start']), 'args': args
+            }]
+            if i in wait_lanes:
+                span_events.append({
+                    'ph': 'X', 'name': name, 'cat': 'queue wait', 'pid': pids[span['executor']] + 1,
+                    'tid': wait_lanes[i], 'ts': microseconds(span['launch']),
+                    'dur': microseconds(span['start']) - microseconds(span['launch'])
+                })
+            for event in span_events:
+                trace_file.write('{}\n{}'.format(',' if num_written else '', dump(event)))
+                num_written += 1
+        trace_file.write('\n]}\n')
+    os.replace(trace_path + '.partial', trace_path)
+    logger.info('Wrote run timeline to {}'.format(trace_path))
@@ -0,0 +1,194 @@
+import time
+import logging
+import threading
+from collections import Counter
+from itertools import islice
+
+from parsl.app.errors import RemoteException
+
+PENDING, RUNNING, COMPLETED, FAILED = 'pending', 'running', 'completed', 'failed'
+
+# At most this many names are written on each 'Staged or running' line, so logging a
+# transition costs the same however many apps are in flight
+MAX_RUNNING_NAMES_LOGGED = 20
+
+logger = logging.getLogger('operon.main')
+
+
+def attempt_failed(exec_future):
+    """
+    :param exec_future: Future Executor future of one attempt at running an app, which must be done
+    :return: bool Whether the attempt failed, the same way Parsl's DataFlowKernel judges it
+    """
+    if exec_future.cancelled() or exec_future.exception() is not None:
+        return True
+    return isinstance(exec_future.result(), RemoteException)
+
+
+def watch_app_future(app_future, on_launch=None, on_done=None):
+    """
+    Calls back when an app is launched and when it's done, without polling.
+
+    Parsl only hands an AppFuture its executor future once the app is launched, and until then
+    AppFuture.add_done_callback() silently drops the callback. Instead, this hooks update_parent(),
+    which the DataFlowKernel calls on every launch, including retries and dependency failures.
+    An app held back by a ReleaseGate is only reported launched once the gate releases it.
+
+    :param app_future: AppFuture|Future Future returned when the app was submitted; a plain Future
+                       is treated as launched right away
+    :param on_launch: callable(app_future) Called each time the app is launched
+    :param on_done: callable(app_future, exec_future) Called once, when the last attempt at running
+                    the app is done; attempts that Parsl retries are not reported
+    """
+    if not hasattr(app_future, 'update_parent'):
+        if on_launch is not None:
+            on_launch(app_future)
+        if on_done is not None:
+            app_future.add_done_callback(lambda fut: on_done(app_future, fut))
+        return
+
+    watched_parents = set()
+    watch_lock = threading.Lock()
+
+    def watch_parent(exec_future):
+        # The app can be launched between installing the hook and looking for an existing parent,
+        # so make sure each executor future is only reported once
+        with watch_lock:
+            if id(exec_future) in watched_parents:
+                return
+            watched_parents.add(id(exec_future))
+        if on_launch is not None:
+            add_release_callback = getattr(exec_future, 'add_release_callback', None)
+            if add_release_callback is not None:
+                add_release_callback(lambda: on_launch(app_future))
+            else:
+                on_launch(app_future)
+        if on_done is not None:
+            def parent_done(fut):
+                # Parsl's own callback runs first and, if the attempt is to be retried, has already
+                # relaunched the app with a new parent
+                if fut is app_future.parent:
+                    on_done(app_future, fut)
+            exec_future.add_done_callback(parent_done)
+
+    update_parent = app_future.update_parent
+
+    def update_parent_and_watch(exec_future):
+        update_parent(exec_future)
+        watch_parent(exec_future)
+    app_future.update_parent = update_parent_and_watch
+
+    # Apps with no unfinished dependencies are launched during submission
+    if app_future.parent is not None:
+        watch_parent(app_future.parent)
+
+
+class AppStateTracker(object):
+    """
+    Follows every app of a run through pending -> running -> completed|failed as Parsl
+    reports launches and completions. Each transition does a constant amount of work, so
+    the cost of monitoring doesn't grow with the number of apps waiting to run.
+
+    When each app was first launched and when it finished are kept in times, as seconds since the epoch.
+    Apps that are forgotten are still counted by their final state in forgotten.
+    """
+    def __init__(self, pipeline_futs=()):
+        """
+        :param pipeline_futs: list<(str, AppFuture)> Name and future of every submitted app
+        """
+        self.state = dict()
+        self.counts = Counter()
+        self.forgotten = Counter()
+        self.times = dict()
+        self._running = dict()  # Insertion ordered, so apps are listed in the order they started
+        self._futures = dict()
+        self._lock = threading.Condition()
+        self._pipeline_futs = pipeline_futs
+
+    def start(self):
+        for name, fut in self._pipeline_futs:
+            self.track(name, fut)
+
+    def track(self, name, fut):
+        """
+        Starts following an app submitted after the tracker was started.
+        """
+        with self._lock:
+            self.state[name] = PENDING
+            self.counts[PENDING] += 1
+            self._futures[name] = fut
+        watch_app_future(
+            fut,
+            on_launch=lambda _: self._launched(name),
+            on_done=lambda _, exec_fut: self._finished(name, attempt_failed(exec_fut))
+        )
+
+    def forget(self, name):
+        """
+        Stops keeping the state of a finished app, so following a long run doesn't take ever more memory.
+        """
+        with self._lock:
+            final_state = self.state.pop(name)
+            self.counts[final_state] -= 1
+            self.forgotten[final_state] += 1
+            self.times.pop(name, None)
+            self._futures.pop(name, None)
+
+    def wait_settled(self, timeout=None):
+        """
+        Waits for every app whose future is done to be seen as done, since a future can be done
+        before the callback telling the tracker so has run.
+        :param timeout: float Most seconds to wait
+        """
+        with self._lock:
+            self._lock.wait_for(lambda: all(self.state[name] in (COMPLETED, FAILED)
+                                            for name, fut in self._futures.items() if fut.done()), timeout)
+
+    def snapshot(self, max_running=None):
+        """
+        :param max_running: int At most this many running apps are listed
+        :return: (dict<str, int>, list<(str, float)>) Number of apps in each state, counting those
+                 forgotten, and the name and launch time of running apps, longest running first
+        """
+        with self._lock:
+            counts = {state: self.counts[state] + self.forgotten[state]
+                      for state in (PENDING, RUNNING, COMPLETED, FAILED)}
+            running = [(name, self.times[name][0]) for name in islice(self._running, max_running)]
+        return counts, running
+
+    def _transition(self, name, new_state):
+        old_state = self.state[name]
+        self.state[name] = new_state
+        self.counts[old_state] -= 1
+        self.counts[new_state] += 1
+
+    def _launched(self, name):
+        with self._lock:
+            if self.state[name] == RUNNING:
+                return
+            self._transition(name, RUNNING)
+            self.times[name] = (time.time(), None)
+            self._running[name] = None
+            logger.info('{} staged to run'.format(name))
+            self._log_running()
+
+    def _finished(self, name, failed):
+        with self._lock:
+            if self.state[name] in (COMPLETED, FAILED):
+                return
+            self._transition(name, FAILED if failed else COMPLETED)
+            started = self.times.get(name, (None, None))[0]
+            self.times[name] = (started, time.time())
+            self._running.pop(name, None)
+            logger.info('{} finished running'.format(name))
+            self._log_running()
+            self._lock.notify_all()
+
+    def _log_running(self):
+        if not self._running:
+            return
+        num_unlisted = len(self._running) - MAX_RUNNING_NAMES_LOGGED
+        logger.info('Staged or running: {}{}'.format(
+            '  '.join(islice(self._running, MAX_RUNNING_NAMES_LOGGED)),
+            '  ... and {} more'.format(num_unlisted) if num_unlisted > 0 else ''
+        ))
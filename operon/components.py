@@ -1,14 +1,16 @@
 import os
+import sys
 import json
 import time
-import queue
 import logging
-from logging import Handler
-import re
+import queue
 import tempfile
 import threading
+import multiprocessing
+from multiprocessing.pool import MaybeEncodingError
 import traceback
 from copy import copy
+from functools import partial
 from collections import namedtuple
 from datetime import datetime
 from getpass import getuser
@@ -17,14 +19,31 @@ from socket import gethostname
 import parsl
 from parsl.app.app import python_app, bash_app
 from parsl.dataflow.error import DependencyError
+from parsl.dataflow.states import States
 from parsl.app.errors import AppFailure, MissingOutputs, ParslError
 from ipyparallel.error import RemoteError
 import networkx as nx
 
 from operon._util.logging import setup_logger
 from operon._util.home import OperonState
-from operon._util.configs import cycle_config_input_options, built_in_configs
-from operon._util.apps import _DeferredApp, _ParslAppBlueprint
+from operon._util.configs import cycle_config_input_options, built_in_configs, apply_checkpointing
+from operon._util.cache import ResultCache, format_size
+from operon._util.tracking import AppStateTracker, watch_app_future
+from operon._util.streams import CapturedStreamLogger, clear_captured_streams
+from operon._util.export import app_runs, export_graph
+from operon._util.history import RunHistory
+from operon._util.hooks import HookDispatcher, site_hooks
+from operon._util.metrics import RunMetrics, measured_bash_command, measured_call
+from operon._util.performance import RunPerformance, read_records
+from operon._util.prometheus import PrometheusExporter
+from operon._util.status import STATUS_INTERVAL, StatusWriter, status_path
+from operon._util.trace import write_trace
+from operon._util.fusion import FusedTask, fuse_chain, fuse_batch, linear_chains, sibling_batches
+from operon._util.scheduling import (CriticalPath, ReleaseGate, WorkflowWidth, executor_slots, executor_tasks,
+                                     host_resources, app_resources, format_duration, needs_release_gate,
+                                     size_executors, warn_on_width_mismatch)
+from operon._util.data import _DataRegistry, MODE_UNSET, MODE_INPUT, MODE_OUTPUT
+from operon._util.apps import _DeferredApp, _ParslAppBlueprint, _AppBlueprint, _CompletedFuture
 from operon._util.errors import MalformedPipelineError, NoParslConfigurationError
 from operon.meta import Meta
 
@@ -38,6 +57,13 @@ logger = logging.getLogger('operon.main')
 # import parsl
 # parsl.set_stream_logger()
 
+# Parsl releases whose DataFlowKernel only reads the status of a finished task's record, so the rest of it
+# can be let go of once the task is done
+RELEASABLE_TASKS_PARSL_VERSIONS = ('0.6.1',)
+
+# Stands in for a TemporaryDirectory when captured streams have to survive the run
+_CaptureDirectory = namedtuple('_CaptureDirectory', 'name')
+
 
 class CondaPackage(namedtuple('CondaPackage', 'tag config_key executable_path')):
     """
@@ -74,6 +100,7 @@ class Software(_ParslAppBlueprint):
                 raise ValueError('Software path could not be inferred')
         self.path = ' '.join((path, str(subprogram))) if subprogram else path
         self.basename = os.path.basename(path).replace(' ', '_')
+        self.step = ' '.join((self.basename, str(subprogram))) if subprogram else self.basename
         self.success_on = success_on or ['0']
         self.default_meta = meta or dict()
 
@@ -98,7 +125,7 @@ class Software(_ParslAppBlueprint):
 
         :return: ``_DeferredApp`` which can be passed to other Apps
         """
-        blueprint = self.prep(*args, **kwargs)
+        blueprint = _AppBlueprint(**self._prep(*args, **kwargs))
         _ParslAppBlueprint._blueprints[blueprint['id']] = blueprint
         cmd = '{cmd}{stdout_redirect}{stderr_redirect}'.format(
             cmd=blueprint['cmd'],
@@ -116,6 +143,14 @@ class Software(_ParslAppBlueprint):
         Does most of the work for ``register()``, but this method should only be used directly
         inside of a ``Pipe`` object.
         """
+        app_blueprint = self._prep(*args, **kwargs)
+        app_blueprint['cmd'] = ' '.join(app_blueprint['cmd'])
+        return app_blueprint
+
+    def _prep(self, *args, **kwargs):
+        """
+        Builds the blueprint dict of an app, with its command left as a list of fragments.
+        """
         """
         The meta dictionary:
         {
@@ -124,13 +159,15 @@ class Software(_ParslAppBlueprint):
                 'mem': <Amount of memory>
             },
             'site': <Name of the executor to run this app, for backward compatibility>,
-            'executor': <Name of the executor to run this app>
+            'executor': <Name of the executor to run this app>,
+            'runtime': <Expected runtime, in seconds or suffixed with s, m, h, or d>
         }
         """
         app_blueprint = {
             'id': '{}_{}'.format(self.basename, _ParslAppBlueprint.get_id()),
             'type': 'bash',
             'name': kwargs.get('action', self.path),
+            'step': self.step,
             'cmd': '',
             'success_on': self.success_on,
             'meta': dict(),
@@ -167,7 +204,8 @@ class Software(_ParslAppBlueprint):
 
         # Deal with Parameters
         for parameter in cmd_parts['Parameter']:
-            cmd.append(str(parameter))
+            # Parameters without Data, like flags, tend to repeat across apps, so only one copy is kept
+            cmd.append(str(parameter) if parameter.data else sys.intern(str(parameter)))
             for data in parameter.data:
                 # Default to data being OUTPUT if none specified
                 if data.mode == Data.INPUT:
@@ -201,7 +239,7 @@ class Software(_ParslAppBlueprint):
             app_blueprint['stdout'] = pipe_blueprint['stdout']
             app_blueprint['stderr'] = pipe_blueprint['stderr']
 
-        app_blueprint['cmd'] = ' '.join(cmd)
+        app_blueprint['cmd'] = cmd
 
         # If either of stdout or stderr were not explicitly set by a Redirect,
         # set it to go to a temporary file for later injection into the main logs
@@ -235,34 +273,40 @@ class Data(object):
 
     :param path: str Path to the file on the filesystem
     """
-    _id = 0
-    _data = dict()
+    __slots__ = ('path', 'id', '_registry', '__weakref__')
+
+    # Registry of the run being built, replaced at the start of each run
+    _data = _DataRegistry()
 
     INPUT = 0
     OUTPUT = 1
+    _MODES = {MODE_UNSET: None, MODE_INPUT: INPUT, MODE_OUTPUT: OUTPUT}
 
     def __new__(cls, path):
         if not path:
             return ''
-        if path in cls._data:
-            return cls._data[path]
-        return super(Data, cls).__new__(cls)
-
-    def __init__(self, path):
-        if path not in Data._data:
-            # Initialize
-            Data._data[path] = self
-            self.path = path
-            self.tmp = None
-            self.mode = None
-            self._initial_input = False
-            self._terminal_output = False
+        data = cls._data.get_object(path)
+        if data is None:
+            data = super(Data, cls).__new__(cls)
+            data.path = path
+            data.id = cls._data.id(path)
+            data._registry = cls._data
+            cls._data.set_object(path, data)
+        return data
+
+    @property
+    def mode(self):
+        return Data._MODES[self._registry.mode(self.id)]
+
+    @property
+    def tmp(self):
+        return self._registry.is_tmp(self.path)
 
     def as_input(self):
         """
         Marks this ``Data`` object as input
         """
-        self.mode = Data.INPUT
+        self._registry.set_mode(self.id, MODE_INPUT)
         return self
 
     def as_output(self, tmp=False):
@@ -271,8 +315,8 @@ class Data(object):
 
         :param tmp: bool If ``True``, this file will be deleted when the pipeline completes
         """
-        self.mode = Data.OUTPUT
-        self.tmp = tmp
+        self._registry.set_mode(self.id, MODE_OUTPUT)
+        self._registry.set_tmp(self.id, tmp)
         return self
 
     def __str__(self):
@@ -407,19 +451,19 @@ class CodeBlock(_ParslAppBlueprint):
         :return: ``_DeferredApp`` representation of the value this function will eventually return
         """
         blueprint_id = '{}_{}'.format(func.__name__, _ParslAppBlueprint.get_id())
-        _ParslAppBlueprint._blueprints[blueprint_id] = {
-            'id': blueprint_id,
-            'type': 'python',
-            'func': func,
-            'args': args if args else list(),
-            'kwargs': kwargs if kwargs else dict(),
-            'inputs': list(map(str, inputs)) if inputs else list(),
-            'outputs': list(map(str, outputs)) if outputs else list(),
-            'wait_on': list(map(str, wait_on)) if wait_on else list(),
-            'stdout': stdout,
-            'stderr': stderr,
-            'meta': kwargs_.get('meta', dict())
-        }
+        _ParslAppBlueprint._blueprints[blueprint_id] = _AppBlueprint(
+            id=blueprint_id,
+            type='python',
+            func=func,
+            args=args if args else list(),
+            kwargs=kwargs if kwargs else dict(),
+            inputs=map(str, inputs) if inputs else (),
+            outputs=map(str, outputs) if outputs else (),
+            wait_on=map(str, wait_on) if wait_on else (),
+            stdout=stdout,
+            stderr=stderr,
+            meta=kwargs_.get('meta', dict())
+        )
         logger.debug('Registered function {}\nArgs: {}\nKwargs: {}'.format(
             func.__name__,
             args,
@@ -428,30 +472,28 @@ class CodeBlock(_ParslAppBlueprint):
         return _DeferredApp(blueprint_id)
 
 
-class DataflowResponseHandler(Handler):
-    def __init__(self, pipeline_futs, *args, **kwargs):
-        self.task_map = {
-            str(fut.tid): [name, fut]
-            for name, fut in pipeline_futs
-        }
-
-        self.pending, self.running, self.finished = set(list(self.task_map.keys())), set(), set()
+# Pipeline instance, per-sample args, and pipeline config used by build workers, inherited when they fork
+_parallel_build_state = None
 
-        super().__init__(*args, **kwargs)
 
-    def handle(self, record):
-        msg = record.getMessage()
-        print('Got message: {}'.format(msg))
-
-        task_started = re.match(r'Task (\d+) launched on executor', msg)
-        if task_started is not None:
-            task_id = task_started.group(1)
-            # print(self.task_map[task_id][1].parent)
-            parent_ = self.task_map['2'][1].parent
-            if parent_ is not None:
-                print('\t\t' + str(parent_.__dict__))
-            else:
-                print('\t\tNo Parent')
+def _build_sample_blueprints(sample_i):
+    """
+    Runs in a build worker process. Registers the apps of one sample of a batch run from scratch.
+    :return: (int, list<_AppBlueprint>, list<str>, dict, str) Number of app IDs handed out, the
+             blueprints, paths of temporary Data, and the executors and default executor defined
+    """
+    pipeline_instance, batch_pipeline_args, pipeline_config = _parallel_build_state
+    _ParslAppBlueprint._id_counter = 0
+    _ParslAppBlueprint._blueprints = dict()
+    Data._data = _DataRegistry()
+    pipeline_instance.pipeline(batch_pipeline_args[sample_i], pipeline_config)
+    return (
+        _ParslAppBlueprint._id_counter,
+        list(_ParslAppBlueprint._blueprints.values()),
+        [path for path in Data._data.paths if Data._data.is_tmp(path)],
+        Meta._executors,
+        Meta._default_executor
+    )
 
 
 class ParslPipeline(object):
@@ -462,6 +504,9 @@ class ParslPipeline(object):
     # Temporary directory to send stream output of un-Redirected apps
     _pipeline_run_temp_dir = None
 
+    # Name the pipeline was installed or run under, set when it's loaded by the command line
+    _pipeline_name = None
+
     def _run(self, pipeline_args, pipeline_config, original_command, run_args=None):
         """
         If run_args is not None, then this is a batch run because single runs won't
@@ -481,13 +526,23 @@ class ParslPipeline(object):
         logs_dir = (run_args or pipeline_args).get('logs_dir')
         run_name = (run_args or pipeline_args).get('run_name')
         os.makedirs(logs_dir, exist_ok=True)
-        setup_logger(logs_dir, run_name)
+        operon_log_path = setup_logger(logs_dir, run_name)
 
         # Set up temp dir
-        ParslPipeline._pipeline_run_temp_dir = tempfile.TemporaryDirectory(
-            dir=logs_dir,
-            suffix='__operon'
-        )
+        # When checkpointing, captured stream paths are part of every task's hashed arguments, so they have
+        # to be the same each time this run is started; otherwise a random temporary directory is fine
+        checkpoint_mode = None
+        if (run_args or pipeline_args).get('checkpoint'):
+            checkpoint_mode = (run_args or pipeline_args).get('checkpoint_mode') or 'task_exit'
+            capture_dir = os.path.join(os.path.abspath(logs_dir), '{}__operon'.format(run_name))
+            os.makedirs(capture_dir, exist_ok=True)
+            clear_captured_streams(capture_dir)
+            ParslPipeline._pipeline_run_temp_dir = _CaptureDirectory(capture_dir)
+        else:
+            ParslPipeline._pipeline_run_temp_dir = tempfile.TemporaryDirectory(
+                dir=logs_dir,
+                suffix='__operon'
+            )
 
         # Log initial run conditions
         logger.info(f'Executing: operon {original_command}')
@@ -495,81 +550,547 @@ class ParslPipeline(object):
         if run_name != 'run':
             logger.info(f'Run name: {run_name}')
 
-        # Respond to events in the Dataflow logging
-        # logging.getLogger('parsl.dataflow.dflow').addHandler(DataflowResponseHandler())
-
         # Give pipeline config to Software class
         Software._pipeline_config = copy(pipeline_config)
 
         # Run self.pipeline() to assemble workflow graph
+        # A streaming batch run builds each sample only once it's admitted, so nothing is built up front,
+        # unless this is a dry run
+        dry_run = (run_args or pipeline_args).get('dry_run', False)
+        run_history = RunHistory(
+            pipeline=self._pipeline_name or '{}.{}'.format(type(self).__module__, type(self).__qualname__)
+        )
+        max_inflight_samples = (run_args or dict()).get('max_inflight_samples')
+        build_start = time.perf_counter()
         if run_args is None:
             self.pipeline(pipeline_args, pipeline_config)
+        elif max_inflight_samples and not dry_run:
+            pass
+        elif (run_args.get('build_workers') or 1) > 1:
+            ParslPipeline._build_in_parallel(self, pipeline_args, pipeline_config, run_args['build_workers'])
         else:
             for single_pipeline_args in pipeline_args:
                 self.pipeline(single_pipeline_args, pipeline_config)
 
-        # Hand the run over to Parsl and monitor for completion
-        ParslPipeline._start_and_monitor_run(
-            workflow_graph=ParslPipeline._assemble_graph(_ParslAppBlueprint._blueprints.values()),
-            parsl_config=ParslPipeline._choose_parsl_config(
-                pipeline_args_parsl_config=(run_args or pipeline_args).get('parsl_config'),
-                pipeline_config_parsl_config=pipeline_config.get('parsl_config'),
-                pipeline_default_parsl_config=self.parsl_configuration()
+        # Report the shape of the workflow instead of running it
+        if dry_run:
+            workflow_graph = ParslPipeline._assemble_graph(_ParslAppBlueprint._blueprints.values())
+            ParslPipeline._report_dry_run(
+                workflow_graph=workflow_graph,
+                build_seconds=time.perf_counter() - build_start,
+                fuse_chains=(run_args or pipeline_args).get('fuse_chains', False),
+                pack_siblings=(run_args or pipeline_args).get('pack_siblings'),
+                pack_slots=(run_args or pipeline_args).get('pack_slots') or 1,
+                history=run_history
+            )
+            Data._data = _DataRegistry()
+            _ParslAppBlueprint._blueprints = dict()
+            return
+
+        # Set up the result cache shared across runs, if requested
+        result_cache = None
+        if (run_args or pipeline_args).get('cache'):
+            result_cache = ResultCache(
+                cache_dir=(run_args or pipeline_args).get('cache_dir'),
+                max_size=(run_args or pipeline_args).get('cache_max_size')
             )
+            logger.info('Using result cache at {}'.format(result_cache.cache_dir))
+
+        # Choose a Parsl config, and have it checkpoint next to the logs if requested
+        parsl_config = ParslPipeline._choose_parsl_config(
+            pipeline_args_parsl_config=(run_args or pipeline_args).get('parsl_config'),
+            pipeline_config_parsl_config=pipeline_config.get('parsl_config'),
+            pipeline_default_parsl_config=self.parsl_configuration()
         )
+        if checkpoint_mode:
+            apply_checkpointing(
+                parsl_config=parsl_config,
+                run_dir=os.path.join(os.path.abspath(logs_dir), '{}__runinfo'.format(run_name)),
+                checkpoint_mode=checkpoint_mode
+            )
+
+        # Hand the run over to Parsl and monitor for completion
+        stream_logger = CapturedStreamLogger(
+            capture_dir=ParslPipeline._pipeline_run_temp_dir.name,
+            keep_dir=os.path.join(logs_dir, '{}__streams'.format(run_name)),
+            head_size=(run_args or pipeline_args).get('captured_head') or '1M',
+            tail_size=(run_args or pipeline_args).get('captured_tail') or '1M'
+        )
+        # Run-level metrics are served to Prometheus and written for its textfile collector, if requested
+        exporter = None
+        prometheus_port = (run_args or pipeline_args).get('prometheus_port')
+        prometheus_textfile = (run_args or pipeline_args).get('prometheus_textfile')
+        if prometheus_port is not None or prometheus_textfile:
+            exporter = PrometheusExporter(
+                pipeline=run_history.pipeline,
+                run_name=run_name,
+                port=prometheus_port,
+                textfile=prometheus_textfile
+            )
+        # Each app's timing and resource use is recorded next to the log, and durations kept for later runs,
+        # only if asked for or needed by the trace or Prometheus, since measuring wraps every app's command
+        run_metrics = None
+        if (run_args or pipeline_args).get('app_metrics') or (run_args or pipeline_args).get('trace') or exporter:
+            run_metrics = RunMetrics(
+                metrics_path=operon_log_path.replace('.operon.log', '.metrics.jsonl'),
+                capture_dir=ParslPipeline._pipeline_run_temp_dir.name,
+                history=run_history,
+                on_record=exporter.observe if exporter is not None else None
+            )
+        # Hooks of the pipeline and of the site are told what happens to each app
+        hooks = list(self.hooks()) + site_hooks() + ([exporter] if exporter is not None else [])
+        app_hooks = HookDispatcher(hooks) if hooks else None
+        if max_inflight_samples:
+            ParslPipeline._start_and_monitor_streaming_run(
+                pipeline_instance=self,
+                batch_pipeline_args=pipeline_args,
+                pipeline_config=pipeline_config,
+                parsl_config=parsl_config,
+                max_inflight_samples=max_inflight_samples,
+                incremental=run_args.get('incremental', False),
+                result_cache=result_cache,
+                stream_logger=stream_logger,
+                auto_size=run_args.get('auto_size', False),
+                fuse_chains=run_args.get('fuse_chains', False),
+                pack_siblings=run_args.get('pack_siblings'),
+                pack_slots=run_args.get('pack_slots') or 1,
+                run_metrics=run_metrics,
+                history=run_history,
+                app_hooks=app_hooks,
+                exporter=exporter,
+                status_file=status_path(logs_dir, run_name),
+                status_interval=(run_args or pipeline_args).get('status_interval') or STATUS_INTERVAL
+            )
+        else:
+            ParslPipeline._start_and_monitor_run(
+                workflow_graph=ParslPipeline._assemble_graph(_ParslAppBlueprint._blueprints.values()),
+                parsl_config=parsl_config,
+                incremental=(run_args or pipeline_args).get('incremental', False),
+                result_cache=result_cache,
+                stream_logger=stream_logger,
+                auto_size=(run_args or pipeline_args).get('auto_size', False),
+                fuse_chains=(run_args or pipeline_args).get('fuse_chains', False),
+                pack_siblings=(run_args or pipeline_args).get('pack_siblings'),
+                pack_slots=(run_args or pipeline_args).get('pack_slots') or 1,
+                graph_export=os.path.join(logs_dir, '{}__graph'.format(run_name)),
+                graphml=(run_args or pipeline_args).get('graphml', False),
+                run_metrics=run_metrics,
+                history=run_history,
+                app_hooks=app_hooks,
+                exporter=exporter,
+                status_file=status_path(logs_dir, run_name),
+                status_interval=(run_args or pipeline_args).get('status_interval') or STATUS_INTERVAL
+            )
+
+        # The timeline of the run can be looked at in chrome://tracing or Perfetto
+        if (run_args or pipeline_args).get('trace') and run_metrics and os.path.isfile(run_metrics.metrics_path):
+            write_trace(run_metrics.metrics_path, operon_log_path.replace('.operon.log', '.trace.json'))
+
+        # Paths and blueprints belong to this run only, so don't hold on to them after it
+        Data._data = _DataRegistry()
+        _ParslAppBlueprint._blueprints = dict()
+
+    @staticmethod
+    def _build_in_parallel(pipeline_instance, batch_pipeline_args, pipeline_config, num_workers):
+        """
+        Runs pipeline() for each sample of a batch run in a pool of worker processes, then merges
+        the blueprints each sample registered, in input matrix order.
+
+        Each worker numbers its apps from 1, so the apps of every sample are renumbered by the
+        number of IDs handed out to the samples before it; the result is the same set of IDs a
+        sequential build gives, however the samples were spread across workers. Temporary Data
+        and executors defined by pipeline() are carried over as well.
+
+        pipeline() must not depend on state left by earlier samples, since each runs in its own
+        process, and functions given to CodeBlock must be importable so they can be sent back.
+        """
+        global _parallel_build_state
+        _parallel_build_state = (pipeline_instance, batch_pipeline_args, pipeline_config)
+        capture_dir = ParslPipeline._pipeline_run_temp_dir.name
+        logger.info('Building {} samples with {} workers'.format(len(batch_pipeline_args), num_workers))
+        try:
+            with multiprocessing.get_context('fork').Pool(num_workers) as pool:
+                for num_ids, blueprints, tmp_paths, executors, default_executor in pool.imap(
+                        _build_sample_blueprints, range(len(batch_pipeline_args))):
+                    offset = _ParslAppBlueprint._id_counter
+                    for blueprint in blueprints:
+                        blueprint.renumber(offset, capture_dir)
+                        _ParslAppBlueprint._blueprints[blueprint['id']] = blueprint
+                    _ParslAppBlueprint._id_counter += num_ids
+                    for tmp_path in tmp_paths:
+                        Data(tmp_path).as_output(tmp=True)
+                    Meta._executors.update(executors)
+                    Meta._default_executor = default_executor or Meta._default_executor
+        except MaybeEncodingError as e:
+            raise MalformedPipelineError('Blueprints could not be sent back from a build worker, functions given '
+                                         'to CodeBlock must be defined at module level\n{}'.format(e))
+        finally:
+            _parallel_build_state = None
 
     @staticmethod
-    def _start_and_monitor_run(workflow_graph, parsl_config):
+    def _start_and_monitor_run(workflow_graph, parsl_config, incremental=False, result_cache=None,
+                               stream_logger=None, auto_size=False, fuse_chains=False, pack_siblings=None,
+                               pack_slots=1, graph_export=None, graphml=False, run_metrics=None, history=None,
+                               app_hooks=None, exporter=None, status_file=None, status_interval=STATUS_INTERVAL):
+        # Fit executors to how many apps could ever run at once, or warn if they're far off
+        workflow_width = WorkflowWidth(workflow_graph, exact=auto_size)
+        ParslPipeline._fit_executors(parsl_config, workflow_width, auto_size)
+
+        # Score apps by how much of the workflow still has to run after them
+        critical_path = CriticalPath(workflow_graph, history.predictions(workflow_graph) if history else None)
+        slots = sum(executor_slots(parsl_config).values())
+
         # Register apps and data with Parsl, get all app futures and temporary files
-        pipeline_futs, tmp_files = ParslPipeline._register_workflow(workflow_graph, parsl_config)
+        if app_hooks is not None:
+            ParslPipeline._hooks_registered(workflow_graph, app_hooks)
+        pipeline_futs, tmp_files = ParslPipeline._register_workflow(
+            workflow_graph, parsl_config, incremental, result_cache, critical_path.priorities,
+            fusion=ParslPipeline._plan_fusion(workflow_graph, fuse_chains, pack_siblings, pack_slots,
+                                              critical_path.estimates if critical_path.estimated else None),
+            run_metrics=run_metrics,
+            app_hooks=app_hooks,
+            gate_apps=needs_release_gate(workflow_graph, workflow_width, executor_slots(parsl_config))
+        )
+        if exporter is not None:
+            exporter.add_tmp_files(tmp_files)
+
+        # Captured streams of each app go into the log as soon as the app is done
+        if stream_logger is None:
+            capture_dir = ParslPipeline._pipeline_run_temp_dir.name
+            stream_logger = CapturedStreamLogger(
+                capture_dir=capture_dir,
+                keep_dir=os.path.join(os.path.dirname(capture_dir), 'run__streams')
+            )
 
         state = {name: 'pending' for name, fut in pipeline_futs}
 
+        # Write out the workflow graph, so it's there even if the run never finishes
+        if graph_export is not None:
+            export_graph(workflow_graph, graph_export, graphml)
+            logger.info('Wrote workflow graph to {}.json'.format(graph_export))
+
         # Record start time
         start_time = datetime.now()
         logger.info('Started pipeline run\n@operon_start {}'.format(str(start_time)))
+        critical_path.log_plan(slots)
 
-        # Thread to listen for when apps start and stop
-        def running_listener(q, pipeline_futs):
-            fut_map = {fut: name for name, fut in pipeline_futs}
-            pending, running, finished = set(list(fut_map.keys())), set(), set()
-            while True:
-                # The only thing that will be sent is 'kill'
-                if not q.empty():
-                    break
-                time.sleep(0.01)
-
-                # Copy running set, to see if anything changes
-                precheck_running = copy(running)
-
-                # Identify finished futures
-                for running_fut in running:
-                    # ready is for IPP, done is for threads (I don't know about other executors)
-                    finished_func = 'ready' if hasattr(running_fut.parent, 'ready') else 'done'
-                    if getattr(running_fut.parent, finished_func)():
-                        logger.info('{} finished running'.format(fut_map[running_fut]))
-                        finished.add(running_fut)
-                running -= finished
-
-                # Identify newly running futures
-                for pending_fut in pending:
-                    if pending_fut.parent is not None:
-                        logger.info('{} staged to run'.format(fut_map[pending_fut]))
-                        running.add(pending_fut)
-                pending -= running
-
-                # Check if anything changed this iteration
-                if precheck_running != running and running:
-                    logger.info('Staged or running: {}'.format(
-                        '  '.join([fut_map[f] for f in running])
-                    ))
-
-        # Setup and start running listener thread
-        running_listener_q = queue.Queue()
-        running_listener_thread = threading.Thread(target=running_listener, args=(running_listener_q, pipeline_futs))
-        running_listener_thread.start()
+        # Follow apps as Parsl launches and finishes them
+        app_state_tracker = AppStateTracker(pipeline_futs)
+        app_state_tracker.start()
+        status_writer = StatusWriter(status_file, app_state_tracker, status_interval) if status_file else None
+        for name, fut in pipeline_futs:
+            stream_logger.log_when_done(name, fut)
 
         # Wait for all apps to complete
+        ParslPipeline._wait_for_apps(pipeline_futs, state)
+
+        # Finish adding outputs to the result cache before temporary files are removed
+        if result_cache is not None:
+            result_cache.close()
+
+        # All apps are complete, so run cleanup
+        ParslPipeline._remove_tmp_files(tmp_files)
+
+        # Record end time and elapsed time
+        end_time = datetime.now()
+        elapsed_time = end_time - start_time
+        logger.info('Finished pipeline run\n@operon_end {}\n@operon_elapsed {}\n@operon_elapsed_seconds {}'.format(
+            str(end_time),
+            str(elapsed_time),
+            str(elapsed_time.seconds)
+        ))
+        critical_path.log_outcome(elapsed_time.total_seconds(), slots)
+
+        # Log any failures
+        failures = [name for name, state_ in state.items() if state_ == 'failed']
+        pendings = [name for name, state_ in state.items() if state_ == 'pending']
+        logger.info('Failed apps: {}'.format(' '.join(failures) if failures else 'None'))
+        logger.info('Apps never ran: {}'.format(' '.join(pendings) if pendings else 'None'))
+
+        # Add how each app went to the workflow graph
+        if graph_export is not None:
+            export_graph(workflow_graph, graph_export, graphml, started=str(start_time),
+                         app_runs=app_runs(state, app_state_tracker.times, start_time.timestamp()))
+        if run_metrics is not None:
+            run_metrics.close()
+        if app_hooks is not None:
+            app_hooks.close()
+        if status_writer is not None:
+            status_writer.close()
+
+        # Sum up how well the run used its slots, and what held it up
+        RunPerformance(
+            workflow_graph, app_state_tracker.times, start_time.timestamp(), end_time.timestamp(), slots,
+            records=read_records(run_metrics.metrics_path) if run_metrics is not None else None
+        ).log()
+
+        # Log captured streams of any apps that haven't been logged yet
+        stream_logger.close()
+
+    @staticmethod
+    def _start_and_monitor_streaming_run(pipeline_instance, batch_pipeline_args, pipeline_config, parsl_config,
+                                         max_inflight_samples, incremental=False, result_cache=None,
+                                         stream_logger=None, auto_size=False, fuse_chains=False,
+                                         pack_siblings=None, pack_slots=1, run_metrics=None, history=None,
+                                         app_hooks=None, exporter=None, status_file=None,
+                                         status_interval=STATUS_INTERVAL):
+        """
+        Runs a batch with at most max_inflight_samples samples submitted to Parsl at once.
+
+        Rows of the input matrix are only read as they're needed. A sample's pipeline() is run, its
+        apps are submitted, and it's followed until every one of its apps is done; only then is the
+        next row read and admitted. Once a sample is finished its futures, blueprints, and Data are
+        let go and its temporary files removed, so memory and the number of apps competing for
+        storage stay bounded however many rows the batch has.
+
+        :param batch_pipeline_args: iterable<dict> Pipeline args of each sample, in order
+        """
+        if stream_logger is None:
+            capture_dir = ParslPipeline._pipeline_run_temp_dir.name
+            stream_logger = CapturedStreamLogger(
+                capture_dir=capture_dir,
+                keep_dir=os.path.join(os.path.dirname(capture_dir), 'run__streams')
+            )
+
+        tracker = AppStateTracker()
+        status_writer = StatusWriter(status_file, tracker, status_interval) if status_file else None
+        submission = None
+        app_priorities = dict()
+        inflight_samples = dict()
+        finished_samples = queue.Queue()
+        failures, num_samples = list(), 0
+
+        def admit_sample(sample_i, pipeline_args):
+            nonlocal submission
+            # App IDs keep counting up across samples, but paths and blueprints start over
+            _ParslAppBlueprint._blueprints = dict()
+            Data._data = _DataRegistry()
+            pipeline_instance.pipeline(pipeline_args, pipeline_config)
+
+            # Parsl is loaded once the first sample has had the chance to define its executors, and
+            # executors are fit to as many samples as the first running at once
+            workflow_graph = ParslPipeline._assemble_graph(_ParslAppBlueprint._blueprints.values())
+            if submission is None:
+                workflow_width = WorkflowWidth(workflow_graph, exact=auto_size)
+                ParslPipeline._fit_executors(parsl_config, workflow_width, auto_size, samples=max_inflight_samples)
+                submission = ParslPipeline._load_parsl(
+                    parsl_config, incremental, result_cache, app_priorities, run_metrics, app_hooks,
+                    gate_apps=needs_release_gate(workflow_graph, workflow_width, executor_slots(parsl_config),
+                                                 samples=max_inflight_samples)
+                )
+            if app_hooks is not None:
+                ParslPipeline._hooks_registered(workflow_graph, app_hooks)
+            submit_app, app_is_up_to_date = submission
+            critical_path = CriticalPath(workflow_graph, history.predictions(workflow_graph) if history else None)
+            app_priorities.update(critical_path.priorities)
+            pipeline_futs, data_futures = ParslPipeline._register_apps(
+                workflow_graph=workflow_graph,
+                submit_app=submit_app,
+                app_is_up_to_date=app_is_up_to_date,
+                priorities=app_priorities,
+                **ParslPipeline._plan_fusion(workflow_graph, fuse_chains, pack_siblings, pack_slots,
+                                             critical_path.estimates if critical_path.estimated else None)
+            )
+            app_priorities.clear()  # Parsl tasks keep their own priority once submitted
+            tmp_files = [d for d in data_futures if Data._data.is_tmp(d)]
+            if exporter is not None:
+                exporter.add_tmp_files(tmp_files)
+            inflight_samples[sample_i] = (pipeline_futs, tmp_files)
+            logger.info('Admitted sample {} with {} apps'.format(sample_i + 1, len(pipeline_futs)))
+
+            # The sample is finished when the last of its apps is done
+            apps_remaining = [len(pipeline_futs)]
+            apps_remaining_lock = threading.Lock()
+
+            def app_done(*_):
+                with apps_remaining_lock:
+                    apps_remaining[0] -= 1
+                    if apps_remaining[0] > 0:
+                        return
+                finished_samples.put(sample_i)
+
+            for name, fut in pipeline_futs:
+                tracker.track(name, fut)
+                stream_logger.log_when_done(name, fut)
+                watch_app_future(fut, on_done=app_done)
+            if not pipeline_futs:
+                finished_samples.put(sample_i)
+
+        def finish_sample(sample_i):
+            pipeline_futs, tmp_files = inflight_samples[sample_i]
+            state = dict()
+            if not ParslPipeline._wait_for_apps(pipeline_futs, state):
+                raise KeyboardInterrupt
+            del inflight_samples[sample_i]
+            failures.extend(name for name, state_ in state.items() if state_ == 'failed')
+            if result_cache is not None:
+                result_cache.flush()
+            ParslPipeline._remove_tmp_files(tmp_files)
+            ParslPipeline._release_parsl_tasks(pipeline_futs)
+            for name, _ in pipeline_futs:
+                tracker.forget(name)
+            logger.info('Finished sample {}'.format(sample_i + 1))
+
+        # Record start time
+        start_time = datetime.now()
+        logger.info('Started pipeline run\n@operon_start {}'.format(str(start_time)))
+        logger.info('Running at most {} samples at once'.format(max_inflight_samples))
+
+        try:
+            for sample_i, pipeline_args in enumerate(batch_pipeline_args):
+                while len(inflight_samples) >= max_inflight_samples:
+                    finish_sample(finished_samples.get())
+                admit_sample(sample_i, pipeline_args)
+                num_samples += 1
+            while inflight_samples:
+                finish_sample(finished_samples.get())
+        except KeyboardInterrupt:
+            logger.info('User aborted run')
+
+        # Finish adding outputs to the result cache
+        if result_cache is not None:
+            result_cache.close()
+
+        # Record end time and elapsed time
+        end_time = datetime.now()
+        elapsed_time = end_time - start_time
+        logger.info('Finished pipeline run\n@operon_end {}\n@operon_elapsed {}\n@operon_elapsed_seconds {}'.format(
+            str(end_time),
+            str(elapsed_time),
+            str(elapsed_time.seconds)
+        ))
+
+        # Log any failures, and anything left unfinished if the run was aborted
+        pendings = [name for pipeline_futs, _ in inflight_samples.values() for name, fut in pipeline_futs
+                    if not fut.done()]
+        logger.info('Samples run: {}'.format(num_samples - len(inflight_samples)))
+        logger.info('Failed apps: {}'.format(' '.join(failures) if failures else 'None'))
+        logger.info('Apps never ran: {}'.format(' '.join(pendings) if pendings else 'None'))
+        if run_metrics is not None:
+            run_metrics.close()
+        if app_hooks is not None:
+            app_hooks.close()
+        if status_writer is not None:
+            status_writer.close()
+
+        # Log captured streams of any apps that haven't been logged yet
+        stream_logger.close()
+
+    @staticmethod
+    def _hooks_registered(workflow_graph, app_hooks):
+        """
+        Tells app hooks about every app of the workflow.
+        :param app_hooks: HookDispatcher
+        """
+        for node, node_data in workflow_graph.nodes(data=True):
+            if node_data.get('type') == 'app':
+                app_hooks.registered(node_data['blueprint'])
+
+    @staticmethod
+    def _fit_executors(parsl_config, workflow_width, auto_size=False, samples=1):
+        """
+        :param workflow_width: WorkflowWidth How many apps of the workflow can run at once
+        :param auto_size: bool Size executors to fit the workflow, rather than only warning when they don't
+        :param samples: int Number of copies of the workflow that run side by side
+        """
+        workflow_width.log()
+        width = workflow_width.width * samples
+        if auto_size:
+            size_executors(parsl_config, width, (workflow_width.profile or [0])[0] * samples)
+        else:
+            warn_on_width_mismatch(parsl_config, width)
+
+    @staticmethod
+    def _report_dry_run(workflow_graph, build_seconds, fuse_chains=False, pack_siblings=None, pack_slots=1,
+                        history=None):
+        """
+        Prints the shape of a workflow, and how long it took to build, without loading Parsl.
+
+        :param workflow_graph: nx.DiGraph Directed graph representation of the workflow
+        :param build_seconds: float Seconds pipeline() and graph assembly took
+        :param fuse_chains: bool Count fused chains as single tasks, see _plan_fusion()
+        :param pack_siblings: int Count packed siblings as single tasks, see _plan_fusion()
+        :param pack_slots: int Most apps of a packed task run at once
+        :param history: RunHistory History of earlier runs to expect app runtimes from
+        """
+        logger.info('Dry run, nothing is handed to Parsl')
+        workflow_width = WorkflowWidth(workflow_graph, exact=True)
+        critical_path = CriticalPath(workflow_graph, history.predictions(workflow_graph) if history else None)
+        fusion = ParslPipeline._plan_fusion(workflow_graph, fuse_chains, pack_siblings, pack_slots,
+                                            critical_path.estimates if critical_path.estimated else None)
+        tasks = executor_tasks(workflow_graph, (fusion['chains'], fusion['batches']))
+
+        critical_path_length = '{} apps'.format(len(critical_path.path))
+        if critical_path.estimated:
+            critical_path_length += ', expected to take {}'.format(format_duration(critical_path.length))
+        statistics = [
+            ('Apps', len(critical_path.estimates)),
+            ('Data', sum(1 for _, node_type in workflow_graph.nodes(data='type') if node_type == 'data')),
+            ('Depth', len(workflow_width.profile)),
+            ('Max width', '{}{}'.format('' if workflow_width.max_antichain is not None else 'about ',
+                                        workflow_width.width)),
+            ('Critical path', critical_path_length),
+            ('Parsl tasks', '{} ({})'.format(sum(tasks.values()), ', '.join(
+                '{} on {}'.format(num_tasks, executor or 'any executor')
+                for executor, num_tasks in sorted(tasks.items(), key=lambda item: str(item[0]))
+            )) if tasks else 0),
+            ('Graph built in', '{:.2f}s'.format(build_seconds))
+        ]
+        label_width = max(len(label) for label, _ in statistics)
+        for label, value in statistics:
+            print('{:<{}}  {}'.format(label, label_width, value))
+
+    @staticmethod
+    def _plan_fusion(workflow_graph, fuse_chains=False, pack_siblings=None, pack_slots=1, estimates=None):
+        """
+        Decides which apps are submitted to Parsl together as a single task.
+
+        :param fuse_chains: bool Fuse linear chains of bash apps
+        :param pack_siblings: int Pack up to this many bash apps depending on the same apps into one task
+        :param pack_slots: int Most apps of a packed task run at once
+        :param estimates: dict<str, float> Seconds each app is expected to take, if known
+        :return: dict chains, batches, and batch_slots to hand to _register_apps
+        """
+        chains = linear_chains(workflow_graph) if fuse_chains else dict()
+        num_chains = len(set(chains.values()))
+        if num_chains:
+            logger.info('Fusing {} apps in {} linear chains into single tasks'.format(len(chains), num_chains))
+        batches = (sibling_batches(workflow_graph, pack_siblings, exclude=chains, estimates=estimates)
+                   if pack_siblings else dict())
+        num_batches = len(set(batches.values()))
+        if num_batches:
+            logger.info('Packing {} sibling apps into {} tasks, running {} at once'.format(
+                len(batches), num_batches, pack_slots
+            ))
+        return {'chains': chains, 'batches': batches, 'batch_slots': pack_slots}
+
+    @staticmethod
+    def _release_parsl_tasks(pipeline_futs):
+        """
+        Parsl's DataFlowKernel keeps the arguments and futures of every task it has ever run, and
+        rescans all of them each time a task completes. Once apps are finished, their records are
+        swapped for one holding just their status, which is all Parsl reads of a finished task.
+
+        That's only known to hold for the Parsl releases in RELEASABLE_TASKS_PARSL_VERSIONS, and
+        only without checkpointing, which reads the whole record; otherwise records are left alone.
+        """
+        dfk = parsl.dfk()
+        if dfk.checkpoint_mode is not None or parsl.__version__ not in RELEASABLE_TASKS_PARSL_VERSIONS:
+            return
+        for _, fut in pipeline_futs:
+            task = dfk.tasks.get(fut.tid)
+            if task is None or task['status'] not in (States.done, States.failed, States.dep_fail):
+                continue
+            dfk.tasks[fut.tid] = {'status': task['status']}
+
+    @staticmethod
+    def _wait_for_apps(pipeline_futs, state):
+        """
+        Waits for each app to finish, logging why any that failed did, and records its final state.
+        :param pipeline_futs: list<(str, AppFuture)> Apps to wait on
+        :param state: dict<str, str> Updated with 'completed' or 'failed' for each app
+        :return: bool False if the user aborted the run while waiting
+        """
         for name, fut in pipeline_futs:
             fut_errored = True
             try:
@@ -587,7 +1108,7 @@ class ParslPipeline(object):
                 logger.info('{} produced a general Parsl error\n{}'.format(name, e))
             except KeyboardInterrupt:
                 logger.info('User aborted run')
-                break
+                return False
             except RemoteError as e:
                 logger.info('{} produced a RemoteError\n{}'.format(name, e.traceback))
             except Exception as e:
@@ -596,12 +1117,10 @@ class ParslPipeline(object):
                 fut_errored = False
             finally:
                 state[name] = 'failed' if fut_errored else 'completed'
+        return True
 
-        # All apps are complete, so kill running listener thread
-        running_listener_q.put('kill')
-        running_listener_thread.join()
-
-        # All apps are complete, so run cleanup
+    @staticmethod
+    def _remove_tmp_files(tmp_files):
         if tmp_files and OperonState().setting('delete_temporary_files') == 'yes':
             for tmp_file_path in tmp_files:
                 try:
@@ -609,42 +1128,6 @@ class ParslPipeline(object):
                 except Exception:
                     pass  # If a file can't be deleted, just leave it and move on
 
-        # Record end time and elapsed time
-        end_time = datetime.now()
-        elapsed_time = end_time - start_time
-        logger.info('Finished pipeline run\n@operon_end {}\n@operon_elapsed {}\n@operon_elapsed_seconds {}'.format(
-            str(end_time),
-            str(elapsed_time),
-            str(elapsed_time.seconds)
-        ))
-
-        # Log any failures
-        failures = [name for name, state_ in state.items() if state_ == 'failed']
-        pendings = [name for name, state_ in state.items() if state_ == 'pending']
-        logger.info('Failed apps: {}'.format(' '.join(failures) if failures else 'None'))
-        logger.info('Apps never ran: {}'.format(' '.join(pendings) if pendings else 'None'))
-
-        # Remove stream handler before outputting captured streams
-        logger.handlers.pop(1)
-
-        # Inject captured app stdout and stderr into logs
-        for captured_output in os.listdir(ParslPipeline._pipeline_run_temp_dir.name):
-            capture_output_path = os.path.join(ParslPipeline._pipeline_run_temp_dir.name, captured_output)
-            app_name, stream = os.path.splitext(captured_output)
-            try:
-                captured_output_content = open(capture_output_path).read()
-                if captured_output_content:
-                    logger.debug('Output from {stream} stream of {app_name}:\n{msg}'.format(
-                        stream=stream[1:],  # Get extension of captured stream, without period
-                        app_name=app_name,
-                        msg=captured_output_content
-                    ))
-            except FileNotFoundError:
-                logger.debug('Output from {stream} of {app_name} could not be retrieved'.format(
-                    stream=stream[1:],
-                    app_name=app_name
-                ))
-
     @staticmethod
     def _choose_parsl_config(pipeline_args_parsl_config, pipeline_config_parsl_config, pipeline_default_parsl_config):
         """
@@ -695,9 +1178,22 @@ class ParslPipeline(object):
 
 
     @staticmethod
-    def _generate_executor_app_factories(executor_name=None):
+    def _generate_executor_app_factories(executor_name=None, measured=False):
         executors_ = 'all' if executor_name is None else [executor_name]
 
+        # Parsl hashes the source of an app for checkpoints, so the measured apps are their own functions and
+        # unmeasured runs hash as they always did
+        if measured:
+            @python_app(executors=executors_, cache=True)
+            def _measured_pythonapp(func_, func_args, func_kwargs, metrics, **kwargs):
+                return measured_call(metrics, func_, func_args, func_kwargs)
+
+            @bash_app(executors=executors_, cache=True)
+            def _measured_bashapp(cmd, metrics, success_on=None, **kwargs):
+                return measured_bash_command(cmd, success_on, metrics)
+
+            return _measured_pythonapp, _measured_bashapp
+
         @python_app(executors=executors_, cache=True)
         def _pythonapp(func_, func_args, func_kwargs, **kwargs):
             return func_(*func_args, **func_kwargs)
@@ -713,12 +1209,42 @@ class ParslPipeline(object):
         return _pythonapp, _bashapp
 
     @staticmethod
-    def _register_workflow(workflow_graph, parsl_config):
+    def _register_workflow(workflow_graph, parsl_config, incremental=False, result_cache=None, priorities=None,
+                           fusion=None, run_metrics=None, app_hooks=None, gate_apps=False):
+        """
+        Loads the Parsl config and submits every app in the workflow graph.
+
+        :param priorities: dict Critical path score of each node, if apps should be started in priority order
+        :param fusion: dict Apps to submit together, see _plan_fusion()
+        :param run_metrics: RunMetrics Where to record how each app ran, if anywhere
+        :param app_hooks: HookDispatcher Where to tell hooks what happens to each app, if anywhere
+        :param gate_apps: bool Hold apps on local executors in a ReleaseGate, see _load_parsl()
+        :return: (list<(str, AppFuture)>, list<str>) Submitted apps and the temporary files among their data
+        """
+        submit_app, app_is_up_to_date = ParslPipeline._load_parsl(parsl_config, incremental, result_cache,
+                                                                  priorities, run_metrics, app_hooks, gate_apps)
+
+        # Register all apps
+        app_futures, data_futures = ParslPipeline._register_apps(
+            workflow_graph=workflow_graph,
+            submit_app=submit_app,
+            app_is_up_to_date=app_is_up_to_date,
+            priorities=priorities,
+            **(fusion or dict())
+        )
+
+        # Gather files marked as temporary, if any
+        tmp_files = [d for d in data_futures if Data._data.is_tmp(d)]
+
+        return app_futures, tmp_files
+
+    @staticmethod
+    def _load_parsl(parsl_config, incremental=False, result_cache=None, app_priorities=None, run_metrics=None,
+                    app_hooks=None, gate_apps=False):
         """
         For right now we will keep track of all unique combinations of resource requirements and
-        how many of each. The maxBlocks can then be set to the number of each resource requirement. In the
-        future we can try to be smarter by examining the workflow graph and deciding how many could
-        possibly ever be running concurrently.
+        how many of each. How many apps could possibly ever be running concurrently is worked out from
+        the workflow graph beforehand, see _fit_executors().
 
         Pipeline is single, Config is single
             * Assign all Apps to null executor
@@ -744,12 +1270,35 @@ class ParslPipeline(object):
             * Assign all apps to first executor
             * Log warning of mismatch
 
-        :param workflow_graph:
-        :param dfk:
-        :return:
+        If incremental is True, apps whose outputs are already up to date are not submitted to Parsl.
+        If a result_cache is given, apps whose outputs can be restored from it are not submitted either,
+        and the outputs of every other app are added to it as they complete.
+
+        If gate_apps is set, apps on an executor with a known number of slots, which runs them on this
+        host, are held back until a slot is free and the CPUs and memory their meta asks for are too.
+        Waiting apps are started in order of the priority app_priorities gives them when they're
+        submitted. Otherwise Parsl hands apps to executors as soon as their dependencies are done.
+
+        :param parsl_config:
+        :param incremental:
+        :param result_cache:
+        :param app_priorities: dict<str, float> Priority of each app, read when it's submitted
+        :param run_metrics: RunMetrics Where to record how each app ran, if anywhere
+        :param app_hooks: HookDispatcher Where to tell hooks what happens to each app, if anywhere
+        :param gate_apps: bool Hold apps back in a ReleaseGate, see needs_release_gate()
+        :return: (function, function) submit_app and app_is_up_to_date to hand to _register_apps; the
+                 second is None if no app can be skipped
         """
         # Regiser config with Parsl
         parsl.load(parsl_config)
+        local_executors = set(executor_slots(parsl_config))
+        release_gate = None
+        if gate_apps:
+            host_cpu, host_mem = host_resources()
+            release_gate = ReleaseGate(parsl.dfk(), executor_slots(parsl_config), (host_cpu, host_mem))
+            logger.debug('Apps run on this host that declare resources share {} CPUs and {} of memory'.format(
+                host_cpu, 'an unknown amount' if host_mem is None else format_size(host_mem)
+            ))
 
         is_single_parsl_config = len(parsl_config.executors) <= 1
 
@@ -764,58 +1313,24 @@ class ParslPipeline(object):
 
         app_factories = dict()
         # At a minimum define the 'all' executor, which is an executor with no specific label
-        app_factories['all'] = ParslPipeline._generate_executor_app_factories()
+        app_factories['all'] = ParslPipeline._generate_executor_app_factories(measured=run_metrics is not None)
 
         # If we have multiple executors, define them
         if not any((is_single_parsl_config, is_single_pipeline_meta)):
             for executor in parsl_config.executors:
-                app_factories[executor.label] = ParslPipeline._generate_executor_app_factories(executor_name=executor.label)
-
-        # Some data containers
-        app_futures, data_futures = list(), dict()
-        app_nodes_registered = {
-            node_id: False
-            for node_id in workflow_graph
-            if workflow_graph.node[node_id]['type'] == 'app'
-        }
-        data_node_in_degree = {
-            node_id: in_degree
-            for node_id, in_degree in workflow_graph.in_degree(workflow_graph.nodes())
-            if workflow_graph.node[node_id]['type'] == 'data'
-        }
+                app_factories[executor.label] = ParslPipeline._generate_executor_app_factories(
+                    executor_name=executor.label,
+                    measured=run_metrics is not None
+                )
 
-        def register_app(app_node_id, workflow_graph):
+        def submit_app(_app_blueprint, _app_inputs):
             """
-            Recursive algorithm to traverse the workflow graph and register apps
-            :param app_node_id: str ID of the app node to try to register with parsl
-            :param workflow_graph: nx.DiGraph Directed graph representation of the workflow
-            :return: list<AppFuture> All app futures generated by the workflow
+            Hands a single app to Parsl, once all of its input futures are known
+            :param _app_blueprint: dict Blueprint of the app to submit
+            :param _app_inputs: list<Future> Data and app futures this app depends on
+            :return: AppFuture The future for the submitted app, or for a fused blueprint
+                     list<FusedAppFuture> the future of each app it runs
             """
-            # Check if any input data nodes don't have data futures and have in-degree > 0
-            for input_dependency_node in workflow_graph.predecessors(app_node_id):
-                if workflow_graph.nodes[input_dependency_node]['type'] == 'data':
-                    if input_dependency_node not in data_futures and data_node_in_degree[input_dependency_node] > 0:
-                        register_app(list(workflow_graph.predecessors(input_dependency_node))[0], workflow_graph)
-                elif workflow_graph.nodes[input_dependency_node]['type'] == 'app':
-                    if not app_nodes_registered[input_dependency_node]:
-                        register_app(input_dependency_node, workflow_graph)
-
-            # Register this app
-            _app_blueprint = workflow_graph.node[app_node_id]['blueprint']
-            _app_inputs = [
-                data_futures.get(input_data)
-                for input_data in _app_blueprint['inputs']
-                if data_futures.get(input_data)
-            ]
-
-            # If there are any app dependencies, add them
-            if _app_blueprint['wait_on']:
-                _app_inputs.extend([
-                    app_nodes_registered.get(wait_on_app_id)
-                    for wait_on_app_id in _app_blueprint['wait_on']
-                    if app_nodes_registered.get(wait_on_app_id)
-                ])
-
             # Select executor to run this app on
             executor_assignment = 'all'
             if not any((is_single_parsl_config, is_single_pipeline_meta)):
@@ -832,15 +1347,33 @@ class ParslPipeline(object):
                 elif Meta._default_executor is not None and Meta._default_executor in app_factories:
                     executor_assignment = Meta._default_executor
 
+            # A fused task runs several apps, each of which is still logged and cached on its own
+            _member_blueprints = _app_blueprint['members'] if _app_blueprint['type'] == 'fused' else (_app_blueprint,)
+            if result_cache is not None:
+                for _member_blueprint in _member_blueprints:
+                    result_cache.release_outputs(_member_blueprint)
+
+            # Parsl can launch the app before the future comes back, so its priority and resources
+            # are set by the ID the task is about to get
+            if release_gate is not None:
+                task_id = parsl.dfk().task_count
+                if app_priorities:
+                    release_gate.prioritize(task_id, app_priorities.get(_app_blueprint['id'], 0))
+                release_gate.require(task_id, *app_resources(_app_blueprint['meta'], default_cpu=0))
+            # The metrics argument is only given to the measured apps
+            _metrics_kwargs = ({'metrics': run_metrics.app_metrics_path(_app_blueprint)} if run_metrics is not None
+                               else dict())
+
             # Create the App future with a specific executor App factory
-            if _app_blueprint['type'] == 'bash':
+            if _app_blueprint['type'] in ('bash', 'fused'):
                 _app_future = app_factories[executor_assignment][BASH_APP](
                     cmd=_app_blueprint['cmd'],
                     success_on=_app_blueprint['success_on'],
                     inputs=_app_inputs,
                     outputs=_app_blueprint['outputs'],
                     stdout=_app_blueprint['stdout'],
-                    stderr=_app_blueprint['stderr']
+                    stderr=_app_blueprint['stderr'],
+                    **_metrics_kwargs
                 )
             else:
                 _app_future = app_factories[executor_assignment][PYTHON_APP](
@@ -850,28 +1383,178 @@ class ParslPipeline(object):
                     inputs=_app_inputs,
                     outputs=_app_blueprint['outputs'],
                     stdout=_app_blueprint['stdout'],
-                    stderr=_app_blueprint['stderr']
+                    stderr=_app_blueprint['stderr'],
+                    **_metrics_kwargs
                 )
 
-            logger.info('{} assigned to executor {}, task id {}'.format(_app_blueprint['id'], executor_assignment, _app_future.tid))
-            app_futures.append((_app_blueprint['id'], _app_future))
+            _member_futures = (FusedTask(_app_future, _app_blueprint).app_futures if _app_blueprint['type'] == 'fused'
+                               else [_app_future])
+            for _member_blueprint, _member_future in zip(_member_blueprints, _member_futures):
+                logger.info('{} assigned to executor {}, task id {}'.format(_member_blueprint['id'], executor_assignment, _app_future.tid))
+                if result_cache is not None:
+                    result_cache.store_when_done(_member_blueprint, _member_future)
+                if run_metrics is not None:
+                    run_metrics.record_when_done(
+                        _member_blueprint, _member_future, executor_assignment,
+                        task_blueprint=_app_blueprint if _app_blueprint['type'] == 'fused' else None,
+                        sample=_app_blueprint['type'] != 'python' and (
+                            executor_assignment in local_executors
+                            or (executor_assignment == 'all' and len(local_executors) == len(parsl_config.executors))
+                        )
+                    )
+                if app_hooks is not None:
+                    app_hooks.submitted(_member_blueprint, _member_future, executor_assignment)
+            return _member_futures if _app_blueprint['type'] == 'fused' else _app_future
+
+        def app_is_up_to_date(_app_blueprint):
+            if incremental and ParslPipeline._app_is_up_to_date(_app_blueprint):
+                return True
+            return result_cache is not None and result_cache.restore(_app_blueprint)
+
+        return submit_app, app_is_up_to_date if incremental or result_cache is not None else None
+
+    @staticmethod
+    def _register_apps(workflow_graph, submit_app, app_is_up_to_date=None, priorities=None, chains=None,
+                       batches=None, batch_slots=1):
+        """
+        Traverses the workflow graph in topological order and submits each app once all of its
+        dependencies have been submitted. Every node and edge is visited exactly once and no
+        recursion is used, so arbitrarily long chains of apps can be registered in linear time.
+
+        If priorities are given, apps whose dependencies are all submitted are taken highest
+        priority first, so apps Parsl can start right away reach it in priority order. Ties are
+        broken by the order apps were registered in.
+
+        If app_is_up_to_date is given, an app none of whose dependencies are being re-run is checked
+        with it first; up to date apps are not submitted and instead get already completed futures.
+
+        If chains are given, the first app of a chain that has to run is submitted together with
+        every app after it, as a single fused task. Apps of the chain before it were up to date.
+        Likewise, if batches are given, every app of a batch that has to run is submitted as a
+        single task, which runs up to batch_slots of them at once.
+
+        :param workflow_graph: nx.DiGraph Directed graph representation of the workflow
+        :param submit_app: function Called as submit_app(blueprint, inputs), returns an AppFuture,
+                           or a list of futures for a fused blueprint
+        :param app_is_up_to_date: function Called as app_is_up_to_date(blueprint), returns bool
+        :param priorities: dict Priority of every node in the graph
+        :param chains: dict<str, tuple<str>> Linear chain each fusable app belongs to, see linear_chains()
+        :param batches: dict<str, tuple<str>> Batch of siblings each app belongs to, see sibling_batches()
+        :param batch_slots: int Most apps of a batch run at once
+        :return: (list<(str, AppFuture)>, dict<str, DataFuture>) App futures in submission order
+                 and data futures keyed by filename
+        """
+        # Resolve the full order up front so a cycle is reported before anything is submitted
+        try:
+            if priorities:
+                graph_order = {node: node_i for node_i, node in enumerate(workflow_graph)}
+                registration_order = list(nx.lexicographical_topological_sort(
+                    workflow_graph, key=lambda node: (-priorities[node], graph_order[node])
+                ))
+            else:
+                registration_order = list(nx.topological_sort(workflow_graph))
+        except nx.NetworkXUnfeasible:
+            raise MalformedPipelineError('Workflow graph contains a cycle')
+
+        app_futures, data_futures, app_node_futures = list(), dict(), dict()
+
+        def app_inputs(_app_blueprint):
+            # All producers of this app's inputs are guaranteed to already be submitted
+            _app_inputs = [
+                data_futures[input_data]
+                for input_data in _app_blueprint['inputs']
+                if input_data in data_futures
+            ]
+
+            # If there are any app dependencies, add them
+            if _app_blueprint['wait_on']:
+                _app_inputs.extend([
+                    app_node_futures[wait_on_app_id]
+                    for wait_on_app_id in _app_blueprint['wait_on']
+                    if wait_on_app_id in app_node_futures
+                ])
+            return _app_inputs
+
+        def resolve(resolved_node_id, _app_future):
+            app_node_futures[resolved_node_id] = _app_future
 
             # Set output data futures
             for data_fut in _app_future.outputs:
                 if data_fut.filename not in data_futures:
                     data_futures[data_fut.filename] = data_fut
 
-            app_nodes_registered[app_node_id] = _app_future
-
-        # Register all apps
-        for app_node in app_nodes_registered:
-            if not app_nodes_registered[app_node]:
-                register_app(app_node, workflow_graph)
+        def skip_if_up_to_date(_app_blueprint, _app_inputs):
+            # An app can only be skipped if nothing it depends on is going to be re-run
+            if (app_is_up_to_date is not None
+                    and all(isinstance(f, _CompletedFuture) for f in _app_inputs)
+                    and app_is_up_to_date(_app_blueprint)):
+                logger.info('{} is up to date, skipping'.format(_app_blueprint['id']))
+                resolve(_app_blueprint['id'], _CompletedFuture(outputs=[
+                    _CompletedFuture(result=output_data, filename=output_data)
+                    for output_data in _app_blueprint['outputs']
+                ]))
+                return True
+            return False
+
+        def submit(node_ids, _app_inputs, fuse):
+            blueprints = [workflow_graph.nodes[submitted_node_id]['blueprint'] for submitted_node_id in node_ids]
+            if len(blueprints) > 1:
+                _app_futures = submit_app(fuse(blueprints, ParslPipeline._pipeline_run_temp_dir.name), _app_inputs)
+            else:
+                _app_futures = [submit_app(blueprints[0], _app_inputs)]
+            for submitted_node_id, _app_future in zip(node_ids, _app_futures):
+                app_futures.append((submitted_node_id, _app_future))
+                resolve(submitted_node_id, _app_future)
+
+        for node_id in registration_order:
+            if workflow_graph.nodes[node_id].get('type') != 'app' or node_id in app_node_futures:
+                continue  # Apps of a fused task are all submitted with the first of them
+
+            if batches and node_id in batches:
+                # Every app of a batch depends on the same apps, so all of them are ready now
+                batch_node_ids, batch_inputs = list(), dict()
+                for batch_node_id in batches[node_id]:
+                    _app_blueprint = workflow_graph.nodes[batch_node_id]['blueprint']
+                    _app_inputs = app_inputs(_app_blueprint)
+                    if not skip_if_up_to_date(_app_blueprint, _app_inputs):
+                        batch_node_ids.append(batch_node_id)
+                        batch_inputs.update((id(f), f) for f in _app_inputs)
+                if batch_node_ids:
+                    submit(batch_node_ids, list(batch_inputs.values()),
+                           partial(fuse_batch, slots=batch_slots))
+                continue
+
+            _app_blueprint = workflow_graph.nodes[node_id]['blueprint']
+            _app_inputs = app_inputs(_app_blueprint)
+            if not skip_if_up_to_date(_app_blueprint, _app_inputs):
+                # Apps of a chain before this one were up to date
+                chain = chains.get(node_id, ()) if chains else ()
+                submit(chain[chain.index(node_id):] if chain else [node_id], _app_inputs, fuse_chain)
+
+        return app_futures, data_futures
 
-        # Gather files marked as temporary, if any
-        tmp_files = [d for d in data_futures if Data(d).tmp]
+    @staticmethod
+    def _app_is_up_to_date(app_blueprint):
+        """
+        Make-style freshness check on the files an app reads and writes. An app is up to date if it
+        declares at least one output, every output exists and is non-empty, and no output is older
+        than the newest of its inputs. A missing input means the app needs to run.
 
-        return app_futures, tmp_files
+        :param app_blueprint: dict Blueprint of the app to check
+        :return: bool Whether the app can be skipped
+        """
+        if not app_blueprint['outputs']:
+            return False
+        try:
+            output_stats = [os.stat(output_data) for output_data in app_blueprint['outputs']]
+            input_mtimes = [os.stat(input_data).st_mtime for input_data in app_blueprint['inputs']]
+        except OSError:
+            return False
+
+        # Empty outputs are most likely left over from an earlier failure
+        if any(output_stat.st_size == 0 for output_stat in output_stats):
+            return False
+        return not input_mtimes or min(o.st_mtime for o in output_stats) >= max(input_mtimes)
 
     @staticmethod
     def _assemble_graph(blueprints):
@@ -879,6 +1562,8 @@ class ParslPipeline(object):
         digraph = nx.DiGraph()
 
         # Iterate through edges, and add nodes as necessary
+        # Data nodes are keyed by the integer ID of their path, and named by the path itself
+        data_id = Data._data.id
         for blueprint in blueprints:
             # Add software node
             app_id = blueprint['id']
@@ -887,29 +1572,18 @@ class ParslPipeline(object):
 
             # Register inputs, outputs, and wait_on
             for blp_input in blueprint['inputs']:
-                digraph.add_node(blp_input, name=blp_input, type='data')
-                digraph.add_edge(blp_input, app_id)
+                input_id = data_id(blp_input)
+                digraph.add_node(input_id, name=blp_input, type='data')
+                digraph.add_edge(input_id, app_id)
 
             for blp_output in blueprint['outputs']:
-                digraph.add_node(blp_output, name=blp_output, type='data')
-                digraph.add_edge(app_id, blp_output)
+                output_id = data_id(blp_output)
+                digraph.add_node(output_id, name=blp_output, type='data')
+                digraph.add_edge(app_id, output_id)
 
             for blp_wait_on in blueprint['wait_on']:
                 digraph.add_edge(blp_wait_on, app_id)
 
-        # Output graph in JSON format
-        json_digraph = {'nodes': list(), 'edges': list()}
-        for node, nodedata in digraph.nodes.items():
-            json_digraph['nodes'].append(
-                {'data': {'id': os.path.basename(node), 'type': nodedata['type'], 'haveblueprint': bool(nodedata.get('blueprint'))}}
-            )
-        for edge, edgedata in digraph.edges.items():
-            json_digraph['edges'].append(
-                {'data': {'source': os.path.basename(edge[SOURCE]), 'target': os.path.basename(edge[TARGET])}}
-            )
-        # print(json.dumps(json_digraph, indent=2))
-        # TODO Find a way to output this to the user, maybe in the logs directory
-
         return digraph
 
     def sites(self):
@@ -918,6 +1592,17 @@ class ParslPipeline(object):
         """
         return self.executors()
 
+    def hooks(self):
+        """
+        Override this method.
+
+        A list of ``operon.hooks.AppHook`` instances to tell what happens to each app of a run,
+        such as for profiling or instrumentation.
+
+        :return: list A list of AppHook instances
+        """
+        return list()
+
     def executors(self):
         """
         Override this method.
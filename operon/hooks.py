@@ -0,0 +1,68 @@
+from collections import namedtuple
+
+
+class AppEvent(namedtuple('AppEvent', 'event app_id blueprint executor time registered submitted launched ended')):
+    """
+    Something that happened to an app, as handed to an AppHook.
+
+    event is one of registered, submitted, launched, finished, or failed, and time is when it
+    happened. registered, submitted, launched, and ended are when the app got that far, or None if
+    it hasn't yet; launched is the first time it was launched, if Parsl retried it. All times are
+    seconds since the epoch. blueprint is everything the app was registered with, and executor is
+    the label of the executor it was assigned to, once it's submitted.
+    """
+    __slots__ = ()
+
+
+class AppHook(object):
+    """
+    Subclass this and override any of its methods to be told what happens to each app of a run.
+
+    Hooks are handed to a run by the ``hooks()`` method of a pipeline, or by a site plugin: a
+    package with an ``operon.hooks`` entry point naming a subclass, which is then used for every
+    run on that site.
+
+    Every method is called from one thread of Operon's, in the order things happened, and never
+    from the threads running or monitoring apps, so a slow hook doesn't hold up the run. A hook
+    that raises is dropped for the rest of the run.
+    """
+    def app_registered(self, event):
+        """
+        Called for each app of the workflow before any is handed to Parsl.
+        :param event: AppEvent
+        """
+        pass
+
+    def app_submitted(self, event):
+        """
+        Called once an app has been handed to Parsl, with its executor.
+        :param event: AppEvent
+        """
+        pass
+
+    def app_launched(self, event):
+        """
+        Called each time Parsl launches an app, once its dependencies are done.
+        :param event: AppEvent
+        """
+        pass
+
+    def app_finished(self, event):
+        """
+        Called when an app completes successfully.
+        :param event: AppEvent
+        """
+        pass
+
+    def app_failed(self, event):
+        """
+        Called when an app fails, or won't run because a dependency failed.
+        :param event: AppEvent
+        """
+        pass
+
+    def run_finished(self):
+        """
+        Called once after every other call, when the run is over.
+        """
+        pass
@@ -0,0 +1,135 @@
+import os
+import pytest
+from concurrent.futures import Future
+
+from operon._util.cache import ResultCache, parse_size, format_size
+from operon._cli.subcommands.cache import Subcommand, EXIT_CMD_SYNTAX_ERROR
+
+
+def cache_blueprint(tmpdir, cmd='sort in.txt', outputs=('out.txt',)):
+    return {
+        'id': 'sort_1',
+        'type': 'bash',
+        'cmd': cmd,
+        'success_on': ['0'],
+        'inputs': [str(tmpdir.join('in.txt'))],
+        'outputs': [str(tmpdir.join(o)) for o in outputs],
+        'wait_on': list()
+    }
+
+
+def test_sizes():
+    assert parse_size('512') == 512
+    assert parse_size('2K') == 2048
+    assert parse_size('1.5G') == int(1.5 * 1024 ** 3)
+    assert parse_size('10gb') == 10 * 1024 ** 3
+    with pytest.raises(ValueError):
+        parse_size('lots')
+    assert format_size(100) == '100B'
+    assert format_size(2048) == '2.0K'
+
+
+def test_store_and_restore(tmpdir):
+    result_cache = ResultCache(cache_dir=str(tmpdir.mkdir('cache')), max_size='1M')
+    blueprint = cache_blueprint(tmpdir)
+    tmpdir.join('in.txt').write('b\na\n')
+
+    # Nothing to restore yet
+    assert not result_cache.restore(blueprint)
+
+    # Outputs are stored once the app completes successfully
+    result_cache.release_outputs(blueprint)
+    tmpdir.join('out.txt').write('a\nb\n')
+    app_future = Future()
+    result_cache.store_when_done(blueprint, app_future)
+    app_future.set_result(0)
+    result_cache.close()
+    assert len(result_cache.entries()) == 1
+
+    # A later identical app gets its outputs back
+    tmpdir.join('out.txt').remove()
+    assert result_cache.restore(blueprint)
+    assert tmpdir.join('out.txt').read() == 'a\nb\n'
+
+    # Different input content or a different command is a miss
+    tmpdir.join('in.txt').write('c\na\n')
+    assert not result_cache.restore(blueprint)
+    tmpdir.join('in.txt').write('b\na\n')
+    assert not result_cache.restore(cache_blueprint(tmpdir, cmd='sort -r in.txt'))
+    assert result_cache.restore(blueprint)
+
+    # Re-running the app must not rewrite the cached copy through a hard link
+    result_cache.release_outputs(blueprint)
+    tmpdir.join('out.txt').write('changed\n')
+    tmpdir.join('out.txt').remove()
+    assert result_cache.restore(blueprint)
+    assert tmpdir.join('out.txt').read() == 'a\nb\n'
+
+
+def test_rewritten_entry_not_restored(tmpdir):
+    result_cache = ResultCache(cache_dir=str(tmpdir.mkdir('cache')))
+    blueprint = cache_blueprint(tmpdir)
+    tmpdir.join('in.txt').write('b\na\n')
+    tmpdir.join('out.txt').write('a\nb\n')
+    result_cache.store(blueprint)
+
+    # Outputs are copied in, so rewriting the output in place leaves the entry as it was
+    with open(str(tmpdir.join('out.txt')), 'w') as out:
+        out.write('rewritten\n')
+    assert result_cache.restore(blueprint)
+    assert tmpdir.join('out.txt').read() == 'a\nb\n'
+
+    # A restored output is a hard link to the entry, so rewriting it in place, such as by a run
+    # without the cache, changes the entry; it's removed rather than restored
+    with open(str(tmpdir.join('out.txt')), 'w') as out:
+        out.write('rewritten by a later run\n')
+    assert not result_cache.restore(blueprint)
+    assert not result_cache.entries()
+
+
+def test_failed_apps_not_stored(tmpdir):
+    result_cache = ResultCache(cache_dir=str(tmpdir.mkdir('cache')))
+    blueprint = cache_blueprint(tmpdir)
+    tmpdir.join('in.txt').write('b\na\n')
+    tmpdir.join('out.txt').write('partial')
+
+    app_future = Future()
+    result_cache.store_when_done(blueprint, app_future)
+    app_future.set_exception(RuntimeError('app failed'))
+    result_cache.close()
+    assert not result_cache.entries()
+
+
+def test_lru_eviction(tmpdir):
+    result_cache = ResultCache(cache_dir=str(tmpdir.mkdir('cache')))
+    tmpdir.join('in.txt').write('input')
+    blueprints = [cache_blueprint(tmpdir, cmd='step {}'.format(i), outputs=['out{}.txt'.format(i)])
+                  for i in range(3)]
+    for i, blueprint in enumerate(blueprints):
+        tmpdir.join('out{}.txt'.format(i)).write('x' * 100)
+        result_cache.store(blueprint)
+        os.utime(os.path.join(result_cache.cache_dir, result_cache.key(blueprint), 'manifest.json'),
+                 (1000 + i, 1000 + i))
+
+    # Using the oldest entry makes it the most recently used
+    assert result_cache.restore(blueprints[0])
+
+    # Shrinking to fit two entries drops the least recently used one
+    assert result_cache.evict(200) == (1, 100)
+    assert not result_cache.restore(blueprints[1])
+    assert result_cache.restore(blueprints[0]) and result_cache.restore(blueprints[2])
+
+
+def test_cache_command(tmpdir, capsys):
+    cache_dir = str(tmpdir.join('cache'))
+    cache_command = Subcommand()
+
+    # Looking at a cache nothing was stored in doesn't create it
+    cache_command.run(['info', '--cache-dir', cache_dir])
+    assert 'Entries: 0' in capsys.readouterr().out
+    assert not os.path.exists(cache_dir)
+
+    with pytest.raises(SystemExit) as exit_info:
+        cache_command.run(['prune', '--max-size', '10X', '--cache-dir', cache_dir])
+    assert exit_info.value.code == EXIT_CMD_SYNTAX_ERROR
+    assert 'Could not interpret 10X as a size' in capsys.readouterr().err
@@ -3,11 +3,12 @@ import pytest
 import tempfile
 from operon.components import CondaPackage, Software, Data, Parameter, Redirect, Pipe, CodeBlock, ParslPipeline
 from operon._util.apps import _ParslAppBlueprint, _DeferredApp
+from operon._util.data import _DataRegistry
 
 
 def test_data():
     # Reset _data storage
-    Data._data = dict()
+    Data._data = _DataRegistry()
 
     # Turn into string as expected
     d_norm = Data('/path/to/data')
@@ -48,6 +49,25 @@ def test_data():
     assert len(Data._data) == 3  # Ensure new Data object was not created
 
 
+def test_data_registry():
+    Data._data = _DataRegistry()
+
+    # Paths get compact IDs in the order they're first seen
+    d_first, d_second = Data('/path/to/first'), Data('/path/to/second')
+    assert (d_first.id, d_second.id) == (0, 1)
+    assert Data._data.paths == ['/path/to/first', '/path/to/second']
+
+    # Objects nothing refers to anymore are freed, but their ID and marks are kept
+    Data('/path/to/tmp').as_output(tmp=True)
+    d_first.as_input()
+    del d_first
+    assert Data._data.get_object('/path/to/first') is None
+    assert Data('/path/to/first').id == 0
+    assert Data('/path/to/first').mode == Data.INPUT
+    assert Data('/path/to/tmp').tmp
+    assert len(Data._data) == 3
+
+
 # Parameter objects
 def test_parameters():
     p_single = Parameter('one')
@@ -181,6 +201,15 @@ def test_software():
     assert len(_ParslAppBlueprint._blueprints) == 1
     assert list(_ParslAppBlueprint._blueprints.keys()) == ['soft1_1']
 
+    # Registered blueprints are read like the dicts .prep() returns
+    _soft1_blueprint = _ParslAppBlueprint._blueprints['soft1_1']
+    assert _soft1_blueprint['cmd'] == '/path/to/soft1 -a one'
+    assert _soft1_blueprint['stdout'] == '/path/to/dest'
+    assert _soft1_blueprint.get('func') is None and 'func' not in _soft1_blueprint
+    assert sorted(_soft1_blueprint.as_dict()) == sorted(software1.prep(Parameter('-a', 'one')))
+    with pytest.raises(KeyError):
+        _soft1_blueprint['func']
+
     # .prep() unique ID per call
     assert software2.prep()['id'] != software2.prep()['id']
 
@@ -0,0 +1,88 @@
+import os
+import json
+import logging
+import tempfile
+
+import networkx as nx
+import parsl
+
+from operon.components import Software, Parameter, Redirect, Data, ParslPipeline
+from operon._util.apps import _ParslAppBlueprint
+from operon._util.data import _DataRegistry
+from operon._util.configs import built_in_configs
+from operon._util.export import app_runs, export_graph
+from operon._util.logging import setup_logger
+from operon.meta import Meta
+
+logger = logging.getLogger('operon.main')
+
+
+def reset_components(capture_dir):
+    ParslPipeline._pipeline_run_temp_dir = tempfile.TemporaryDirectory(dir=capture_dir, suffix='__operon')
+    _ParslAppBlueprint._id_counter = 0
+    _ParslAppBlueprint._blueprints = dict()
+    Data._data = _DataRegistry()
+    Meta._executors = dict()
+    logger.handlers = list()
+    parsl.clear()
+
+
+def test_export_graph(tmpdir):
+    reset_components(str(tmpdir))
+    step = Software('step', '/bin/step')
+    step.register(Parameter(Data('in & <out>').as_input()), Parameter(Data('mid').as_output()))
+    step.register(Parameter(Data('mid').as_input()), Parameter(Data('out').as_output()), meta={'executor': 'large'})
+    workflow_graph = ParslPipeline._assemble_graph(_ParslAppBlueprint._blueprints.values())
+
+    path_prefix = str(tmpdir.join('run__graph'))
+    export_graph(workflow_graph, path_prefix, graphml=True, started='2018-09-01 12:00:00', app_runs=app_runs(
+        state={'step_1': 'completed', 'step_2': 'failed'},
+        times={'step_1': (100.0, 102.5), 'step_2': (102.5, None)},
+        run_start=99.0
+    ))
+    assert not tmpdir.join('run__graph.json.partial').exists()
+
+    with open(path_prefix + '.json') as graph_file:
+        graph = json.load(graph_file)
+    assert graph['started'] == '2018-09-01 12:00:00'
+    nodes = {node['id']: node for node in graph['nodes']}
+    input_id = 'data:{}'.format(Data._data.id('in & <out>'))
+    assert nodes['step_1'] == {'id': 'step_1', 'type': 'app', 'name': '/bin/step', 'status': 'completed',
+                               'start': 1.0, 'end': 3.5, 'duration': 2.5}
+    assert nodes['step_2'] == {'id': 'step_2', 'type': 'app', 'name': '/bin/step', 'executor': 'large',
+                               'status': 'failed', 'start': 3.5}
+    assert nodes[input_id] == {'id': input_id, 'type': 'data', 'name': 'in & <out>'}
+    assert len(nodes) == 5
+    assert [input_id, 'step_1'] in graph['edges'] and len(graph['edges']) == 4
+
+    # The GraphML holds the same graph
+    graphml = nx.read_graphml(path_prefix + '.graphml')
+    assert set(graphml.nodes) == set(nodes)
+    assert graphml.nodes['step_1']['duration'] == 2.5
+    assert graphml.nodes[input_id]['name'] == 'in & <out>'
+    assert set(graphml.edges) == set(map(tuple, graph['edges']))
+
+
+def test_graph_export_run(tmpdir):
+    reset_components(str(tmpdir))
+    setup_logger(str(tmpdir))
+    tmpdir.join('in.txt').write('hello\n')
+    grep = Software('grep', '/bin/grep')
+    grep.register(Parameter('hello', Data(str(tmpdir.join('in.txt'))).as_input()),
+                  Redirect(stream='>', dest=Data(str(tmpdir.join('hello.txt')))))
+    grep.register(Parameter('goodbye', Data(str(tmpdir.join('in.txt'))).as_input()),
+                  Redirect(stream='>', dest=Data(str(tmpdir.join('goodbye.txt')))))
+
+    ParslPipeline._start_and_monitor_run(
+        workflow_graph=ParslPipeline._assemble_graph(_ParslAppBlueprint._blueprints.values()),
+        parsl_config=built_in_configs['basic-threads-2'](),
+        graph_export=str(tmpdir.join('run__graph'))
+    )
+    logger.handlers = list()
+
+    # After the run, the graph has how each app went
+    with open(str(tmpdir.join('run__graph.json'))) as graph_file:
+        nodes = {node['id']: node for node in json.load(graph_file)['nodes']}
+    assert nodes['grep_1']['status'] == 'completed' and nodes['grep_2']['status'] == 'failed'
+    assert 0 <= nodes['grep_1']['start'] <= nodes['grep_1']['end']
+    assert not os.path.exists(str(tmpdir.join('run__graph.graphml')))
@@ -0,0 +1,153 @@
+import os
+import glob
+import logging
+import tempfile
+
+import parsl
+
+from operon.components import Software, Parameter, Redirect, Data, CodeBlock, ParslPipeline
+from operon._util.apps import _ParslAppBlueprint
+from operon._util.data import _DataRegistry
+from operon._util.configs import built_in_configs
+from operon._util.fusion import linear_chains, sibling_batches
+from operon._util.logging import setup_logger
+from operon.meta import Meta
+
+logger = logging.getLogger('operon.main')
+
+
+def reset_components(capture_dir):
+    ParslPipeline._pipeline_run_temp_dir = tempfile.TemporaryDirectory(dir=capture_dir, suffix='__operon')
+    _ParslAppBlueprint._id_counter = 0
+    _ParslAppBlueprint._blueprints = dict()
+    Data._data = _DataRegistry()
+    Meta._executors = dict()
+    logger.handlers = list()
+    parsl.clear()
+
+
+def noop():
+    pass
+
+
+def test_linear_chains(tmpdir):
+    reset_components(str(tmpdir))
+    step = Software('step', '/bin/step')
+
+    # sort -> index -> stats, with the sorted file also read by an app outside the chain
+    for source, target in [('in', 'sorted'), ('sorted', 'indexed'), ('indexed', 'stats'), ('sorted', 'counts')]:
+        step.register(Parameter(Data(source).as_input()), Parameter(Data(target).as_output()))
+
+    # A chain broken by a change of executor, and one ending in a python app
+    step.register(Parameter(Data('x0').as_input()), Parameter(Data('x1').as_output()))
+    step.register(Parameter(Data('x1').as_input()), Parameter(Data('x2').as_output()))
+    step.register(Parameter(Data('x2').as_input()), Parameter(Data('x3').as_output()), meta={'executor': 'large'})
+    CodeBlock.register(func=noop, inputs=['x3'])
+
+    chains = linear_chains(ParslPipeline._assemble_graph(_ParslAppBlueprint._blueprints.values()))
+    assert chains == {
+        'step_2': ('step_2', 'step_3'),
+        'step_3': ('step_2', 'step_3'),
+        'step_5': ('step_5', 'step_6'),
+        'step_6': ('step_5', 'step_6')
+    }
+
+    # Long chains are split
+    chains = linear_chains(ParslPipeline._assemble_graph(_ParslAppBlueprint._blueprints.values()), max_length=1)
+    assert chains == dict()
+
+
+def test_fused_chains_run(tmpdir):
+    reset_components(str(tmpdir))
+    setup_logger(str(tmpdir))
+    tmpdir.join('in.txt').write('hello\n')
+    cat = Software('cat', '/bin/cat')
+    grep = Software('grep', '/bin/grep')
+
+    # A chain that succeeds, and one whose second app finds nothing
+    for chain in ('ok', 'bad'):
+        previous = str(tmpdir.join('in.txt'))
+        for i, pattern in enumerate(['hello', 'goodbye' if chain == 'bad' else 'hello', 'hello']):
+            current = str(tmpdir.join('{}{}.txt'.format(chain, i)))
+            grep.register(Parameter(pattern, Data(previous).as_input()), Redirect(stream='>', dest=Data(current)))
+            previous = current
+    cat.register(Parameter(Data(str(tmpdir.join('ok2.txt'))).as_input()),
+                 Redirect(stream='>', dest=Data(str(tmpdir.join('final.txt')))))
+
+    workflow_graph = ParslPipeline._assemble_graph(_ParslAppBlueprint._blueprints.values())
+    ParslPipeline._start_and_monitor_run(
+        workflow_graph=workflow_graph,
+        parsl_config=built_in_configs['basic-threads-2'](),
+        fuse_chains=True
+    )
+    logger.handlers = list()
+
+    assert tmpdir.join('final.txt').read() == 'hello\n'
+    assert not tmpdir.join('bad2.txt').exists()
+
+    with open(glob.glob(os.path.join(str(tmpdir), '*.log'))[0]) as log:
+        log_messages = [line.split('> ')[-1].strip() for line in log]
+    assert 'Fusing 7 apps in 2 linear chains into single tasks' in log_messages
+    task_ids = {message.split()[0]: message.split()[-1] for message in log_messages
+                if 'assigned to executor' in message}
+    assert task_ids['grep_1'] == task_ids['grep_2'] == task_ids['grep_3'] == task_ids['cat_7']
+
+    # Each app is still followed and accounted for on its own
+    for app_id in ('grep_{}'.format(i) for i in range(1, 7)):
+        assert '{} staged to run'.format(app_id) in log_messages
+    assert 'grep_5 failed during execution' in log_messages
+    assert 'grep_6 had a dependency fail' in log_messages
+    assert 'Failed apps: grep_5 grep_6' in log_messages
+
+
+def test_sibling_batches(tmpdir):
+    reset_components(str(tmpdir))
+    step = Software('step', '/bin/step')
+
+    # Five apps reading the same file, and one of them read in turn by two more
+    for i in range(5):
+        step.register(Parameter(Data('in').as_input()), Parameter(Data('qc{}'.format(i)).as_output()))
+    for i in range(2):
+        step.register(Parameter(Data('qc0').as_input()), Parameter(Data('stats{}'.format(i)).as_output()))
+
+    workflow_graph = ParslPipeline._assemble_graph(_ParslAppBlueprint._blueprints.values())
+    batches = sibling_batches(workflow_graph, batch_size=3)
+    assert set(batches.values()) == {('step_1', 'step_2', 'step_3'), ('step_4', 'step_5'), ('step_6', 'step_7')}
+    assert 'step_6' not in sibling_batches(workflow_graph, batch_size=3, exclude={'step_7'})
+
+    # Apps expected to take about as long are batched together
+    batches = sibling_batches(workflow_graph, batch_size=3, estimates={'step_5': 60, 'step_4': 50, 'step_1': 40})
+    assert batches['step_1'] == ('step_5', 'step_4', 'step_1') and batches['step_2'] == ('step_2', 'step_3')
+
+
+def test_packed_siblings_run(tmpdir):
+    reset_components(str(tmpdir))
+    setup_logger(str(tmpdir))
+    tmpdir.join('in.txt').write('hello\n')
+    grep = Software('grep', '/bin/grep')
+    for i, pattern in enumerate(['hello', 'hell', 'goodbye', 'he', 'h']):
+        grep.register(Parameter(pattern, Data(str(tmpdir.join('in.txt'))).as_input()),
+                      Redirect(stream='>', dest=Data(str(tmpdir.join('qc{}.txt'.format(i))))))
+
+    ParslPipeline._start_and_monitor_run(
+        workflow_graph=ParslPipeline._assemble_graph(_ParslAppBlueprint._blueprints.values()),
+        parsl_config=built_in_configs['basic-threads-2'](),
+        pack_siblings=3,
+        pack_slots=2
+    )
+    logger.handlers = list()
+
+    for i in (0, 1, 3, 4):
+        assert tmpdir.join('qc{}.txt'.format(i)).read() == 'hello\n'
+
+    with open(glob.glob(os.path.join(str(tmpdir), '*.log'))[0]) as log:
+        log_messages = [line.split('> ')[-1].strip() for line in log]
+    assert 'Packing 5 sibling apps into 2 tasks, running 2 at once' in log_messages
+    task_ids = {message.split()[0]: message.split()[-1] for message in log_messages
+                if 'assigned to executor' in message}
+    assert task_ids['grep_1'] == task_ids['grep_2'] == task_ids['grep_3'] != task_ids['grep_4'] == task_ids['grep_5']
+
+    # The failure of one app in a task doesn't stop or fail the others
+    assert 'grep_3 failed during execution' in log_messages
+    assert 'Failed apps: grep_3' in log_messages
+    assert 'Apps never ran: None' in log_messages
@@ -0,0 +1,113 @@
+import os
+import logging
+import tempfile
+
+import parsl
+
+from operon.components import Software, Parameter, Redirect, Data, CodeBlock, ParslPipeline
+from operon._util.apps import _ParslAppBlueprint
+from operon._util.data import _DataRegistry
+from operon._util.configs import built_in_configs
+from operon._util.history import MAX_STEP_SAMPLES, RunHistory, StepModel, step_name
+from operon._util.metrics import RunMetrics
+from operon._util.logging import setup_logger
+from operon._util.scheduling import CriticalPath
+from operon.meta import Meta
+
+logger = logging.getLogger('operon.main')
+
+
+def reset_components(capture_dir):
+    ParslPipeline._pipeline_run_temp_dir = tempfile.TemporaryDirectory(dir=capture_dir, suffix='__operon')
+    _ParslAppBlueprint._id_counter = 0
+    _ParslAppBlueprint._blueprints = dict()
+    Data._data = _DataRegistry()
+    Meta._executors = dict()
+    logger.handlers = list()
+    parsl.clear()
+
+
+def noop():
+    pass
+
+
+def test_step_model():
+    # Twice as long for twice the input, plus a second to start
+    model = StepModel([(1000, 3.0), (2000, 5.0), (4000, 9.0), (None, 100.0)])
+    assert model.runs == 4
+    assert abs(model.predict(3000) - 7.0) < 1e-9
+    assert model.predict() == model.typical == 7.0
+
+    # Too few sizes to fit, or no faster on smaller inputs, fall back to the median
+    assert StepModel([(1000, 3.0), (2000, 5.0)]).slope is None
+    assert StepModel([(1000, 9.0), (2000, 5.0), (4000, 3.0)]).predict(8000) == 5.0
+
+
+def test_run_history(tmpdir):
+    reset_components(str(tmpdir))
+    for name, size in (('small', 100), ('large', 10000)):
+        tmpdir.join(name).write('x' * size)
+    step = Software('step', '/opt/bin/step')
+    for name in ('small', 'large', 'missing'):
+        step.register(Parameter(Data(str(tmpdir.join(name))).as_input()), action='step {}'.format(name))
+    CodeBlock.register(func=noop)
+    blueprints = list(_ParslAppBlueprint._blueprints.values())
+    history_path = str(tmpdir.join('history.db'))
+
+    # Reading a history nothing was saved to doesn't create it
+    history = RunHistory('pipe', history_path)
+    assert history.models() == dict() and not os.path.exists(history_path)
+    for size, seconds in ((100, 2.0), (1000, 11.0), (10000, 101.0), (200, 3.0)):
+        history.add(blueprints[0], seconds, size)
+    history.add(blueprints[3], 0.5)
+    history.save()
+    RunHistory('other', history_path).save()
+
+    # Each step is modeled on its own, keyed by the basename of its program, whatever its action
+    history = RunHistory('pipe', history_path)
+    assert set(history.models()) == {'step', 'noop'}
+    assert RunHistory('other', history_path).models() == dict()
+    predictions = history.predictions(ParslPipeline._assemble_graph(blueprints))
+    assert abs(predictions['step_1'] - 2.0) < 1e-6 and abs(predictions['step_2'] - 101.0) < 1e-6
+    assert predictions['step_3'] == history.models()['step'].typical
+    assert predictions['noop_4'] == 0.5
+
+    # Predictions order the critical path
+    critical_path = CriticalPath(ParslPipeline._assemble_graph(blueprints), predictions)
+    assert critical_path.path == ['step_2']
+
+    # Only the latest durations of a step are kept
+    for _ in range(2):
+        for i in range(MAX_STEP_SAMPLES):
+            history.add(blueprints[3], 1.0)
+        history.save()
+    assert RunHistory('pipe', history_path).models()['noop'].runs == MAX_STEP_SAMPLES
+
+    # Subprograms of the same program are steps of their own
+    samtools_sort = Software('samtools', '/opt/bin/samtools', subprogram='sort')
+    samtools_sort.register(Parameter('in.bam'), action='sort sample_1/in.bam')
+    assert step_name(_ParslAppBlueprint._blueprints['samtools_5']) == 'samtools sort'
+
+
+def test_history_from_run(tmpdir):
+    reset_components(str(tmpdir))
+    setup_logger(str(tmpdir))
+    tmpdir.join('in.txt').write('hello\n')
+    grep = Software('grep', '/bin/grep')
+    grep.register(Parameter('hello', Data(str(tmpdir.join('in.txt'))).as_input()),
+                  Redirect(stream='>', dest=Data(str(tmpdir.join('hello.txt')))))
+    grep.register(Parameter('goodbye', Data(str(tmpdir.join('in.txt'))).as_input()),
+                  Redirect(stream='>', dest=Data(str(tmpdir.join('goodbye.txt')))))
+
+    history_path = str(tmpdir.join('history.db'))
+    ParslPipeline._start_and_monitor_run(
+        workflow_graph=ParslPipeline._assemble_graph(_ParslAppBlueprint._blueprints.values()),
+        parsl_config=built_in_configs['basic-threads-2'](),
+        run_metrics=RunMetrics(str(tmpdir.join('run.metrics.jsonl')), ParslPipeline._pipeline_run_temp_dir.name,
+                               history=RunHistory('pipe', history_path)),
+        history=RunHistory('pipe', history_path)
+    )
+    logger.handlers = list()
+
+    # Only the app that completed is added
+    assert RunHistory('pipe', history_path).models()['grep'].runs == 1
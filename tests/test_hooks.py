@@ -0,0 +1,104 @@
+import time
+import logging
+import tempfile
+from collections import defaultdict
+
+import parsl
+
+from operon.components import Software, Parameter, Redirect, Data, CodeBlock, ParslPipeline
+from operon.hooks import AppHook
+from operon._util.apps import _ParslAppBlueprint
+from operon._util.data import _DataRegistry
+from operon._util.configs import built_in_configs
+from operon._util.hooks import HookDispatcher
+from operon._util.logging import setup_logger
+from operon.meta import Meta
+
+logger = logging.getLogger('operon.main')
+
+
+def reset_components(capture_dir):
+    ParslPipeline._pipeline_run_temp_dir = tempfile.TemporaryDirectory(dir=capture_dir, suffix='__operon')
+    _ParslAppBlueprint._id_counter = 0
+    _ParslAppBlueprint._blueprints = dict()
+    Data._data = _DataRegistry()
+    Meta._executors = dict()
+    logger.handlers = list()
+    parsl.clear()
+
+
+def noop():
+    pass
+
+
+class RecordingHook(AppHook):
+    def __init__(self, delay=0):
+        self.delay = delay
+        self.events = defaultdict(list)
+        self.last_events = dict()
+        self.run_over = False
+
+    def _record(self, event):
+        time.sleep(self.delay)
+        self.events[event.app_id].append(event.event)
+        self.last_events[event.app_id] = event
+
+    app_registered = app_submitted = app_launched = app_finished = app_failed = _record
+
+    def run_finished(self):
+        self.run_over = True
+
+
+class BrokenHook(AppHook):
+    def __init__(self):
+        self.calls = 0
+
+    def app_registered(self, event):
+        self.calls += 1
+        raise ValueError('broken')
+
+
+def test_hooks(tmpdir):
+    reset_components(str(tmpdir))
+    setup_logger(str(tmpdir))
+    tmpdir.join('in.txt').write('hello\n')
+    grep = Software('grep', '/bin/grep')
+
+    # An app that completes, one that fails, one that never runs because of it, and a python app
+    grep.register(Parameter('hello', Data(str(tmpdir.join('in.txt'))).as_input()),
+                  Redirect(stream='>', dest=Data(str(tmpdir.join('hello.txt')))))
+    grep.register(Parameter('goodbye', Data(str(tmpdir.join('in.txt'))).as_input()),
+                  Redirect(stream='>', dest=Data(str(tmpdir.join('goodbye.txt')))))
+    grep.register(Parameter('goodbye', Data(str(tmpdir.join('goodbye.txt'))).as_input()),
+                  Redirect(stream='>', dest=Data(str(tmpdir.join('goodbye2.txt')))))
+    CodeBlock.register(func=noop)
+
+    # A slow hook is still handed every event by the end of the run, and a broken one is dropped
+    recording_hook, slow_hook, broken_hook = RecordingHook(), RecordingHook(delay=0.5), BrokenHook()
+    run_start = time.time()
+    ParslPipeline._start_and_monitor_run(
+        workflow_graph=ParslPipeline._assemble_graph(_ParslAppBlueprint._blueprints.values()),
+        parsl_config=built_in_configs['basic-threads-2'](),
+        app_hooks=HookDispatcher([broken_hook, recording_hook, slow_hook])
+    )
+    logger.handlers = list()
+    assert broken_hook.calls == 1
+    assert recording_hook.run_over and slow_hook.run_over
+    assert slow_hook.events == recording_hook.events
+
+    events = recording_hook.events
+    assert events['grep_1'] == ['registered', 'submitted', 'launched', 'finished']
+    # Parsl retries the failing app, and each launch is reported
+    assert events['grep_2'][:3] == ['registered', 'submitted', 'launched'] and events['grep_2'][-1] == 'failed'
+    assert set(events['grep_2'][2:-1]) == {'launched'}
+    assert events['grep_3'][:2] == ['registered', 'submitted'] and events['grep_3'][-1] == 'failed'
+    assert events['noop_4'] == ['registered', 'submitted', 'launched', 'finished']
+
+    # Each event carries the blueprint and when the app got as far as it did
+    last_event = recording_hook.last_events['grep_1']
+    assert last_event.blueprint['name'] == '/bin/grep' and last_event.executor == 'all'
+    assert run_start <= last_event.registered <= last_event.submitted <= last_event.launched <= last_event.ended
+
+
+def test_pipeline_hooks():
+    assert ParslPipeline().hooks() == list()
@@ -0,0 +1,178 @@
+import os
+import glob
+import json
+from collections import Counter
+import logging
+import tempfile
+
+import parsl
+
+from operon.components import Software, Parameter, Redirect, Data, CodeBlock, ParslPipeline
+from operon._util.apps import _ParslAppBlueprint
+from operon._util.data import _DataRegistry
+from operon._util.configs import built_in_configs
+from operon._util.metrics import RunMetrics, bound_by, read_measurements
+from operon._util.logging import setup_logger
+from operon.meta import Meta
+
+logger = logging.getLogger('operon.main')
+
+
+def reset_components(capture_dir):
+    ParslPipeline._pipeline_run_temp_dir = tempfile.TemporaryDirectory(dir=capture_dir, suffix='__operon')
+    _ParslAppBlueprint._id_counter = 0
+    _ParslAppBlueprint._blueprints = dict()
+    Data._data = _DataRegistry()
+    Meta._executors = dict()
+    logger.handlers = list()
+    parsl.clear()
+
+
+def spin():
+    sum(range(10 ** 6))
+
+
+def test_read_measurements(tmpdir):
+    metrics_file = tmpdir.join('app_1.metrics')
+    metrics_file.write('4242 1536000000,25\n1536000002,75 1000 2000\n0.5 0.25 2048\n')
+    assert read_measurements(str(metrics_file)) == {
+        'pid': 4242, 'start': 1536000000.25, 'end': 1536000002.75, 'bytes_read': 1000, 'bytes_written': 2000,
+        'cpu_user': 0.5, 'cpu_system': 0.25, 'peak_rss': 2048 * 1024
+    }
+    metrics_file.write('- 1536000000.25\n')
+    assert read_measurements(str(metrics_file)) == {'start': 1536000000.25}
+    assert read_measurements(str(tmpdir.join('missing.metrics'))) == dict()
+
+
+def test_bound_by():
+    assert bound_by(Counter(cpu=1, io=5, wait=2), cpu_time=10, wall=12) == 'io'
+    assert bound_by(Counter(cpu=4, wait=2), cpu_time=1, wall=12) == 'cpu'
+    # Too few samples to go on, so only CPU time tells
+    assert bound_by(Counter(io=1), cpu_time=0.9, wall=1) == 'cpu'
+    assert bound_by(Counter(io=1), cpu_time=0.1, wall=1) is None
+
+
+def test_run_metrics(tmpdir):
+    reset_components(str(tmpdir))
+    setup_logger(str(tmpdir))
+    tmpdir.join('in.txt').write('hello\n')
+    dd = Software('dd', '/bin/dd')
+    grep = Software('grep', '/bin/grep')
+
+    # An app using some CPU, one that fails, one that never runs because of it, and a python app
+    dd.register(Parameter('if=/dev/zero', 'of=/dev/null', 'bs=1M', 'count=500'))
+    grep.register(Parameter('goodbye', Data(str(tmpdir.join('in.txt'))).as_input()),
+                  Redirect(stream='>', dest=Data(str(tmpdir.join('goodbye.txt')))), action='grep sample1')
+    grep.register(Parameter('goodbye', Data(str(tmpdir.join('goodbye.txt'))).as_input()),
+                  Redirect(stream='>', dest=Data(str(tmpdir.join('goodbye2.txt')))), action='grep sample2')
+    CodeBlock.register(func=spin)
+
+    run_metrics = RunMetrics(str(tmpdir.join('run.metrics.jsonl')), ParslPipeline._pipeline_run_temp_dir.name)
+    ParslPipeline._start_and_monitor_run(
+        workflow_graph=ParslPipeline._assemble_graph(_ParslAppBlueprint._blueprints.values()),
+        parsl_config=built_in_configs['basic-threads-2'](),
+        run_metrics=run_metrics
+    )
+    logger.handlers = list()
+
+    with open(run_metrics.metrics_path) as metrics_file:
+        records = {record['app']: record for record in map(json.loads, metrics_file)}
+    assert set(records) == {'dd_1', 'grep_2', 'grep_3', 'spin_4'}
+
+    dd_record = records['dd_1']
+    assert dd_record['status'] == 'completed' and dd_record['name'] == 'dd'
+    assert dd_record['submit'] <= dd_record['launch'] <= dd_record['start'] <= dd_record['end']
+    assert dd_record['queue_wait'] >= 0 and dd_record['wall'] >= 0
+    assert dd_record['cpu_user'] + dd_record['cpu_system'] > 0
+    assert dd_record['peak_rss'] > 0
+
+    assert records['grep_2']['status'] == 'failed' and records['grep_2']['wall'] is not None
+    assert records['grep_3']['status'] == 'failed' and records['grep_3']['start'] is None
+
+    # Apps of the same step are named the same, whatever action they were registered with
+    assert records['grep_2']['name'] == records['grep_3']['name'] == 'grep'
+
+    python_record = records['spin_4']
+    assert python_record['name'] == 'spin' and python_record['status'] == 'completed'
+    assert python_record['wall'] >= 0 and python_record['peak_rss'] is None
+
+
+def test_fused_run_metrics(tmpdir):
+    reset_components(str(tmpdir))
+    setup_logger(str(tmpdir))
+    tmpdir.join('in.txt').write('hello\n')
+    cat = Software('cat', '/bin/cat')
+    cat.register(Parameter(Data(str(tmpdir.join('in.txt'))).as_input()),
+                 Redirect(stream='>', dest=Data(str(tmpdir.join('mid.txt')))))
+    cat.register(Parameter(Data(str(tmpdir.join('mid.txt'))).as_input()),
+                 Redirect(stream='>', dest=Data(str(tmpdir.join('out.txt')))))
+
+    run_metrics = RunMetrics(str(tmpdir.join('run.metrics.jsonl')), ParslPipeline._pipeline_run_temp_dir.name)
+    ParslPipeline._start_and_monitor_run(
+        workflow_graph=ParslPipeline._assemble_graph(_ParslAppBlueprint._blueprints.values()),
+        parsl_config=built_in_configs['basic-threads-2'](),
+        fuse_chains=True,
+        run_metrics=run_metrics
+    )
+    logger.handlers = list()
+
+    # Apps of a fused task each get a record, with the measurements of the task
+    with open(run_metrics.metrics_path) as metrics_file:
+        records = {record['app']: record for record in map(json.loads, metrics_file)}
+    assert records['cat_1']['fused_with'] == records['cat_2']['fused_with'] == 'cat_1'
+    assert records['cat_1']['start'] == records['cat_2']['start'] is not None
+    assert records['cat_2']['status'] == 'completed'
+
+
+def test_sampled_run_metrics(tmpdir):
+    reset_components(str(tmpdir))
+    setup_logger(str(tmpdir))
+    sleep = Software('sleep', '/bin/sleep')
+    timeout = Software('timeout', '/usr/bin/timeout', success_on=['124'])
+    head = Software('head', '/usr/bin/head')
+
+    # An app that only waits, one that keeps a CPU busy, and one that writes a known amount
+    sleep.register(Parameter('1.5'))
+    timeout.register(Parameter('1.5', 'sh', '-c', '"while :; do :; done"'))
+    head.register(Parameter('-c', '1000000', '/dev/zero'), Redirect(stream='>', dest=Data(str(tmpdir.join('zeros')))))
+
+    run_metrics = RunMetrics(str(tmpdir.join('run.metrics.jsonl')), ParslPipeline._pipeline_run_temp_dir.name,
+                             sample_interval=0.1)
+    ParslPipeline._start_and_monitor_run(
+        workflow_graph=ParslPipeline._assemble_graph(_ParslAppBlueprint._blueprints.values()),
+        parsl_config=built_in_configs['basic-threads-4'](),
+        run_metrics=run_metrics
+    )
+    logger.handlers = list()
+
+    with open(run_metrics.metrics_path) as metrics_file:
+        records = {record['app']: record for record in map(json.loads, metrics_file)}
+    assert records['sleep_1']['bound'] == 'wait' and records['sleep_1']['io_wait'] is not None
+    assert records['timeout_2']['bound'] == 'cpu'
+    assert records['head_3']['bytes_written'] >= 1000000
+
+    with open(glob.glob(os.path.join(str(tmpdir), '*.log'))[0]) as log:
+        log_messages = [line.split('> ')[-1].strip() for line in log]
+    assert 'What held apps back, by program:' in log_messages
+    assert any(message.startswith('sleep: 1 apps, 0 CPU-bound, 0 I/O-bound, 1 wait-bound')
+               for message in log_messages)
+
+
+def test_unmeasured_apps(tmpdir):
+    reset_components(str(tmpdir))
+    setup_logger(str(tmpdir))
+    tmpdir.join('in.txt').write('hello\n')
+    grep = Software('grep', '/bin/grep')
+    grep.register(Parameter('hello', Data(str(tmpdir.join('in.txt'))).as_input()),
+                  Redirect(stream='>', dest=Data(str(tmpdir.join('hello.txt')))))
+
+    ParslPipeline._start_and_monitor_run(
+        workflow_graph=ParslPipeline._assemble_graph(_ParslAppBlueprint._blueprints.values()),
+        parsl_config=built_in_configs['basic-threads-2']()
+    )
+    logger.handlers = list()
+
+    # Without metrics, apps run unwrapped and are handed to Parsl without a per-run metrics path to hash
+    assert tmpdir.join('hello.txt').read() == 'hello\n'
+    assert all('metrics' not in task['kwargs'] for task in parsl.dfk().tasks.values())
+    assert not glob.glob(os.path.join(ParslPipeline._pipeline_run_temp_dir.name, '*.metrics'))
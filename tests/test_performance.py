@@ -0,0 +1,70 @@
+import json
+
+import networkx as nx
+import pytest
+
+from operon._util.performance import RunPerformance, read_records
+
+
+def workflow_graph():
+    """
+    a -> b -> e, and a -> c -> e, through data nodes
+    """
+    graph = nx.DiGraph()
+    graph.add_nodes_from(['a', 'b', 'c', 'e'], type='app')
+    graph.add_nodes_from(['/a.out', '/b.out', '/c.out'], type='data')
+    graph.add_edges_from([('a', '/a.out'), ('/a.out', 'b'), ('/a.out', 'c'),
+                          ('b', '/b.out'), ('c', '/c.out'), ('/b.out', 'e'), ('/c.out', 'e')])
+    return graph
+
+
+def test_run_performance():
+    records = {
+        'a': {'app': 'a', 'launch': 1000, 'start': 1000, 'end': 1010, 'fused_with': None},
+        'b': {'app': 'b', 'launch': 1010, 'start': 1010, 'end': 1050, 'fused_with': None},
+        'c': {'app': 'c', 'launch': 1010, 'start': 1030, 'end': 1040, 'fused_with': None},
+        'e': {'app': 'e', 'launch': 1050, 'start': 1055, 'end': 1100, 'fused_with': None}
+    }
+    performance = RunPerformance(workflow_graph(), dict(), 1000, 1100, slots=2, records=records)
+
+    assert performance.average_parallelism == pytest.approx(1.05)
+    assert performance.peak_parallelism == 2
+    assert performance.idle_fraction == pytest.approx(0.475)
+    assert len(performance.parallelism_over_time) == 10
+    assert performance.parallelism_over_time[3] == (30, pytest.approx(2))
+
+    # e waited on b, which waited on a
+    assert performance.critical_path == [('a', 0, 10), ('b', 0, 40), ('e', 5, 45)]
+    assert performance.slack == {'a': 5, 'b': 5, 'c': 15, 'e': 0}
+    assert performance.apps['c']['queue_wait'] == 20
+
+    lines = performance.summary_lines(top=2)
+    assert 'Parallelism: 1.1 apps running on average, 2 at most, of 2 slots; slots idle 48% of the time' in lines
+    assert 'Realized critical path is 3 apps long and took 0:01:40, 0:01:35 running and 0:00:05 waiting:' in lines
+    assert '\te: waited 0:00:05, ran 0:00:45 (50% of the run)' in lines
+    assert 'Longest running apps: e 0:00:45  b 0:00:40' in lines
+    assert 'Longest waiting apps: c 0:00:20  e 0:00:05' in lines
+    assert 'Apps with the most slack: c 0:00:15  a 0:00:05' in lines
+    assert lines[-1].startswith('The run was held up by its critical path')
+
+
+def test_run_performance_without_records():
+    # Apps of a fused task count once towards parallelism; without records, launches stand in for starts
+    app_times = {'a': (1000, 1010), 'b': (1010, 1050)}
+    records = {'e': {'app': 'e', 'launch': None, 'start': 1050, 'end': 1100, 'fused_with': 'c'},
+               'c': {'app': 'c', 'launch': None, 'start': 1050, 'end': 1100, 'fused_with': 'c'}}
+    performance = RunPerformance(workflow_graph(), app_times, 1000, 1100, records=records)
+    assert performance.busy == pytest.approx(100)
+    assert performance.idle_fraction is None
+    assert performance.apps['a']['queue_wait'] is None
+    assert all('Longest waiting' not in line for line in performance.summary_lines())
+    assert RunPerformance(workflow_graph(), dict(), 1000, 1100).summary_lines() == ['Performance summary: no apps ran']
+
+
+def test_read_records(tmpdir):
+    metrics_path = tmpdir.join('run.metrics.jsonl')
+    metrics_path.write(''.join(json.dumps(record) + '\n' for record in [
+        {'app': 'a', 'wall': 1}, {'app': 'b', 'wall': 2}, {'app': 'a', 'wall': 3}
+    ]))
+    assert read_records(str(metrics_path)) == {'a': {'app': 'a', 'wall': 3}, 'b': {'app': 'b', 'wall': 2}}
+    assert read_records(str(tmpdir.join('missing.jsonl'))) == dict()
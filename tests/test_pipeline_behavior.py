@@ -1,15 +1,22 @@
-from operon.components import (Software, Parameter, Redirect, Data, CodeBlock,
+from operon.components import (Software, Parameter, Redirect, Data, CodeBlock, Pipe,
                                ParslPipeline)
 from operon._util.apps import _ParslAppBlueprint
+from operon._util.data import _DataRegistry
 from operon.meta import Meta
 import tempfile
+import parsl
 from parsl import ThreadPoolExecutor, DataFlowKernel
 from parsl.executors.errors import ScalingFailed
 import pytest
 from operon._util.logging import setup_logger
+from operon._util.configs import apply_checkpointing, built_in_configs
+from operon._cli.subcommands.batch_run import positive_int
 import glob
 import os
+import argparse
+import sys
 import logging
+from collections import namedtuple
 
 logger = logging.getLogger('operon.main')
 
@@ -25,9 +32,11 @@ def reset_components():
     _ParslAppBlueprint._id_counter = 0
     _ParslAppBlueprint._blueprints = dict()
     Software._software_paths = set()
-    Data._data = dict()
+    Data._data = _DataRegistry()
     logger.handlers = list()
     Meta._executors = dict()
+    # Each run loads its own Parsl config
+    parsl.clear()
 
 
 def pipeline_components_for_tests():
@@ -264,9 +273,11 @@ def test_workflow_graph_generation():
         'g2.out',
         'i.final'
     )
-    for data_node_id in data_nodes:
+    for data_node_name in data_nodes:
+        data_node_id = Data(data_node_name).id
         assert len(workflow_graph.nodes[data_node_id]) == 2
         assert workflow_graph.nodes[data_node_id]['type'] == 'data'
+        assert workflow_graph.nodes[data_node_id]['name'] == data_node_name
 
     # Check for correct edges
     out_edges = {
@@ -290,7 +301,78 @@ def test_workflow_graph_generation():
         ('f.out', 'petrichor_9'),
         ('petrichor_9', 'i.final')
     }
-    assert out_edges == set(workflow_graph.edges)
+    def node_name(node_id):
+        return workflow_graph.nodes[node_id]['name'] if isinstance(node_id, int) else node_id
+    assert out_edges == {(node_name(source), node_name(target)) for source, target in workflow_graph.edges}
+
+
+def test_register_apps_long_chain():
+    reset_components()
+    step = Software('step', '/bin/cp')
+
+    # Build a single chain much longer than the recursion limit
+    chain_length = sys.getrecursionlimit() * 2
+    for i in range(chain_length):
+        step.register(
+            Parameter(Data('{}.chain'.format(i)).as_input()),
+            Parameter(Data('{}.chain'.format(i + 1)).as_output())
+        )
+    workflow_graph = ParslPipeline._assemble_graph(_ParslAppBlueprint._blueprints.values())
+
+    # Record submission order instead of handing apps to Parsl
+    SubmittedApp = namedtuple('SubmittedApp', 'app_id inputs outputs')
+    SubmittedData = namedtuple('SubmittedData', 'filename')
+
+    def submit_app(blueprint, inputs):
+        return SubmittedApp(blueprint['id'], inputs, [SubmittedData(o) for o in blueprint['outputs']])
+
+    app_futures, data_futures = ParslPipeline._register_apps(workflow_graph, submit_app)
+    assert [name for name, _ in app_futures] == ['cp_{}'.format(i) for i in range(1, chain_length + 1)]
+    assert len(data_futures) == chain_length
+
+    # Each app depends on exactly the output of the one before it
+    assert not app_futures[0][1].inputs
+    for (_, previous_fut), (_, fut) in zip(app_futures, app_futures[1:]):
+        assert fut.inputs == previous_fut.outputs
+
+
+def test_register_apps_incremental(tmpdir):
+    reset_components()
+    step = Software('step', '/bin/cp')
+    chain_files = [str(tmpdir.join('{}.chain'.format(i))) for i in range(4)]
+    for input_file, output_file in zip(chain_files, chain_files[1:]):
+        step.register(
+            Parameter(Data(input_file).as_input()),
+            Parameter(Data(output_file).as_output())
+        )
+    workflow_graph = ParslPipeline._assemble_graph(_ParslAppBlueprint._blueprints.values())
+
+    SubmittedApp = namedtuple('SubmittedApp', 'app_id inputs outputs')
+    SubmittedData = namedtuple('SubmittedData', 'filename')
+
+    def submit_app(blueprint, inputs):
+        return SubmittedApp(blueprint['id'], inputs, [SubmittedData(o) for o in blueprint['outputs']])
+
+    def submitted_apps():
+        app_futures, _ = ParslPipeline._register_apps(workflow_graph, submit_app,
+                                                      app_is_up_to_date=ParslPipeline._app_is_up_to_date)
+        return [name for name, _ in app_futures]
+
+    # First three files exist and are in order, so only the last app needs to run
+    for i, chain_file in enumerate(chain_files[:3]):
+        with open(chain_file, 'w') as chain_out:
+            chain_out.write('{}\n'.format(i))
+        os.utime(chain_file, (1000 + i, 1000 + i))
+    assert submitted_apps() == ['cp_3']
+
+    # An empty output is considered stale, as is everything downstream of it
+    open(chain_files[2], 'w').close()
+    os.utime(chain_files[2], (1002, 1002))
+    assert submitted_apps() == ['cp_2', 'cp_3']
+
+    # Updating the initial input makes the whole chain stale
+    os.utime(chain_files[0], (2000, 2000))
+    assert submitted_apps() == ['cp_1', 'cp_2', 'cp_3']
 
 
 def test_correct_dfk_cascade():
@@ -343,6 +425,26 @@ def test_correct_dfk_cascade():
     ).executors[0].label == 'threads'
 
 
+def test_apply_checkpointing(tmpdir):
+    run_dir = str(tmpdir.join('run__runinfo'))
+
+    # First run has nothing to resume from
+    parsl_config = apply_checkpointing(built_in_configs['basic-threads-2'](), run_dir)
+    assert parsl_config.checkpoint_mode == 'task_exit'
+    assert parsl_config.run_dir == run_dir
+    assert parsl_config.checkpoint_files == []
+
+    # Later runs load every checkpoint written by earlier ones
+    for run_id in ('000', '001'):
+        tmpdir.join('run__runinfo', run_id, 'checkpoint').ensure(dir=True)
+    tmpdir.join('run__runinfo', '002').ensure(dir=True)
+    parsl_config = apply_checkpointing(built_in_configs['basic-threads-2'](), run_dir, checkpoint_mode='dfk_exit')
+    assert parsl_config.checkpoint_mode == 'dfk_exit'
+    assert parsl_config.checkpoint_files == [
+        os.path.join(run_dir, run_id, 'checkpoint') for run_id in ('000', '001')
+    ]
+
+
 def test_various_pipelines(tmpdir_factory):
     no_executor_assignments = {
         'petrichor_1': 'all',
@@ -416,6 +518,144 @@ def test_various_pipelines(tmpdir_factory):
     #                       executor_assignments=no_executor_assignments)
 
 
+class PerSamplePipeline(ParslPipeline):
+    def pipeline(self, pipeline_args, pipeline_config):
+        sample = pipeline_args['sample']
+        trim, align = Software('trim', '/bin/trim'), Software('align', '/bin/align')
+        trimmed = trim.register(
+            Parameter('-i', Data('{}.fastq'.format(sample)).as_input()),
+            Parameter('-o', Data('{}.trimmed'.format(sample)).as_output(tmp=True))
+        )
+        align.register(
+            Parameter('-i', Data('{}.trimmed'.format(sample)).as_input()),
+            Pipe(trim.prep(Parameter('-o', Data('{}.bam'.format(sample)).as_output()))),
+            wait_on=[trimmed]
+        )
+
+
+def test_parallel_batch_build():
+    batch_pipeline_args = [{'sample': 'sample{}'.format(i)} for i in range(5)]
+
+    def build(parallel):
+        reset_components()
+        if parallel:
+            ParslPipeline._build_in_parallel(PerSamplePipeline(), batch_pipeline_args, dict(), num_workers=2)
+        else:
+            for pipeline_args in batch_pipeline_args:
+                PerSamplePipeline().pipeline(pipeline_args, dict())
+        return (
+            {app_id: blueprint.as_dict() for app_id, blueprint in _ParslAppBlueprint._blueprints.items()},
+            _ParslAppBlueprint._id_counter,
+            [path for path in Data._data.paths if Data._data.is_tmp(path)]
+        )
+
+    # A parallel build gives exactly the apps, IDs, and temporary files of a sequential one
+    sequential_blueprints, sequential_ids, sequential_tmp = build(parallel=False)
+    parallel_blueprints, parallel_ids, parallel_tmp = build(parallel=True)
+    assert list(parallel_blueprints) == list(sequential_blueprints)
+    assert parallel_blueprints == sequential_blueprints
+    assert parallel_ids == sequential_ids == 15
+    assert sorted(parallel_tmp) == sorted(sequential_tmp) == ['sample{}.trimmed'.format(i) for i in range(5)]
+    assert parallel_blueprints['align_15']['wait_on'] == ['trim_13']
+
+
+class CopyPipeline(ParslPipeline):
+    def pipeline(self, pipeline_args, pipeline_config):
+        sample_dir = pipeline_args['sample_dir']
+        cp = Software('cp', '/bin/cp')
+        cp.register(
+            Parameter(Data(os.path.join(sample_dir, 'in.txt')).as_input()),
+            Parameter(Data(os.path.join(sample_dir, 'mid.txt')).as_output(tmp=True))
+        )
+        cp.register(
+            Parameter(Data(os.path.join(sample_dir, 'mid.txt')).as_input()),
+            Parameter(Data(os.path.join(sample_dir, 'out.txt')).as_output())
+        )
+
+
+def test_streaming_batch_run(tmpdir):
+    reset_components()
+    setup_logger(str(tmpdir))
+    sample_dirs = [tmpdir.mkdir('sample{}'.format(i)) for i in range(5)]
+    for sample_dir in sample_dirs:
+        sample_dir.join('in.txt').write(sample_dir.basename)
+
+    # Rows are only read as samples are admitted
+    rows_read = list()
+
+    def batch_pipeline_args():
+        for sample_dir in sample_dirs:
+            rows_read.append(sample_dir.basename)
+            yield {'sample_dir': str(sample_dir)}
+
+    ParslPipeline._start_and_monitor_streaming_run(
+        pipeline_instance=CopyPipeline(),
+        batch_pipeline_args=batch_pipeline_args(),
+        pipeline_config=dict(),
+        parsl_config=built_in_configs['basic-threads-2'](),
+        max_inflight_samples=2
+    )
+    logger.handlers = list()
+
+    for sample_dir in sample_dirs:
+        assert sample_dir.join('out.txt').read() == sample_dir.basename
+    assert len(rows_read) == 5
+
+    # Never more than two samples admitted and not yet finished
+    pipeline_logfile = glob.glob(os.path.join(str(tmpdir), '*.log'))[0]
+    inflight, max_inflight, cp_ids = 0, 0, list()
+    with open(pipeline_logfile) as log:
+        for line in log:
+            message = line.split('> ')[-1].strip()
+            if message.startswith('Admitted sample'):
+                inflight += 1
+            elif message.startswith('Finished sample'):
+                inflight -= 1
+            elif 'assigned to executor' in message:
+                cp_ids.append(message.split()[0])
+            max_inflight = max(max_inflight, inflight)
+    assert max_inflight == 2 and inflight == 0
+    assert cp_ids == ['cp_{}'.format(i) for i in range(1, 11)]
+
+    # Without checkpointing, Parsl only keeps the status of each finished sample's tasks
+    assert all(list(task) == ['status'] for task in parsl.dfk().tasks.values())
+
+
+def test_max_inflight_samples_bounds():
+    assert positive_int('3') == 3
+    for bad_value in ('0', '-2', 'many'):
+        with pytest.raises(argparse.ArgumentTypeError):
+            positive_int(bad_value)
+
+
+def test_dry_run(tmpdir, capsys):
+    reset_components()
+    sample_dirs = [tmpdir.mkdir('sample{}'.format(i)) for i in range(3)]
+    for sample_dir in sample_dirs:
+        sample_dir.join('in.txt').write(sample_dir.basename)
+
+    # Even a streaming batch run builds every sample, and nothing runs
+    CopyPipeline()._run(
+        pipeline_args=[{'sample_dir': str(sample_dir)} for sample_dir in sample_dirs],
+        pipeline_config=dict(),
+        original_command='batch-run copy --dry-run',
+        run_args={'logs_dir': str(tmpdir), 'run_name': 'run', 'dry_run': True, 'max_inflight_samples': 2,
+                  'fuse_chains': True}
+    )
+    logger.handlers = list()
+
+    assert not any(sample_dir.join('out.txt').exists() for sample_dir in sample_dirs)
+    statistics = dict(line.split('  ', 1) for line in capsys.readouterr().out.splitlines())
+    statistics = {label.strip(): value.strip() for label, value in statistics.items()}
+    assert statistics['Apps'] == '6'
+    assert statistics['Data'] == '9'
+    assert statistics['Depth'] == '2'
+    assert statistics['Max width'] == '3'
+    assert statistics['Critical path'] == '2 apps'
+    assert statistics['Parsl tasks'] == '3 (3 on any executor)'
+    assert statistics['Graph built in'].endswith('s')
+
+
 def do_pipeline_execution(tmpdir_factory, parsl_config, pipeline_components_func, executor_assignments):
     spoofed_logs_dir = str(tmpdir_factory.mktemp('logs'))
     # Run pipeline to register Software and assemble workflow graph
@@ -424,14 +664,21 @@ def do_pipeline_execution(tmpdir_factory, parsl_config, pipeline_components_func
     pipeline_components_func()
     workflow_graph = ParslPipeline._assemble_graph(_ParslAppBlueprint._blueprints.values())
 
-    ParslPipeline._start_and_monitor_run(
-        workflow_graph=workflow_graph,
-        parsl_config=ParslPipeline._choose_parsl_config(
-            pipeline_args_parsl_config=parsl_config,
-            pipeline_config_parsl_config=None,
-            pipeline_default_parsl_config=None
-        )
+    # The pipelines write relative paths, and Parsl its runinfo directory, so run them from the temporary directory
+    chosen_parsl_config = ParslPipeline._choose_parsl_config(
+        pipeline_args_parsl_config=parsl_config,
+        pipeline_config_parsl_config=None,
+        pipeline_default_parsl_config=None
     )
+    tests_dir = os.getcwd()
+    os.chdir(spoofed_logs_dir)
+    try:
+        ParslPipeline._start_and_monitor_run(
+            workflow_graph=workflow_graph,
+            parsl_config=chosen_parsl_config
+        )
+    finally:
+        os.chdir(tests_dir)
 
     # Get the log file from this run
     pipeline_logfile = glob.glob(os.path.join(spoofed_logs_dir, '*.log'))[0]
@@ -0,0 +1,85 @@
+import logging
+import tempfile
+from urllib.request import urlopen
+
+import parsl
+
+from operon.components import Software, Parameter, Redirect, Data, ParslPipeline
+from operon._util.apps import _ParslAppBlueprint
+from operon._util.data import _DataRegistry
+from operon._util.configs import built_in_configs
+from operon._util.hooks import HookDispatcher
+from operon._util.metrics import RunMetrics
+from operon._util.logging import setup_logger
+from operon._util.prometheus import PrometheusExporter
+from operon.meta import Meta
+
+logger = logging.getLogger('operon.main')
+
+
+def reset_components(capture_dir):
+    ParslPipeline._pipeline_run_temp_dir = tempfile.TemporaryDirectory(dir=capture_dir, suffix='__operon')
+    _ParslAppBlueprint._id_counter = 0
+    _ParslAppBlueprint._blueprints = dict()
+    Data._data = _DataRegistry()
+    Meta._executors = dict()
+    logger.handlers = list()
+    parsl.clear()
+
+
+def samples(exposition):
+    return dict(line.rsplit(' ', 1) for line in exposition.splitlines() if not line.startswith('#'))
+
+
+def test_prometheus_exporter(tmpdir):
+    reset_components(str(tmpdir))
+    setup_logger(str(tmpdir))
+    tmpdir.join('in.txt').write('hello\n')
+    grep = Software('grep', '/bin/grep')
+    grep.register(Parameter('hello', Data(str(tmpdir.join('in.txt'))).as_input()),
+                  Redirect(stream='>', dest=Data(str(tmpdir.join('hello.txt'))).as_output(tmp=True)))
+    grep.register(Parameter('hello', Data(str(tmpdir.join('hello.txt'))).as_input()),
+                  Redirect(stream='>', dest=Data(str(tmpdir.join('hello2.txt')))))
+    grep.register(Parameter('goodbye', Data(str(tmpdir.join('in.txt'))).as_input()),
+                  Redirect(stream='>', dest=Data(str(tmpdir.join('goodbye.txt')))))
+
+    textfile = str(tmpdir.join('run.prom'))
+    exporter = PrometheusExporter('pipe', 'run', port=0, textfile=textfile)
+    port = exporter._server.server_port
+    ParslPipeline._start_and_monitor_run(
+        workflow_graph=ParslPipeline._assemble_graph(_ParslAppBlueprint._blueprints.values()),
+        parsl_config=built_in_configs['basic-threads-2'](),
+        run_metrics=RunMetrics(str(tmpdir.join('run.metrics.jsonl')), ParslPipeline._pipeline_run_temp_dir.name,
+                               on_record=exporter.observe),
+        app_hooks=HookDispatcher([exporter]),
+        exporter=exporter
+    )
+    logger.handlers = list()
+
+    # The textfile is written a last time once the run is over, and the server is shut down
+    with open(textfile) as prom:
+        metrics = samples(prom.read())
+    labels = 'pipeline="pipe",run="run"'
+    assert metrics['operon_apps_completed_total{{{},executor="all"}}'.format(labels)] == '2'
+    assert metrics['operon_apps_failed_total{{{},executor="all"}}'.format(labels)] == '1'
+    assert metrics['operon_apps{{{},state="running",executor="all"}}'.format(labels)] == '0'
+    assert metrics['operon_app_duration_seconds_count{{{}}}'.format(labels)] == '3'
+    assert metrics['operon_app_queue_wait_seconds_bucket{{{},le="+Inf"}}'.format(labels)] == '3'
+    assert float(metrics['operon_tmp_bytes{{{}}}'.format(labels)]) in (0, 6)
+    assert 'operon_last_app_done_timestamp_seconds{{{}}}'.format(labels) in metrics
+    try:
+        urlopen('http://127.0.0.1:{}/metrics'.format(port), timeout=1)
+        assert False, 'Metrics still served after the run'
+    except OSError:
+        pass
+
+
+def test_prometheus_server():
+    exporter = PrometheusExporter('pipe', 'run "1"', port=0)
+    try:
+        with urlopen('http://127.0.0.1:{}/metrics'.format(exporter._server.server_port), timeout=5) as response:
+            assert response.headers['Content-Type'].startswith('text/plain; version=0.0.4')
+            metrics = samples(response.read().decode())
+        assert metrics['operon_tmp_bytes{pipeline="pipe",run="run \\"1\\""}'] == '0'
+    finally:
+        exporter.run_finished()
@@ -0,0 +1,210 @@
+import tempfile
+from collections import namedtuple
+from concurrent.futures import Future
+
+import pytest
+from parsl.dataflow.futures import AppFuture
+
+from operon.components import Software, Parameter, Data, ParslPipeline
+from operon._util.apps import _ParslAppBlueprint
+from operon._util.data import _DataRegistry
+from operon._util.configs import built_in_configs
+from operon._util.scheduling import (CriticalPath, ReleaseGate, WorkflowWidth, parse_duration, app_resources,
+                                     needs_release_gate, size_executors)
+from operon._util.tracking import watch_app_future
+from operon.meta import Meta
+
+
+def test_parse_duration():
+    assert parse_duration(90) == 90
+    assert parse_duration('15m') == 900
+    assert parse_duration('2.5h') == 9000
+    with pytest.raises(ValueError):
+        parse_duration('soon')
+
+
+def test_app_resources():
+    Meta._executors = {'large': {'cpu': '16', 'mem': '32G'}, 'dynamic': {'cpu': Meta.dynamic(), 'mem': '1G'}}
+    assert app_resources({'resources': {'cpu': '4', 'mem': '500M'}}) == (4, 500 * 1024 ** 2)
+    assert app_resources({'executor': 'large'}) == (16, 32 * 1024 ** 3)
+    assert app_resources({'executor': 'dynamic'}) == (1, 1024 ** 3)
+    assert app_resources(dict()) == (1, 0)
+    Meta._executors = dict()
+
+
+def test_critical_path_ordering():
+    ParslPipeline._pipeline_run_temp_dir = tempfile.TemporaryDirectory(
+        dir='/tmp',
+        suffix='__operon'
+    )
+    _ParslAppBlueprint._id_counter = 0
+    _ParslAppBlueprint._blueprints = dict()
+    Data._data = _DataRegistry()
+    align = Software('align', '/bin/align')
+    markdup = Software('markdup', '/bin/markdup')
+    bqsr = Software('bqsr', '/bin/bqsr')
+    index = Software('index', '/bin/index')
+    qc = Software('qc', '/bin/qc')
+
+    # Short side branches are registered before the long alignment chain
+    for i in range(3):
+        qc.register(Parameter(Data('reads.fq').as_input()), Parameter(Data('qc{}.txt'.format(i)).as_output()),
+                    meta={'runtime': '1m'})
+    align.register(Parameter(Data('reads.fq').as_input()), Parameter(Data('aligned.bam').as_output()),
+                   meta={'runtime': '2h'})
+    markdup.register(Parameter(Data('aligned.bam').as_input()), Parameter(Data('markdup.bam').as_output()),
+                     meta={'runtime': '30m'})
+    bqsr.register(Parameter(Data('markdup.bam').as_input()), Parameter(Data('final.bam').as_output()),
+                  meta={'runtime': 600})
+    index.register(Parameter(Data('final.bam').as_input()), Parameter(Data('final.bai').as_output()))
+    workflow_graph = ParslPipeline._assemble_graph(_ParslAppBlueprint._blueprints.values())
+
+    critical_path = CriticalPath(workflow_graph)
+    assert critical_path.path == ['align_4', 'markdup_5', 'bqsr_6', 'index_7']
+    assert critical_path.estimates['index_7'] == 330  # Median of the apps with a hint
+    assert critical_path.length == 7200 + 1800 + 600 + 330
+    assert critical_path.predicted_runtime(slots=1) == critical_path.total_work
+
+    SubmittedApp = namedtuple('SubmittedApp', 'app_id outputs')
+    SubmittedData = namedtuple('SubmittedData', 'filename')
+    app_futures, _ = ParslPipeline._register_apps(
+        workflow_graph,
+        lambda blueprint, inputs: SubmittedApp(blueprint['id'], [SubmittedData(o) for o in blueprint['outputs']]),
+        priorities=critical_path.priorities
+    )
+    assert [name for name, _ in app_futures] == [
+        'align_4', 'markdup_5', 'bqsr_6', 'index_7', 'qc_1', 'qc_2', 'qc_3'
+    ]
+
+
+def test_workflow_width():
+    ParslPipeline._pipeline_run_temp_dir = tempfile.TemporaryDirectory(
+        dir='/tmp',
+        suffix='__operon'
+    )
+    _ParslAppBlueprint._id_counter = 0
+    _ParslAppBlueprint._blueprints = dict()
+    Data._data = _DataRegistry()
+    step = Software('step', '/bin/step')
+
+    # A chain of three, a chain of two, and an app waiting on the middle of the first chain
+    for source, target in [('x0', 'x1'), ('x1', 'x2'), ('x2', 'x3'), ('y0', 'y1'), ('y1', 'y2'), ('x2', 'w')]:
+        step.register(Parameter(Data(source).as_input()), Parameter(Data(target).as_output()))
+    workflow_graph = ParslPipeline._assemble_graph(_ParslAppBlueprint._blueprints.values())
+    workflow_width = WorkflowWidth(workflow_graph, exact=True)
+
+    # No depth has more than two apps, but the ends of all three branches can run together
+    assert workflow_width.profile == [2, 2, 2]
+    assert workflow_width.max_antichain == 3
+    assert workflow_width.width == 3
+
+    # Unless asked for, only the widest depth is used
+    cheap_width = WorkflowWidth(workflow_graph)
+    assert cheap_width.max_antichain is None and cheap_width.width == 2
+
+    parsl_config = built_in_configs['basic-threads-8']()
+    size_executors(parsl_config, workflow_width.width)
+    assert parsl_config.executors[0].max_threads == 3
+
+    # Apps only have to be held back when more can run at once than an executor has slots, or they declare resources
+    assert not needs_release_gate(workflow_graph, cheap_width, {'threads': 2})
+    assert needs_release_gate(workflow_graph, cheap_width, {'threads': 2}, samples=2)
+    assert needs_release_gate(workflow_graph, cheap_width, {'threads': 1})
+    assert not needs_release_gate(workflow_graph, cheap_width, dict())
+    step.register(Parameter(Data('x3').as_input()), Parameter(Data('z').as_output()), meta={'resources': {'cpu': 2}})
+    workflow_graph = ParslPipeline._assemble_graph(_ParslAppBlueprint._blueprints.values())
+    assert needs_release_gate(workflow_graph, WorkflowWidth(workflow_graph), {'threads': 8})
+
+
+class GatedExecutor(object):
+    def __init__(self):
+        self.submitted = list()
+
+    def submit(self, executable, *args, **kwargs):
+        exec_future = Future()
+        self.submitted.append((args[0], exec_future))
+        return exec_future
+
+
+class GatedDataFlowKernel(object):
+    def __init__(self):
+        self.executors = {'threads': GatedExecutor()}
+
+    def launch_task(self, task_id, executable, *args, **kwargs):
+        exec_future = self.executors['threads'].submit(executable, *args, **kwargs)
+        exec_future.retries_left = 0
+        return exec_future
+
+
+def test_release_gate_order():
+    dfk = GatedDataFlowKernel()
+    executor = dfk.executors['threads']
+    release_gate = ReleaseGate(dfk, {'threads': 1})
+    for task_id, priority in enumerate([10, 1, 5, 3]):
+        release_gate.prioritize(task_id, priority)
+    launched_futures = [dfk.launch_task(task_id, None, task_id) for task_id in range(4)]
+    assert [task_id for task_id, _ in executor.submitted] == [0]
+
+    # Each freed slot goes to the waiting app with the highest priority
+    executor.submitted[0][1].set_result(0)
+    assert [task_id for task_id, _ in executor.submitted] == [0, 2]
+    executor.submitted[1][1].set_exception(RuntimeError('failed'))
+    assert [task_id for task_id, _ in executor.submitted] == [0, 2, 3]
+    assert isinstance(launched_futures[2].exception(), RuntimeError)
+    executor.submitted[2][1].set_result(0)
+    executor.submitted[3][1].set_result('done')
+    assert launched_futures[1].result() == 'done'
+
+
+def test_release_gate_resources():
+    dfk = GatedDataFlowKernel()
+    executor = dfk.executors['threads']
+    release_gate = ReleaseGate(dfk, {'threads': 4}, host_resources=(4, 1024))
+    for task_id, (priority, cpu, mem) in enumerate([(1, 2, 0), (10, 4, 0), (5, 1, 768), (3, 1, 512)]):
+        release_gate.prioritize(task_id, priority)
+        release_gate.require(task_id, cpu, mem)
+    for task_id in range(4):
+        dfk.launch_task(task_id, None, task_id)
+
+    # A smaller app that fits runs around the larger one waiting for the whole host, until there
+    # isn't enough memory left
+    assert [task_id for task_id, _ in executor.submitted] == [0, 2]
+    for _, exec_future in list(executor.submitted):
+        exec_future.set_result(0)
+    assert [task_id for task_id, _ in executor.submitted] == [0, 2, 1]
+    executor.submitted[2][1].set_result(0)
+    assert [task_id for task_id, _ in executor.submitted] == [0, 2, 1, 3]
+
+
+def test_release_gate_undeclared_resources():
+    dfk = GatedDataFlowKernel()
+    executor = dfk.executors['threads']
+    release_gate = ReleaseGate(dfk, {'threads': 8}, host_resources=(2, 1024))
+    for task_id in range(10):
+        release_gate.require(task_id, *app_resources(dict(), default_cpu=0))
+    release_gate.require(10, 2, 0)
+    for task_id in range(11):
+        dfk.launch_task(task_id, None, task_id)
+
+    # Apps that declare no CPUs fill every worker of the executor, even past the CPUs of the host,
+    # and leave the host's CPUs to the app that declared them
+    assert [task_id for task_id, _ in executor.submitted] == list(range(8))
+    for _, exec_future in list(executor.submitted[:3]):
+        exec_future.set_result(0)
+    assert [task_id for task_id, _ in executor.submitted] == list(range(8)) + [8, 9, 10]
+
+
+def test_release_gate_reports_launch_on_release():
+    dfk = GatedDataFlowKernel()
+    executor = dfk.executors['threads']
+    ReleaseGate(dfk, {'threads': 1})
+    launched = list()
+    for task_id in range(2):
+        app_future = AppFuture(None, tid=task_id)
+        watch_app_future(app_future, on_launch=lambda fut: launched.append(fut.tid))
+        app_future.update_parent(dfk.launch_task(task_id, None, task_id))
+
+    # Parsl launched both apps, but the second is only launched once the gate lets it go
+    assert launched == [0]
+    executor.submitted[0][1].set_result(0)
+    assert launched == [0, 1]
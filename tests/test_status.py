@@ -0,0 +1,81 @@
+import os
+import logging
+import tempfile
+
+import parsl
+import pytest
+
+from operon.components import Software, Parameter, Redirect, Data, ParslPipeline
+from operon._util.apps import _ParslAppBlueprint
+from operon._util.data import _DataRegistry
+from operon._util.configs import built_in_configs
+from operon._util.logging import setup_logger
+from operon._util.status import read_status, status_path
+from operon._cli.subcommands.status import Subcommand, render_status
+from operon.meta import Meta
+
+logger = logging.getLogger('operon.main')
+
+
+def reset_components(capture_dir):
+    ParslPipeline._pipeline_run_temp_dir = tempfile.TemporaryDirectory(dir=capture_dir, suffix='__operon')
+    _ParslAppBlueprint._id_counter = 0
+    _ParslAppBlueprint._blueprints = dict()
+    Data._data = _DataRegistry()
+    Meta._executors = dict()
+    logger.handlers = list()
+    parsl.clear()
+
+
+def test_status_file(tmpdir, capsys):
+    reset_components(str(tmpdir))
+    setup_logger(str(tmpdir))
+    tmpdir.join('in.txt').write('hello\n')
+    grep = Software('grep', '/bin/grep')
+    sleep = Software('sleep', '/bin/sleep')
+    grep.register(Parameter('hello', Data(str(tmpdir.join('in.txt'))).as_input()),
+                  Redirect(stream='>', dest=Data(str(tmpdir.join('hello.txt')))))
+    grep.register(Parameter('goodbye', Data(str(tmpdir.join('in.txt'))).as_input()),
+                  Redirect(stream='>', dest=Data(str(tmpdir.join('goodbye.txt')))))
+    sleep.register(Parameter('1'))
+
+    ParslPipeline._start_and_monitor_run(
+        workflow_graph=ParslPipeline._assemble_graph(_ParslAppBlueprint._blueprints.values()),
+        parsl_config=built_in_configs['basic-threads-2'](),
+        status_file=status_path(str(tmpdir), 'run'),
+        status_interval=0.2
+    )
+    logger.handlers = list()
+
+    # The last status is written once the run is over
+    status = read_status(status_path(str(tmpdir), 'run'))
+    assert status['finished'] and status['pid'] == os.getpid()
+    assert status['apps'] == {'pending': 0, 'running': 0, 'completed': 2, 'failed': 1}
+    assert status['running'] == [] and status['remaining'] == 0
+    assert status['apps_per_minute'] > 0
+    assert not os.path.exists(status_path(str(tmpdir), 'run') + '.partial')
+
+    Subcommand().run([str(tmpdir)])
+    output = capsys.readouterr().out
+    assert output.startswith('Run run on ')
+    assert 'Run is over' in output
+    assert 'Apps: 0 pending, 0 running, 2 completed, 1 failed' in output
+
+    with pytest.raises(SystemExit):
+        Subcommand().run([str(tmpdir), '--run-name', 'other'])
+
+
+def test_render_status():
+    status = {
+        'host': 'node1', 'pid': 42, 'started': 1000.0, 'updated': 1590.0, 'interval': 10, 'finished': False,
+        'apps': {'pending': 30, 'running': 3, 'completed': 60, 'failed': 0},
+        'running': [{'app': 'bwa_1', 'elapsed': 500.0}, {'app': 'bwa_2', 'elapsed': 120.0}],
+        'apps_per_minute': 6.0, 'remaining': 330
+    }
+    rendered = render_status('sample1', status, now=1600.0)
+    assert 'Run sample1 on node1, pid 42' in rendered
+    assert '0:10:00 ago; status updated 0:00:10 ago' in rendered
+    assert 'Throughput: 6.0 apps per minute, about 0:05:30 left' in rendered
+    assert 'Running longest:\n\tbwa_1  0:08:20\n\tbwa_2  0:02:00\n' in rendered
+    assert 'may have stopped' not in rendered
+    assert 'may have stopped' in render_status('sample1', status, now=1700.0)
@@ -0,0 +1,81 @@
+import re
+import logging
+from concurrent.futures import Future
+
+from operon._util.logging import setup_logger
+from operon._util.streams import CapturedStreamLogger, clear_captured_streams
+
+logger = logging.getLogger('operon.main')
+
+
+def test_captured_streams_logged_when_app_done(tmpdir):
+    logger.handlers = list()
+    setup_logger(str(tmpdir))
+    capture_dir = tmpdir.mkdir('run__operon')
+    stream_logger = CapturedStreamLogger(str(capture_dir), str(tmpdir.join('run__streams')),
+                                         head_size='1K', tail_size='1K')
+
+    # Short output is logged whole as soon as the app is done
+    capture_dir.join('app_1.stdout').write('hello\nworld\n')
+    capture_dir.join('app_1.stderr').write('')
+    app_future = Future()
+    stream_logger.log_when_done('app_1', app_future)
+    app_future.set_result(0)
+
+    # Long output only has its head and tail logged, and the raw stream is kept
+    capture_dir.join('app_2.stderr').write(''.join('line {}\n'.format(i) for i in range(10000)))
+    stream_logger.close()
+    logger.handlers = list()
+
+    log_contents = tmpdir.join([f for f in tmpdir.listdir() if f.ext == '.log'][0].basename).read()
+    assert 'Output from stdout stream of app_1:\nhello\nworld\n' in log_contents
+    assert 'stderr stream of app_1' not in log_contents
+    assert 'line 0\n' in log_contents and 'line 9999\n' in log_contents
+    assert 'line 5000\n' not in log_contents
+    assert 'full output is in {}'.format(tmpdir.join('run__streams', 'app_2.stderr')) in log_contents
+    assert tmpdir.join('run__streams', 'app_2.stderr').size() > 2048
+
+
+def test_captured_stream_head_and_tail(tmpdir):
+    logger.handlers = list()
+    setup_logger(str(tmpdir))
+    capture_dir = tmpdir.mkdir('run__operon')
+    stream_logger = CapturedStreamLogger(str(capture_dir), str(tmpdir.join('run__streams')),
+                                         head_size='1K', tail_size='1K')
+
+    # Lines of 11 bytes: the head is the 94 lines that reach past 1K, the tail the whole lines of the last 1K
+    capture_dir.join('app_1.stdout').write(''.join('line {:05d}\n'.format(i) for i in range(20000)))
+    stream_logger.close()
+    logger.handlers = list()
+
+    log_contents = tmpdir.join([f for f in tmpdir.listdir() if f.ext == '.log'][0].basename).read()
+    logged_lines = [int(n) for n in re.findall(r'^line (\d{5})$', log_contents, re.MULTILINE)]
+    assert logged_lines == list(range(94)) + list(range(19907, 20000))
+
+
+def test_captured_stream_multibyte_tail(tmpdir):
+    logger.handlers = list()
+    setup_logger(str(tmpdir))
+    capture_dir = tmpdir.mkdir('run__operon')
+    stream_logger = CapturedStreamLogger(str(capture_dir), str(tmpdir.join('run__streams')),
+                                         head_size='1K', tail_size=1001)
+
+    # Lines of 15 bytes but 10 characters, and a tail that starts in the middle of the second é of a line
+    capture_dir.join('app_1.stdout').write_binary(
+        ''.join('ééééé{:04d}\n'.format(i) for i in range(5000)).encode('utf-8')
+    )
+    stream_logger.close()
+    logger.handlers = list()
+
+    log_contents = tmpdir.join([f for f in tmpdir.listdir() if f.ext == '.log'][0].basename).read_text('utf-8')
+    assert '�' not in log_contents
+    logged_lines = [int(n) for n in re.findall(r'^ééééé(\d{4})$', log_contents, re.MULTILINE)]
+    assert logged_lines[-66:] == list(range(4934, 5000))
+
+
+def test_clear_captured_streams(tmpdir):
+    tmpdir.join('app_1.stdout').write('from an earlier run\n')
+    tmpdir.join('app_1.stderr').write('')
+    tmpdir.join('fused_1.sh').write('true\n')
+    clear_captured_streams(str(tmpdir))
+    assert [f.basename for f in tmpdir.listdir()] == ['fused_1.sh']
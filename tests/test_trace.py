@@ -0,0 +1,77 @@
+import json
+import logging
+import tempfile
+
+import parsl
+
+from operon.components import Software, Parameter, Redirect, Data, ParslPipeline
+from operon._util.apps import _ParslAppBlueprint
+from operon._util.data import _DataRegistry
+from operon._util.configs import built_in_configs
+from operon._util.metrics import RunMetrics
+from operon._util.logging import setup_logger
+from operon._util.trace import _assign_lanes, write_trace
+from operon.meta import Meta
+
+logger = logging.getLogger('operon.main')
+
+
+def reset_components(capture_dir):
+    ParslPipeline._pipeline_run_temp_dir = tempfile.TemporaryDirectory(dir=capture_dir, suffix='__operon')
+    _ParslAppBlueprint._id_counter = 0
+    _ParslAppBlueprint._blueprints = dict()
+    Data._data = _DataRegistry()
+    Meta._executors = dict()
+    logger.handlers = list()
+    parsl.clear()
+
+
+def test_assign_lanes():
+    lanes = _assign_lanes([(0, 10, 'a'), (1, 3, 'b'), (3, 5, 'c'), (2, 4, 'd'), (11, 12, 'e')])
+    assert lanes == {'a': 0, 'b': 1, 'd': 2, 'c': 1, 'e': 0}
+
+
+def test_write_trace(tmpdir):
+    reset_components(str(tmpdir))
+    setup_logger(str(tmpdir))
+    tmpdir.join('in.txt').write('hello\n')
+    grep = Software('grep', '/bin/grep')
+    sleep = Software('sleep', '/bin/sleep')
+    grep.register(Parameter('hello', Data(str(tmpdir.join('in.txt'))).as_input()),
+                  Redirect(stream='>', dest=Data(str(tmpdir.join('hello.txt')))))
+    grep.register(Parameter('hello', Data(str(tmpdir.join('hello.txt'))).as_input()),
+                  Redirect(stream='>', dest=Data(str(tmpdir.join('hello2.txt')))))
+    sleep.register(Parameter('0.5'))
+    sleep.register(Parameter('0.5'))
+
+    metrics_path = str(tmpdir.join('run.metrics.jsonl'))
+    ParslPipeline._start_and_monitor_run(
+        workflow_graph=ParslPipeline._assemble_graph(_ParslAppBlueprint._blueprints.values()),
+        parsl_config=built_in_configs['basic-threads-2'](),
+        run_metrics=RunMetrics(metrics_path, ParslPipeline._pipeline_run_temp_dir.name)
+    )
+    logger.handlers = list()
+
+    trace_path = str(tmpdir.join('run.trace.json'))
+    write_trace(metrics_path, trace_path)
+    with open(trace_path) as trace_file:
+        events = json.load(trace_file)['traceEvents']
+
+    process_names = {event['pid']: event['args']['name'] for event in events if event['ph'] == 'M'}
+    runs = [event for event in events if event['ph'] == 'X' and event['cat'] != 'queue wait']
+    assert sorted(event['name'] for event in runs) == ['grep_1', 'grep_2', 'sleep_3', 'sleep_4']
+    assert all(process_names[event['pid']].startswith('executor ') for event in runs)
+    assert all(event['ts'] >= 0 and event['dur'] >= 0 for event in events if event['ph'] == 'X')
+
+    # Apps on the same lane never overlap
+    for lane in {(event['pid'], event['tid']) for event in runs}:
+        on_lane = sorted((event['ts'], event['ts'] + event['dur']) for event in runs
+                         if (event['pid'], event['tid']) == lane)
+        assert all(end <= next_start for (_, end), (next_start, _) in zip(on_lane, on_lane[1:]))
+
+    # Two sleeps running side by side take two lanes
+    sleeps = [event for event in runs if event['cat'] == 'sleep']
+    if sleeps[0]['ts'] < sleeps[1]['ts'] + sleeps[1]['dur'] and sleeps[1]['ts'] < sleeps[0]['ts'] + sleeps[0]['dur']:
+        assert sleeps[0]['tid'] != sleeps[1]['tid']
+    assert all(process_names[event['pid']].endswith(' queue wait')
+               for event in events if event['ph'] == 'X' and event['cat'] == 'queue wait')
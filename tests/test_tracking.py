@@ -0,0 +1,73 @@
+import logging
+from concurrent.futures import Future
+
+from parsl.dataflow.futures import AppFuture
+
+from operon._util.tracking import AppStateTracker, watch_app_future, attempt_failed
+
+
+def test_watch_app_future_launches_and_retries():
+    events = list()
+    app_future = AppFuture(None, tid=0)
+    watch_app_future(
+        app_future,
+        on_launch=lambda fut: events.append('launch'),
+        on_done=lambda fut, exec_fut: events.append('failed' if attempt_failed(exec_fut) else 'done')
+    )
+
+    # Nothing happens until Parsl launches the app
+    assert events == list()
+
+    # A failed attempt that Parsl retries, by giving the app a new parent, isn't reported as done
+    first_attempt, second_attempt = Future(), Future()
+    app_future.update_parent(first_attempt)
+    app_future.update_parent(second_attempt)
+    first_attempt.set_exception(RuntimeError('retried'))
+    assert events == ['launch', 'launch']
+
+    second_attempt.set_result(0)
+    assert events == ['launch', 'launch', 'done']
+
+
+def test_watch_app_future_already_launched():
+    events = list()
+    exec_future = Future()
+    exec_future.set_exception(RuntimeError('failed'))
+    watch_app_future(
+        AppFuture(exec_future, tid=0),
+        on_launch=lambda fut: events.append('launch'),
+        on_done=lambda fut, exec_fut: events.append('failed' if attempt_failed(exec_fut) else 'done')
+    )
+    assert events == ['launch', 'failed']
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = list()
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+def test_app_state_tracker():
+    app_futures = [('app_{}'.format(i), AppFuture(None, tid=i)) for i in range(3)]
+    tracker = AppStateTracker(app_futures)
+    logger, handler = logging.getLogger('operon.main'), ListHandler()
+    logger.setLevel(logging.DEBUG)
+    logger.addHandler(handler)
+    try:
+        tracker.start()
+        exec_futures = [Future() for _ in app_futures]
+        for (_, app_future), exec_future in zip(app_futures, exec_futures):
+            app_future.update_parent(exec_future)
+        exec_futures[0].set_result(0)
+        exec_futures[1].set_exception(RuntimeError('failed'))
+    finally:
+        logger.removeHandler(handler)
+
+    assert tracker.state == {'app_0': 'completed', 'app_1': 'failed', 'app_2': 'running'}
+    assert tracker.counts['running'] == 1 and tracker.counts['pending'] == 0
+    messages = handler.messages
+    assert messages.index('app_0 staged to run') < messages.index('app_0 finished running')
+    assert messages[-1] == 'Staged or running: app_2'